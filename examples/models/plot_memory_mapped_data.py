@@ -0,0 +1,72 @@
+"""
+===================================
+Fitting on memory-mapped .npy files
+===================================
+
+Data stored as .npy files can be loaded with `np.load(..., mmap_mode="r")`,
+which maps the file into memory without reading it. A GAM fit on such data
+stores a reference to it, and with `chunk_size` the model matrix is
+evaluated on a few rows at a time. With `memmap_dir` the model matrix is
+evaluated once and written to a temporary file, which is faster when the
+solver needs many passes over the data.
+
+We compare the peak memory allocated during fitting. Pages of a memory-mapped
+file count towards the resident set size (RSS) when they are read, but they
+are backed by the file and the operating system drops them when memory is
+needed. We therefore measure the memory allocated by Python and NumPy with
+`tracemalloc`, which excludes the mapped files.
+
+"""
+
+import tempfile
+import tracemalloc
+
+import matplotlib.pyplot as plt
+import numpy as np
+from generalized_additive_models import GAM, Spline
+
+rng = np.random.default_rng(42)
+directory = tempfile.mkdtemp()
+terms = sum(Spline(feature, num_splines=20) for feature in range(3))
+
+# Write data sets of increasing size to disk
+sizes = [25_000, 50_000, 100_000, 200_000]
+settings = {
+    "In memory": dict(),
+    "Memory-mapped, chunked": dict(chunk_size=10_000),
+    "Memory-mapped, chunked and spilled": dict(chunk_size=10_000, memmap_dir=directory),
+}
+results = {label: [] for label in settings}
+for num_samples in sizes:
+    X = rng.uniform(size=(num_samples, 3))
+    y = np.sin(6 * X[:, 0]) + X[:, 1] + rng.normal(size=num_samples, scale=0.1)
+    np.save(f"{directory}/X.npy", X)
+    np.save(f"{directory}/y.npy", y)
+    del X, y
+
+    for label, params in settings.items():
+        mmap_mode = "r" if params else None
+        X = np.load(f"{directory}/X.npy", mmap_mode=mmap_mode)
+        y = np.load(f"{directory}/y.npy", mmap_mode=mmap_mode)
+
+        tracemalloc.start()
+        gam = GAM(terms, **params).fit(X, y)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[label].append(peak / 1e6)
+        print(f"{label} (n={num_samples}): {peak / 1e6:.0f} MB")
+        del gam, X, y
+
+# Create figure
+fig, ax = plt.subplots(1, 1, figsize=(6, 3))
+ax.set_title("Peak memory allocated during fitting")
+for label, peaks in results.items():
+    ax.plot(sizes, peaks, "-o", label=label)
+
+ax.grid(True, ls="--", alpha=0.33)
+ax.set_xlabel("Number of samples")
+ax.set_ylabel("Peak memory [MB]")
+ax.legend()
+fig.tight_layout()
+plt.show()
@@ -54,16 +54,53 @@ https://link.springer.com/article/10.1007/s11222-013-9448-7
 
 """
 
-import importlib.metadata
+import importlib
 import warnings
 
-from generalized_additive_models.distributions import Bernoulli, Binomial, Exponential, Gamma, InvGauss, Normal, Poisson
-from generalized_additive_models.gam import GAM, ExpectileGAM
-from generalized_additive_models.links import Identity, Log, Logit, Softplus
-from generalized_additive_models.terms import Categorical, Intercept, Linear, Spline, Tensor, TermList
-
 __name__ = "generalized-additive-models"
-__version__ = importlib.metadata.version(__name__)
+
+# Public names are imported from their submodules on first access (PEP 562),
+# so that `import generalized_additive_models` does not import sklearn, scipy
+# and pandas. Only submodules that are used are loaded.
+_LAZY_ATTRIBUTES = {
+    # Models
+    "GAM": "generalized_additive_models.gam",
+    "ExpectileGAM": "generalized_additive_models.gam",
+    # Links
+    "Identity": "generalized_additive_models.links",
+    "Log": "generalized_additive_models.links",
+    "Logit": "generalized_additive_models.links",
+    "Softplus": "generalized_additive_models.links",
+    # Distributions
+    "Normal": "generalized_additive_models.distributions",
+    "Poisson": "generalized_additive_models.distributions",
+    "Binomial": "generalized_additive_models.distributions",
+    "Gamma": "generalized_additive_models.distributions",
+    "InvGauss": "generalized_additive_models.distributions",
+    "Exponential": "generalized_additive_models.distributions",
+    "Bernoulli": "generalized_additive_models.distributions",
+    # Terms
+    "Intercept": "generalized_additive_models.terms",
+    "Categorical": "generalized_additive_models.terms",
+    "Linear": "generalized_additive_models.terms",
+    "Spline": "generalized_additive_models.terms",
+    "Tensor": "generalized_additive_models.terms",
+    "TermList": "generalized_additive_models.terms",
+}
+
+_LAZY_SUBMODULES = [
+    "distributions",
+    "gam",
+    "inspection",
+    "links",
+    "optimizers",
+    "penalties",
+    "persistence",
+    "scorer",
+    "splinetransformer",
+    "terms",
+    "utils",
+]
 
 __all__ = [
     # Models
@@ -92,10 +129,35 @@ __all__ = [
 ]
 
 
-message = f"""\nThank you for using {__name__}, version {__version__}.
+def _warn_unstable():
+    message = f"""\nThank you for using {__name__}, version {__getattr__("__version__")}.
 Until version 1.0.0 is released, the package and API should be considered unstable.
 You are welcome to use the package. Report bugs and join the discussion on GitHub:
 https://github.com/tommyod/generalized-additive-models"""
 
+    warnings.warn(message, stacklevel=3)
+
+
+def __getattr__(name):
+    if name == "__version__":
+        # importlib.metadata takes longer to import than the rest of the package
+        from importlib import metadata
+
+        value = metadata.version(__name__)
+    elif name in _LAZY_ATTRIBUTES:
+        # Warn once, when the first model, link, distribution or term is used
+        if not any(attribute in globals() for attribute in _LAZY_ATTRIBUTES):
+            _warn_unstable()
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    elif name in _LAZY_SUBMODULES:
+        value = importlib.import_module(f"generalized_additive_models.{name}")
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    # Cache the value, so that __getattr__ is only called once per name
+    globals()[name] = value
+    return value
+
 
-warnings.warn(message)
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | set(_LAZY_SUBMODULES) | {"__version__"})
@@ -8,24 +8,26 @@ Created on Sun Feb  5 12:05:41 2023
 
 import copy
 import functools
+import os
 import sys
 import warnings
 from numbers import Integral, Real
 
 import numpy as np
-import tabulate
 from sklearn.base import BaseEstimator, clone
 from sklearn.exceptions import ConvergenceWarning
-from sklearn.utils import check_consistent_length, check_scalar, column_or_1d
+from sklearn.utils import Bunch, check_consistent_length, check_scalar, column_or_1d
 from sklearn.utils._param_validation import Hidden, Interval, StrOptions
 
 # https://github.com/scikit-learn/scikit-learn/blob/8c9c1f27b7e21201cfffb118934999025fd50cca/sklearn/utils/validation.py#L1870
 from sklearn.utils.validation import _check_sample_weight, check_is_fitted
 
-from generalized_additive_models.distributions import DISTRIBUTIONS, Distribution
-from generalized_additive_models.links import LINKS, Link
+from generalized_additive_models.distributions import DISTRIBUTIONS, Binomial, Distribution
+from generalized_additive_models.links import LINKS, Link, Logit
 from generalized_additive_models.optimizers import LBFGSB, PIRLS
+from generalized_additive_models.persistence import export_scorer, load_model, save_model
 from generalized_additive_models.terms import Categorical, Intercept, Linear, Spline, Tensor, Term, TermList
+from generalized_additive_models.utils import ChunkedModelMatrix, phi_fletcher
 
 
 class GAM(BaseEstimator):
@@ -66,6 +68,66 @@ class GAM(BaseEstimator):
     verbose : int, optional
         Verbosity level. The higher the number, the more info is printed.
         The default is 0.
+    sparse : bool, optional
+        Whether to build the model matrix as a scipy.sparse CSR array. Spline
+        bases have local support, so most entries in the model matrix are
+        zero. The sparse model matrix is not centered, and the centering is
+        folded into the Intercept, which must be present in the model.
+        The default is False.
+    discrete : bool, optional
+        Whether to discretize the features before fitting. Every feature is
+        mapped onto at most `max_bins` values, and the terms are evaluated on
+        the unique values only. The model matrix is never formed, and each
+        solver iteration costs O(num_samples) index arithmetic. Useful when
+        there are many samples, and features have few unique values.
+        Predictions use the features without discretization.
+        The default is False.
+    max_bins : int, optional
+        The maximal number of unique values per feature if `discrete=True`.
+        Features with more unique values are binned.
+        The default is 256.
+    compress : bool, optional
+        Whether to aggregate samples that are equal in every feature used by
+        the terms before fitting. Each unique row is fitted once, with the
+        summed sample weight and the weighted mean of `y`. For exponential
+        family distributions this gives the same coefficients as fitting all
+        samples. Useful when few covariate patterns are repeated many times,
+        e.g. Bernoulli or Poisson data. The terms are fit on all samples.
+        The default is False.
+    chunk_size : int or None, optional
+        If an integer, the model matrix is never formed. Every pass of the
+        solver evaluates the terms on `chunk_size` rows at a time, and
+        accumulates products and the Gram matrix over the chunks. The memory
+        used by the model matrix is O(chunk_size * num_coefficients), at the
+        cost of evaluating the terms in every pass. Useful when the model
+        matrix does not fit in memory. If None, the model matrix is formed.
+        The default is None.
+    memmap_dir : str or None, optional
+        If a directory, and `chunk_size` is set, the model matrix is evaluated
+        once and written to a temporary memory-mapped file in the directory.
+        Every pass of the solver then reads chunks from the file instead of
+        evaluating the terms. The file is removed when the GAM is garbage
+        collected. Memory-mapped inputs, e.g. from
+        `np.load(..., mmap_mode="r")`, are never copied into memory.
+        The default is None.
+    store_training_data : bool, optional
+        Whether to keep references to the training data in `X_`, `y_`,
+        `sample_weight_` and the model matrix in `model_matrix_` after
+        fitting. Predictions only need the terms and `coef_`, so with False
+        the fitted GAM is small in memory and when pickled. The inspection
+        functions then need data passed explicitly, or use the ranges and
+        quantiles of the features in `feature_summary_`.
+        The default is True.
+    compute_statistics : bool, optional
+        Whether to compute the statistics of the fit in `results_`: the
+        effective degrees of freedom, the scale, the covariance of the
+        coefficients and the GCV score. They are computed from the Fisher
+        information when first looked up, and with a distribution with an
+        unknown scale, such as "normal", when fitting, since the scale is
+        part of the fitted distribution. With False, fitting is faster, but
+        `summary()`, confidence intervals and the unknown scale are not
+        available.
+        The default is True.
 
     Returns
     -------
@@ -109,6 +171,14 @@ class GAM(BaseEstimator):
         "max_iter": [Interval(Integral, 1, None, closed="left")],
         "tol": [Interval(Real, 0.0, None, closed="neither")],
         "verbose": [Integral, "boolean"],
+        "sparse": ["boolean"],
+        "discrete": ["boolean"],
+        "max_bins": [Interval(Integral, 2, None, closed="left")],
+        "compress": ["boolean"],
+        "chunk_size": [Interval(Integral, 1, None, closed="left"), None],
+        "memmap_dir": [str, os.PathLike, None],
+        "store_training_data": ["boolean"],
+        "compute_statistics": ["boolean"],
     }
 
     def __init__(
@@ -122,6 +192,14 @@ class GAM(BaseEstimator):
         max_iter=100,
         tol=0.0001,
         verbose=0,
+        sparse=False,
+        discrete=False,
+        max_bins=256,
+        compress=False,
+        chunk_size=None,
+        memmap_dir=None,
+        store_training_data=True,
+        compute_statistics=True,
     ):
         self.terms = terms
         self.distribution = distribution
@@ -131,6 +209,14 @@ class GAM(BaseEstimator):
         self.max_iter = max_iter
         self.tol = tol
         self.verbose = verbose
+        self.sparse = sparse
+        self.discrete = discrete
+        self.max_bins = max_bins
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.memmap_dir = memmap_dir
+        self.store_training_data = store_training_data
+        self.compute_statistics = compute_statistics
 
     def _validate_params(self, X):
         super()._validate_params()
@@ -150,6 +236,13 @@ class GAM(BaseEstimator):
         else:
             raise ValueError("Unknown solver.")
 
+        if self.sparse and self.discrete:
+            raise ValueError("Parameters `sparse` and `discrete` cannot both be True.")
+        if (self.sparse or self.discrete) and self.chunk_size is not None:
+            raise ValueError("Parameter `chunk_size` cannot be used with `sparse=True` or `discrete=True`.")
+        if self.memmap_dir is not None and self.chunk_size is None:
+            raise ValueError("Parameter `memmap_dir` requires `chunk_size` to be set.")
+
         self.terms = TermList(self.terms)
 
         # Auto model
@@ -215,38 +308,94 @@ class GAM(BaseEstimator):
         sample_weight = _check_sample_weight(sample_weight, X, ensure_non_negative=True)
         sample_weight = column_or_1d(sample_weight)
 
-        self.model_matrix_ = self.terms.fit_transform(X)
-
-        self.X_ = X.copy()  # Store a copy used for partial effects
-        self.y_ = y.copy()
-        self.sample_weight_ = sample_weight.copy()
-
-        if sample_weight is None:
-            sample_weight = np.ones_like(y, dtype=float)
+        X_fit, y_fit, sample_weight_fit, distribution, link = X, y, sample_weight, self._distribution, self._link
+        if self.compress or self.discrete or (self.chunk_size is not None):
+            # The terms are fit on all samples, also if the model is fit on unique rows
+            self.terms.fit(X)
+            if self.compress:
+                X_fit, y_fit, sample_weight_fit, distribution, link = self._compress(X, y, sample_weight)
+
+            if self.discrete:
+                self.model_matrix_ = self.terms.transform_discrete(X_fit, max_bins=self.max_bins)
+            elif self.chunk_size is not None:
+                self.model_matrix_ = ChunkedModelMatrix(X_fit, self.terms, chunk_size=self.chunk_size)
+                if self.memmap_dir is not None:
+                    self.model_matrix_.spill(self.memmap_dir)
+            else:
+                self.model_matrix_ = self.terms.transform(X_fit, sparse=self.sparse)
+        else:
+            self.model_matrix_ = self.terms.fit_transform(X, sparse=self.sparse)
+        self._compiled_terms = None  # Compiled at predict time, see `_compile_terms()`
+
+        # The sparse model matrix is not centered. Centering only shifts the
+        # linear predictor by a constant, which the Intercept absorbs.
+        if self.sparse and np.any(self.terms._column_offsets() != 0) and (Intercept() not in self.terms):
+            raise ValueError("An Intercept() is required with `sparse=True`, since it absorbs the centering.")
+
+        # Store a copy used for partial effects. Memory-mapped data is read only
+        # from disk, and is stored without copying it into memory. A small
+        # summary of the features is always stored, for use without the data.
+        self.feature_summary_ = self._summarize_features(X)
+        if self.store_training_data:
+            self.X_ = X if isinstance(X, np.memmap) else X.copy()
+            self.y_ = y if isinstance(y, np.memmap) else y.copy()
+            self.sample_weight_ = sample_weight.copy()
+        else:
+            for attribute in ("X_", "y_", "sample_weight_"):
+                self.__dict__.pop(attribute, None)
 
         optimizer = self._solver(
             X=self.model_matrix_,
-            D=self.terms.penalty_matrix(),
-            y=y,
-            link=self._link,
-            distribution=self._distribution,
+            D=self.terms.penalty_matrix(sparse=True),
+            y=y_fit,
+            link=link,
+            distribution=distribution,
             bounds=(self.terms._lower_bound, self.terms._upper_bound),
-            get_sample_weight=functools.partial(self._get_sample_weight, sample_weight=sample_weight),
+            get_sample_weight=functools.partial(self._get_sample_weight, sample_weight=sample_weight_fit),
             max_iter=self.max_iter,
             tol=self.tol,
             verbose=self.verbose,
+            compute_statistics=self.compute_statistics,
         )
 
-        # Copy over solver information
+        # Take over solver information. The statistics in the results are
+        # computed when first looked up, see `Optimizer.set_statistics()`
         self.coef_ = optimizer.solve().copy()
-        self.results_ = copy.deepcopy(optimizer.results_)
-        self.results_.pseudo_r2 = self.score(X, y, sample_weight=sample_weight)
+        self.results_ = optimizer.results_
+        if self.sparse:
+            self._fold_centering_into_intercept()
+        mu = self.predict(X)
+        self.results_.pseudo_r2, self.results_.null_deviance = self._deviance_explained(
+            X=X, y=y, mu=mu, sample_weight=sample_weight
+        )
+
+        # The estimated scale and the GCV score are sums over samples, not
+        # over unique rows, so they are computed on all samples
+        if self.compress and self.compute_statistics:
+            if self._distribution.scale is None:
+                scale = phi_fletcher(y, mu, self._distribution, self.results_.edof, sample_weight=sample_weight)
+                identifiable = np.ix_(*[optimizer.column_remover.nonzero_coefs] * 2)
+                self.results_.covariance[identifiable] *= scale / self.results_.scale
+                self.results_.scale = scale
+
+            num_samples, edof = len(y), self.results_.edof
+            gcv = np.sum((self._link.link(mu) - y) ** 2) * num_samples / (num_samples - edof) ** 2
+            self.results_.generalized_cross_validation_score = gcv
 
         # Update distribution scale if set to None
-        self._distribution.scale = self.results_.scale if self._distribution.scale is None else self._distribution.scale
-        assert self._distribution.scale is not None
+        if self._distribution.scale is None and self.compute_statistics:
+            self._distribution.scale = self.results_.scale
+
+        self._assign_coefficients_to_terms()
 
-        # Assign coefficients to terms
+        if not self.store_training_data:
+            del self.model_matrix_
+
+        return self
+
+    def _assign_coefficients_to_terms(self):
+        """Set the coefficients of every term. The edof and the covariance of
+        a term are taken from `results_` when first looked up, see `Term`."""
         coef_idx = 0
         for term in self.terms:
             term.coef_ = self.coef_[coef_idx : coef_idx + term.num_coefficients]
@@ -256,16 +405,225 @@ class GAM(BaseEstimator):
             assert np.all(term.coef_ >= term._lower_bound)
 
             term.coef_idx_ = np.arange(coef_idx, coef_idx + term.num_coefficients)
-            term.edof_ = self.results_.edof_per_coef[term.coef_idx_]
-
-            mask = np.ix_(term.coef_idx_, term.coef_idx_)
-            term.coef_covar_ = self.results_.covariance[mask]
+            term._results = self.results_
+            for attribute in ("edof_", "coef_covar_"):
+                term.__dict__.pop(attribute, None)
 
             coef_idx += term.num_coefficients
             assert len(term.coef_) == term.num_coefficients
         assert sum(len(term.coef_) for term in self.terms) == len(self.coef_)
 
-        return self
+    def save(self, path, covariance=True):
+        """Save the fitted model to a directory.
+
+        The model is saved as a JSON file with the parameters of the GAM and
+        the terms, and one .npy file per array, e.g. knots, coefficients and
+        centering constants. Training data and the iteration history of the
+        solver are not saved. Load the model with `GAM.load()`.
+
+        Parameters
+        ----------
+        path : str or os.PathLike
+            A directory. It is created if it does not exist.
+        covariance : bool, optional
+            Whether to save the covariance matrix of the coefficients, which
+            has size num_coefficients**2 and is needed for credible intervals
+            in partial effects, but not for predictions.
+            The default is True.
+
+        Returns
+        -------
+        None.
+
+        Examples
+        --------
+        >>> import tempfile
+        >>> rng = np.random.default_rng(32)
+        >>> X = rng.normal(size=(100, 1))
+        >>> y = np.sin(X).ravel()
+        >>> gam = GAM(Spline(0)).fit(X, y)
+        >>> path = tempfile.mkdtemp()
+        >>> gam.save(path)
+        >>> loaded_gam = GAM.load(path)
+        >>> bool(np.allclose(gam.predict(X), loaded_gam.predict(X)))
+        True
+        """
+        check_is_fitted(self, attributes=["coef_"])
+        save_model(self, path, covariance=covariance)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a model saved with `save()`.
+
+        Parameters
+        ----------
+        path : str or os.PathLike
+            The directory the model was saved to.
+        mmap : bool, optional
+            Whether to memory-map the arrays instead of reading them. The
+            arrays are then read only when they are used, and shared between
+            processes that load the same model. The arrays are read-only.
+            The default is True.
+
+        Returns
+        -------
+        GAM
+            The fitted model.
+        """
+        estimator, params, attributes = load_model(path, mmap=mmap)
+        if estimator != cls.__name__:
+            raise ValueError(f"The model in {path} has type {estimator}. Load it with {estimator}.load()")
+
+        gam = cls(terms=attributes.pop("terms"), **params)
+        for name, value in attributes.items():
+            setattr(gam, name, value)
+        gam._compiled_terms = None
+        gam._assign_coefficients_to_terms()
+        return gam
+
+    def _summarize_features(self, X, num_quantiles=101):
+        """Summarize the numerical features used by Linear and Spline terms.
+
+        Returns a dict mapping each feature index to a Bunch with the minimum,
+        the maximum and `num_quantiles` equally spaced quantiles, used for
+        plotting grids and rugs when the training data is not stored.
+
+        Examples
+        --------
+        >>> X = np.arange(20, dtype=float).reshape(-1, 2)
+        >>> gam = GAM(Spline(0) + Linear(1)).fit(X, X[:, 0])
+        >>> summary = gam._summarize_features(X, num_quantiles=3)
+        >>> summary[1]
+        {'min': 1.0, 'max': 19.0, 'quantiles': array([ 1., 10., 19.])}
+        """
+        terms = [term for term in self.terms if isinstance(term, (Linear, Spline))]
+        tensors = [term for term in self.terms if isinstance(term, Tensor)]
+        terms.extend(spline for tensor in tensors for spline in tensor if isinstance(spline, Spline))
+
+        summary = dict()
+        for term in terms:
+            if term.feature_ in summary:
+                continue
+            column = term._get_column(X, selector="feature").ravel().astype(float)
+            summary[term.feature_] = Bunch(
+                min=float(np.min(column)),
+                max=float(np.max(column)),
+                quantiles=np.quantile(column, np.linspace(0, 1, num=num_quantiles)),
+            )
+        return summary
+
+    def export_scorer(self, path=None):
+        """Export the fitted model to a scorer that only depends on NumPy.
+
+        The scorer stores every spline as polynomials between the knots, with
+        the coefficients of the GAM folded in, the centering constants, the
+        category maps and the inverse link. Its `predict()` matches the
+        `predict()` of the GAM up to floating point errors.
+
+        Parameters
+        ----------
+        path : str or os.PathLike, optional
+            If given, the scorer is saved to this directory, together with a
+            copy of the module `generalized_additive_models/scorer.py`. The
+            directory can be used without installing this package, see the
+            module docstring of `generalized_additive_models.scorer`.
+            The default is None.
+
+        Returns
+        -------
+        Scorer
+            A scorer with a `predict()` method.
+
+        Examples
+        --------
+        >>> rng = np.random.default_rng(32)
+        >>> X = rng.normal(size=(100, 2))
+        >>> y = np.sin(X[:, 0]) + X[:, 1]
+        >>> gam = GAM(Spline(0, constraint="increasing") + Linear(1)).fit(X, y)
+        >>> scorer = gam.export_scorer()
+        >>> float(np.max(np.abs(scorer.predict(X) - gam.predict(X)))) < 1e-12
+        True
+        """
+        check_is_fitted(self, attributes=["coef_"])
+        scorer = export_scorer(self)
+        if path is not None:
+            scorer.save(path)
+        return scorer
+
+    def _compress(self, X, y, sample_weight):
+        """Aggregate samples that are equal in every column used by the terms.
+
+        Returns the unique rows of X, the weighted means of y, the summed sample
+        weights, and the distribution and link to fit the unique rows with.
+        """
+        num_samples = X.shape[0]
+        columns = sorted(set().union(*self.terms._term_columns(X)))
+
+        def get_column(j):
+            return X.iloc[:, j].to_numpy() if hasattr(X, "iloc") else X[:, j]
+
+        # Integer codes for the values in each column, then unique rows of codes
+        codes = [np.unique(get_column(j), return_inverse=True)[1].ravel() for j in columns]
+
+        # Samples with a different number of binomial trials or link bounds are not equal
+        trials = getattr(self._distribution, "trials", None)
+        bounds = {name: getattr(self._link, name, None) for name in ("low", "high")}
+        bounds = {name: value for (name, value) in bounds.items() if isinstance(value, np.ndarray)}
+        for values in [trials, *bounds.values()]:
+            if isinstance(values, np.ndarray):
+                codes.append(np.unique(values, return_inverse=True)[1].ravel())
+
+        if codes:
+            _, rows, index = np.unique(np.column_stack(codes), axis=0, return_index=True, return_inverse=True)
+        else:
+            rows, index = np.array([0]), np.zeros(num_samples, dtype=np.intp)
+        index = index.ravel()
+
+        # Sum of weights and weighted mean of y. Rows with zero total weight do
+        # not affect the fit, and use the unweighted mean of y
+        sample_weight_sum = np.bincount(index, weights=sample_weight)
+        y_mean = np.bincount(index, weights=y) / np.bincount(index)
+        y_mean = np.divide(
+            np.bincount(index, weights=sample_weight * y),
+            sample_weight_sum,
+            out=y_mean,
+            where=sample_weight_sum > 0,
+        )
+
+        distribution = self._distribution
+        if isinstance(trials, np.ndarray):
+            distribution = copy.copy(distribution)
+            distribution.trials = trials[rows]
+
+        link = self._link
+        if bounds:
+            # Create a new link, since the domain is set from the bounds in __init__
+            params = link.get_params() | {name: values[rows] for (name, values) in bounds.items()}
+            link = type(link)(**params)
+
+        X_unique = X.iloc[rows] if hasattr(X, "iloc") else X[rows]
+        return X_unique, y_mean, sample_weight_sum, distribution, link
+
+    def _fold_centering_into_intercept(self):
+        """Map coefficients fitted on the un-centered sparse model matrix to
+        coefficients for the centered terms.
+
+        With offsets m, the centered model matrix is X - 1 m^T, so
+        X @ beta = (X - 1 m^T) @ beta + m^T beta. The constant m^T beta is
+        added to the Intercept coefficient. This is a linear map T of the
+        coefficients, and the covariance is mapped to T @ covariance @ T.T.
+        """
+        offsets = self.terms._column_offsets()
+        intercept_position = self.terms.index(Intercept())
+        intercept_idx = sum(term.num_coefficients for term in self.terms[:intercept_position])
+
+        T = np.eye(len(self.coef_))
+        T[intercept_idx, :] += offsets
+
+        self.coef_ = T @ self.coef_
+        self.results_.iters_coef = [T @ coef for coef in self.results_.iters_coef]
+        if "covariance" in self.results_:
+            self.results_.covariance = np.linalg.multi_dot([T, self.results_.covariance, T.T])
 
     def sample(self, mu, size=None, random_state=None):
         """Sample from the posterior predictive distribution.
@@ -342,9 +700,35 @@ class GAM(BaseEstimator):
         """
         check_is_fitted(self, attributes=["coef_"])
 
-        model_matrix = self.terms.transform(X)
+        if self.sparse:
+            model_matrix = self.terms.transform(X, sparse=True)
+            offset = self.terms._column_offsets() @ self.coef_
+            return self._link.inverse_link(model_matrix @ self.coef_ - offset)
+
+        if self.chunk_size is not None:
+            model_matrix = ChunkedModelMatrix(X, self.terms, chunk_size=self.chunk_size)
+            return self._link.inverse_link(model_matrix @ self.coef_)
+
+        model_matrix = self._compile_terms(X).transform(X)
         return self._link.inverse_link(model_matrix @ self.coef_)
 
+    def _compile_terms(self, X):
+        """Return the fitted terms compiled for the columns of `X`.
+
+        The compiled terms are cached, and only compiled again if the columns
+        change, so that repeated calls to `predict()` skip parameter validation
+        and feature name lookups."""
+        compiled_terms = getattr(self, "_compiled_terms", None)
+        if compiled_terms is None or not compiled_terms.matches(X):
+            compiled_terms = self._compiled_terms = self.terms.compile(X)
+        return compiled_terms
+
+    def __getstate__(self):
+        # The compiled terms hold closures, which cannot be pickled
+        state = super().__getstate__()
+        state.pop("_compiled_terms", None)
+        return state
+
     def score(self, X, y, sample_weight=None):
         """Proportion deviance explained (pseudo :math:`r^2`).
 
@@ -378,28 +762,52 @@ class GAM(BaseEstimator):
         sample_weight = _check_sample_weight(sample_weight, X, ensure_non_negative=True)
         sample_weight = column_or_1d(sample_weight)
 
-        # Special case for the null gam. Without this line of code, a cycle of
-        # fit() -> score() -> fit() will occur.
-        if self.terms == TermList([Intercept()]):
-            return 0
-
+        mu = self.predict(X)
+        pseudo_r2, _ = self._deviance_explained(X=X, y=y, mu=mu, sample_weight=sample_weight)
+        return pseudo_r2
+
+    def _null_prediction(self, X, y, sample_weight):
+        """Return the predictions of the intercept-only (null) model.
+
+        When no parameter of the link or the distribution varies between
+        observations, the score equations reduce to sum_i w_i (y_i - mu) = 0,
+        so the null model predicts the weighted mean of `y`. With binomial
+        `trials` n_i per observation and the logit link with `high` equal to
+        the trials, mu_i = n_i p and sum_i w_i (y_i - n_i p) = 0 gives p.
+        Other models with parameters per observation are fitted."""
+        trials = getattr(self._distribution, "trials", None)
+        parameters = (trials, getattr(self._link, "low", None), getattr(self._link, "high", None))
+        if not any(isinstance(parameter, np.ndarray) for parameter in parameters):
+            return np.full_like(y, np.average(y, weights=sample_weight), dtype=float)
+
+        if (
+            isinstance(self._distribution, Binomial)
+            and isinstance(self._link, Logit)
+            and np.all(self._link.low == 0)
+            and np.all(self._link.high == trials)
+        ):
+            return trials * np.sum(sample_weight * y) / np.sum(sample_weight * trials)
+
+        null_gam = clone(self).set_params(terms=Intercept(), verbose=0)
+        return null_gam.fit(X, y, sample_weight=sample_weight).predict(X)
+
+    def _deviance_explained(self, *, X, y, mu, sample_weight):
+        """Return the pseudo r^2 of the predictions `mu`, and the (unscaled) null deviance."""
         # Compute pseudo r2
         # https://en.wikipedia.org/wiki/Pseudo-R-squared#R2L_by_Cohen
         # Page 128 in Wood, 2nd edition
-        mu = self.predict(X)
         sample_weight = self._get_sample_weight(y=y, mu=mu, sample_weight=sample_weight)
 
-        # Compute the null predictions
-        null_gam = clone(self)
-        null_preds = null_gam.set_params(terms=Intercept(), verbose=0).fit(X, y, sample_weight=sample_weight).predict(X)
+        # Special case for the null gam, which explains no deviance
+        if self.terms == TermList([Intercept()]):
+            null_deviance = self._distribution.deviance(y=y, mu=mu, sample_weight=sample_weight, scaled=False).mean()
+            return 0, null_deviance
 
-        # null_preds2 = np.average(y, weights=sample_weight) * np.ones_like(y)
-        # assert np.allclose(null_preds2, null_preds)
+        null_mu = self._null_prediction(X, y, sample_weight)
+        null_deviance = self._distribution.deviance(y=y, mu=null_mu, sample_weight=sample_weight, scaled=False).mean()
 
-        null_deviance = self._distribution.deviance(y=y, mu=null_preds, sample_weight=sample_weight).mean()
-        fitted_deviance = self._distribution.deviance(y=y, mu=mu, sample_weight=sample_weight).mean()
-        # assert fitted_deviance <= null_deviance
-        return (null_deviance - fitted_deviance) / null_deviance
+        fitted_deviance = self._distribution.deviance(y=y, mu=mu, sample_weight=sample_weight, scaled=False).mean()
+        return (null_deviance - fitted_deviance) / null_deviance, null_deviance
 
     def summary(self, file=None):
         """Print a model summary.
@@ -415,7 +823,11 @@ class GAM(BaseEstimator):
         None.
 
         """
+        import tabulate
+
         check_is_fitted(self, attributes=["coef_"])
+        if "edof" not in self.results_:
+            raise ValueError("The summary needs the statistics of the fit. Fit with `compute_statistics=True`.")
 
         if file is None:
             file = sys.stdout
@@ -581,6 +993,9 @@ class ExpectileGAM(GAM):
     For more information, see:
         
         - https://freakonometrics.hypotheses.org/files/2017/05/erasmus-1.pdf
+
+    Unlike the GAM, there is no `compress` parameter, since the asymmetric
+    weights depend on the target value of each sample.
         
     Parameters
     ----------
@@ -609,6 +1024,29 @@ class ExpectileGAM(GAM):
     verbose : int, optional
         Verbosity level. The higher the number, the more info is printed. 
         The default is 0.
+    sparse : bool, optional
+        Whether to build the model matrix as a scipy.sparse CSR array.
+        The default is False.
+    discrete : bool, optional
+        Whether to discretize the features before fitting.
+        The default is False.
+    max_bins : int, optional
+        The maximal number of unique values per feature if `discrete=True`.
+        The default is 256.
+    chunk_size : int or None, optional
+        If an integer, the terms are evaluated on `chunk_size` rows at a
+        time, and the model matrix is never formed.
+        The default is None.
+    memmap_dir : str or None, optional
+        If a directory, and `chunk_size` is set, the model matrix is written
+        once to a temporary memory-mapped file in the directory.
+        The default is None.
+    store_training_data : bool, optional
+        Whether to keep the training data and the model matrix after fitting.
+        The default is True.
+    compute_statistics : bool, optional
+        Whether to compute the statistics of the fit in `results_`.
+        The default is True.
 
     Returns
     -------
@@ -628,6 +1066,13 @@ class ExpectileGAM(GAM):
         "max_iter": [Interval(Integral, 1, None, closed="left")],
         "tol": [Interval(Real, 0.0, None, closed="neither")],
         "verbose": [Integral, "boolean"],
+        "sparse": ["boolean"],
+        "discrete": ["boolean"],
+        "max_bins": [Interval(Integral, 2, None, closed="left")],
+        "chunk_size": [Interval(Integral, 1, None, closed="left"), None],
+        "memmap_dir": [str, os.PathLike, None],
+        "store_training_data": ["boolean"],
+        "compute_statistics": ["boolean"],
     }
 
     def __init__(
@@ -640,6 +1085,13 @@ class ExpectileGAM(GAM):
         max_iter=100,
         tol=0.0001,
         verbose=-1,
+        sparse=False,
+        discrete=False,
+        max_bins=256,
+        chunk_size=None,
+        memmap_dir=None,
+        store_training_data=True,
+        compute_statistics=True,
     ):
         self.expectile = expectile
         super().__init__(
@@ -651,6 +1103,13 @@ class ExpectileGAM(GAM):
             max_iter=max_iter,
             tol=tol,
             verbose=verbose,
+            sparse=sparse,
+            discrete=discrete,
+            max_bins=max_bins,
+            chunk_size=chunk_size,
+            memmap_dir=memmap_dir,
+            store_training_data=store_training_data,
+            compute_statistics=compute_statistics,
         )
 
     def _validate_params(self, X):
@@ -667,6 +1126,20 @@ class ExpectileGAM(GAM):
 
         return sample_weight * asymmetric_weights
 
+    def _null_prediction(self, X, y, sample_weight):
+        """Return the expectile of `y`, the prediction of the intercept-only model.
+
+        The asymmetric weights only change when the expectile crosses a value
+        in `y`, so the fixed point iteration terminates after a few steps."""
+        mu = np.average(y, weights=sample_weight)
+        for _ in range(self.max_iter):
+            asymmetric_weights = self._get_sample_weight(y=y, mu=mu, sample_weight=sample_weight)
+            mu, mu_prev = np.average(y, weights=asymmetric_weights), mu
+            if mu == mu_prev:
+                break
+
+        return np.full_like(y, mu, dtype=float)
+
     def fit_quantile(self, X, y, quantile, max_iter=20, tol=0.01, sample_weight=None):
         """Find the `expectile` such that the empirical quantile matches `quantile`.
 
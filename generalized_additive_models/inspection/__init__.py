@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import importlib
 
-from generalized_additive_models.inspection.partial_effect import PartialEffectDisplay
-from generalized_additive_models.inspection.qq import QQDisplay
-from generalized_additive_models.inspection.residual_histogram import ResidualHistogramDisplay
-from generalized_additive_models.inspection.residual_scatter import ResidualScatterDisplay
+# The displays are imported on first access (PEP 562), and matplotlib is
+# imported when something is plotted
+_LAZY_ATTRIBUTES = {
+    "PartialEffectDisplay": "generalized_additive_models.inspection.partial_effect",
+    "QQDisplay": "generalized_additive_models.inspection.qq",
+    "ResidualHistogramDisplay": "generalized_additive_models.inspection.residual_histogram",
+    "ResidualScatterDisplay": "generalized_additive_models.inspection.residual_scatter",
+}
 
 __all__ = [
     "ResidualHistogramDisplay",
@@ -13,3 +18,16 @@ __all__ = [
     "ResidualScatterDisplay",
     "PartialEffectDisplay",
 ]
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
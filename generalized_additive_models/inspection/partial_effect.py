@@ -12,7 +12,6 @@ https://arxiv.org/pdf/1809.10632.pdf
 import copy
 from numbers import Real
 
-import matplotlib.pyplot as plt
 import numpy as np
 from sklearn.utils import Bunch, check_scalar
 from sklearn.utils.validation import check_is_fitted
@@ -22,7 +21,41 @@ from generalized_additive_models.terms import Categorical, Intercept, Linear, Sp
 from generalized_additive_models.utils import cartesian
 
 
-def generate_X_grid(gam, term, X, *, extrapolation=0.01, num=100, meshgrid=True):
+def _training_data(gam, X=None, y=None, sample_weight=None):
+    """Return data passed explicitly, or the training data stored in the GAM.
+
+    Examples
+    --------
+    >>> X = np.linspace(0, 1, num=10).reshape(-1, 1)
+    >>> gam = GAM(Spline(0), store_training_data=False).fit(X, X.ravel())
+    >>> X_, y_, sample_weight = _training_data(gam, X, X.ravel())
+    >>> sample_weight
+    array([1., 1., 1., 1., 1., 1., 1., 1., 1., 1.])
+    >>> _training_data(gam)
+    Traceback (most recent call last):
+      ...
+    ValueError: The GAM does not store training data, since `store_training_data=False`. Pass `X` and `y`.
+    """
+    if (X is None) != (y is None):
+        raise ValueError("Both `X` and `y` must be passed, or neither.")
+
+    if X is None:
+        if not hasattr(gam, "X_"):
+            raise ValueError(
+                "The GAM does not store training data, since `store_training_data=False`. Pass `X` and `y`."
+            )
+        return gam.X_, gam.y_, gam.sample_weight_
+
+    sample_weight = np.ones(len(y), dtype=float) if sample_weight is None else np.asarray(sample_weight)
+    return X, np.asarray(y), sample_weight
+
+
+def generate_X_grid(gam, term, X=None, *, extrapolation=0.01, num=100, meshgrid=True):
+    """Create a grid of values for the feature(s) used by a term.
+
+    If `X` is None, the feature ranges stored in `gam.feature_summary_` are
+    used, so the grid spans the training data also when it is not stored.
+    """
     if not isinstance(gam, GAM):
         raise TypeError(f"Parameter `gam` must be instance of GAM, found: {gam}")
 
@@ -36,9 +69,13 @@ def generate_X_grid(gam, term, X, *, extrapolation=0.01, num=100, meshgrid=True)
         return np.array([[1.0]])
 
     if isinstance(term, (Linear, Spline)):
-        X_data = term._get_column(X, selector="feature")
+        if X is None:
+            summary = gam.feature_summary_[term.feature_]
+            min_, max_ = summary.min, summary.max
+        else:
+            X_data = term._get_column(X, selector="feature")
+            min_, max_ = np.min(X_data), np.max(X_data)
 
-        min_, max_ = np.min(X_data), np.max(X_data)
         offset = (max_ - min_) * extrapolation
         return np.linspace(min_ - offset, max_ + offset, num=num).reshape(-1, 1)
 
@@ -52,7 +89,7 @@ def generate_X_grid(gam, term, X, *, extrapolation=0.01, num=100, meshgrid=True)
         return (cartesian(linspaces), np.meshgrid(*linspaces, indexing="ij"))
 
 
-def partial_effect(gam, term, standard_deviations=1.0, edges=None, linear_scale=True):
+def partial_effect(gam, term, standard_deviations=1.0, edges=None, linear_scale=True, *, X=None, y=None):
     """
 
     1 standard deviation  => 0.6827 coverage
@@ -74,6 +111,14 @@ def partial_effect(gam, term, standard_deviations=1.0, edges=None, linear_scale=
     standard_deviations : float, optional
         The number of standard deviations to cover in the credible interval.
         The default is 1.0.
+    X : np.ndarray or pd.DataFrame, optional
+        Data used for the observations and the partial residuals. If None,
+        the training data stored in the GAM is used. If the GAM was fit with
+        `store_training_data=False`, the stored quantiles of the feature are
+        returned as observations, and no partial residuals are computed.
+        The default is None.
+    y : np.ndarray, optional
+        Target values corresponding to `X`. The default is None.
 
     Returns
     -------
@@ -89,6 +134,13 @@ def partial_effect(gam, term, standard_deviations=1.0, edges=None, linear_scale=
     >>> gam = GAM(spline).fit(X, y)
     >>> results = partial_effect(gam, spline)
 
+    A GAM fit without storing the training data uses the stored quantiles:
+
+    >>> gam = GAM(spline, store_training_data=False).fit(X, y)
+    >>> results = partial_effect(gam, spline)
+    >>> results.x_obs.shape, results.y_partial_residuals
+    ((101,), None)
+
     Or loop through the model terms like so:
 
     >>> for term in gam.terms:
@@ -103,8 +155,8 @@ def partial_effect(gam, term, standard_deviations=1.0, edges=None, linear_scale=
     if not isinstance(gam, GAM):
         raise TypeError(f"Parameter `gam` must be instance of GAM, found: {gam}")
 
-    if not isinstance(term, (Spline, Linear)):
-        raise TypeError(f"Parameter `term` must be instance of Spline or Linear, found: {term}")
+    if not isinstance(term, Term):
+        raise TypeError(f"Parameter `term` must be instance of Term, found: {term}")
 
     check_is_fitted(gam, attributes=["coef_"])
     check_is_fitted(term)
@@ -122,19 +174,30 @@ def partial_effect(gam, term, standard_deviations=1.0, edges=None, linear_scale=
 
     # ================================ LOGIC  =================================
 
+    # Use explicitly passed data, the stored training data or the stored summary
+    has_data = (X is not None) or hasattr(gam, "X_")
+    if has_data:
+        X_data, y, _ = _training_data(gam, X, y)
+
     # Get data related to term and create a smooth grid
     term = copy.deepcopy(term)  # Copy so feature_ is not changed by term.transform() below
-    data = term._get_column(gam.X_, selector="feature")
-
-    X_original_transformed = term.transform(gam.X_)
+    if has_data:
+        data = term._get_column(X_data, selector="feature")
+        X_original_transformed = term.transform(X_data)
+    elif isinstance(term, Tensor):
+        data = np.column_stack([gam.feature_summary_[spline.feature_].quantiles for spline in term])
+    elif isinstance(term, (Linear, Spline)):
+        data = gam.feature_summary_[term.feature_].quantiles
+    else:
+        data = None
 
     meshgrid = None
     if isinstance(term, Tensor):
-        X_smooth, meshgrid = generate_X_grid(gam, term, gam.X_, extrapolation=0.01, num=100)
+        X_smooth, meshgrid = generate_X_grid(gam, term, extrapolation=0.01, num=100)
         for i, spline in enumerate(term):
             spline.set_params(feature=i)
     else:
-        X_smooth = generate_X_grid(gam, term, gam.X_, extrapolation=0.01, num=100)
+        X_smooth = generate_X_grid(gam, term, extrapolation=0.01, num=100)
         term.set_params(feature=0)
 
     # Predict on smooth grid
@@ -155,10 +218,6 @@ def partial_effect(gam, term, standard_deviations=1.0, edges=None, linear_scale=
     assert np.all(stdev_array > 0)
     assert np.allclose(stdev_array**2, np.diag(X @ V @ X.T))
 
-    # For partial residual plots
-    # https://en.wikipedia.org/wiki/Partial_residual_plot#Definition
-    residuals = gam.y_ - gam._link.inverse_link(gam.model_matrix_ @ gam.coef_)
-
     # Prepare the linear results
     result = Bunch(
         x=X_smooth,
@@ -166,17 +225,24 @@ def partial_effect(gam, term, standard_deviations=1.0, edges=None, linear_scale=
         y_low=predictions - standard_deviations * stdev_array,
         y_high=predictions + standard_deviations * stdev_array,
         x_obs=data,
-        y_partial_residuals=(X_original_transformed @ term.coef_) + residuals,
+        y_partial_residuals=None,
         meshgrid=meshgrid,
     )
 
+    # For partial residual plots
+    # https://en.wikipedia.org/wiki/Partial_residual_plot#Definition
+    if has_data:
+        residuals = y - gam.predict(X_data)
+        result.y_partial_residuals = (X_original_transformed @ term.coef_) + residuals
+
     # Map the variables
     if not linear_scale:
         result.y = gam._link.inverse_link(result.y)
         result.y_low = gam._link.inverse_link(result.y_low)
         result.y_high = gam._link.inverse_link(result.y_high)
-        model_predictions = gam._link.inverse_link(X_original_transformed @ term.coef_)
-        result.y_partial_residuals = (model_predictions + residuals,)
+        if has_data:
+            model_predictions = gam._link.inverse_link(X_original_transformed @ term.coef_)
+            result.y_partial_residuals = (model_predictions + residuals,)
 
     return result
 
@@ -217,6 +283,8 @@ class PartialEffectDisplay:
         line_kwargs = {**default_line_kwargs, **line_kwargs}
 
         if ax is None:
+            import matplotlib.pyplot as plt
+
             _, ax = plt.subplots()
 
         self.line_ = ax.plot(self.x, self.y, zorder=10, **line_kwargs)[0]
@@ -290,11 +358,11 @@ class PartialEffectDisplay:
 
         meshgrid = None
         if isinstance(term, Tensor):
-            X_smooth, meshgrid = generate_X_grid(gam, term, gam.X_, extrapolation=0.01, num=2**8)
+            X_smooth, meshgrid = generate_X_grid(gam, term, extrapolation=0.01, num=2**8)
             for i, spline in enumerate(term):
                 spline.set_params(feature=i)
         else:
-            X_smooth = generate_X_grid(gam, term, gam.X_, extrapolation=0.01, num=2**8)
+            X_smooth = generate_X_grid(gam, term, extrapolation=0.01, num=2**8)
             term.set_params(feature=0)
 
         # Predict on smooth grid
@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 
-import matplotlib.pyplot as plt
 import numpy as np
 import scipy as sp
 
@@ -34,6 +33,8 @@ class QQDisplay:
         line_kwargs = {**default_line_kwargs, **line_kwargs}
 
         if ax is None:
+            import matplotlib.pyplot as plt
+
             _, ax = plt.subplots()
 
         self.scatter_ = ax.scatter(self.quantiles, self.residuals, **scatter_kwargs)
@@ -1,8 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import matplotlib.pyplot as plt
-
 
 class ResidualHistogramDisplay:
     def __init__(self, *, residuals):
@@ -21,6 +19,8 @@ class ResidualHistogramDisplay:
         bin_kwargs = {**default_bin_kwargs, **bin_kwargs}
 
         if ax is None:
+            import matplotlib.pyplot as plt
+
             _, ax = plt.subplots()
 
         self.n_, self.bins_, self.patches_ = ax.hist(self.residuals, **bin_kwargs)
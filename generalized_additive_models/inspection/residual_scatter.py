@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 
@@ -31,6 +30,8 @@ class ResidualScatterDisplay:
         line_kwargs = {**default_line_kwargs, **line_kwargs}
 
         if ax is None:
+            import matplotlib.pyplot as plt
+
             _, ax = plt.subplots()
 
         self.scatter_ = ax.scatter(self.x, self.residuals, **scatter_kwargs)
@@ -13,15 +13,50 @@ import scipy as sp
 from sklearn.exceptions import ConvergenceWarning
 from sklearn.utils import Bunch
 
-from generalized_additive_models.utils import ColumnRemover, phi_fletcher
+from generalized_additive_models.distributions import Normal
+from generalized_additive_models.links import Identity
+from generalized_additive_models.utils import (
+    ChunkedModelMatrix,
+    ColumnRemover,
+    DiscretizedModelMatrix,
+    LazyBunch,
+    phi_fletcher,
+)
 
 MACHINE_EPSILON = np.finfo(float).eps
 EPSILON = np.sqrt(MACHINE_EPSILON)
 
+# The statistics in `results_` that are computed when first looked up
+STATISTICS = ("edof_per_coef", "edof", "scale", "covariance", "generalized_cross_validation_score")
 
-def X_T_W_X_plus_D_T_D(X, w=None, D=None):
+
+def penalty_gram(D):
+    """Compute the penalty Gram matrix S = D.T @ D, which is sparse if D is.
+
+    The penalty is constant during a fit, so S is computed once per solve.
+
+    Examples
+    --------
+    >>> D = sp.sparse.csr_array([[0., 0., 0.],
+    ...                          [1., -2., 1.],
+    ...                          [0., 0., 0.]])
+    >>> penalty_gram(D).toarray()
+    array([[ 1., -2.,  1.],
+           [-2.,  4., -2.],
+           [ 1., -2.,  1.]])
+    """
+    if sp.sparse.issparse(D):
+        return sp.sparse.csr_array(D.T @ D)
+    return D.T @ D
+
+
+def X_T_W_X_plus_D_T_D(X, w=None, D=None, S=None, buffer=None):
     """Compute the upper part of (X.T @ diag(w) @ X + D.T @ D).
 
+    The penalty Gram S = D.T @ D may be given instead of D, see `penalty_gram`.
+    If X is a dense array, the rows of X scaled by the weights are written to
+    `buffer`, an array with the shape of X, which may be reused over calls.
+
     Examples
     --------
     >>> X = np.array([[-0.48,  1.13],
@@ -66,37 +101,327 @@ def X_T_W_X_plus_D_T_D(X, w=None, D=None):
     >>> X_T_W_X_plus_D_T_D(X, w=w, D=D)
     array([[10.3277,  1.6442],
            [ 0.    ,  3.3805]])
+    >>> X_T_W_X_plus_D_T_D(X, w=w, S=penalty_gram(D))
+    array([[10.3277,  1.6442],
+           [ 0.    ,  3.3805]])
+
+    Weights may be negative, as the PIRLS weights can be without Fisher weights:
+
+    >>> w_signed = np.array([2, -3, 4])
+    >>> X.T @ np.diag(w_signed) @ X + D.T @ D
+    array([[ 2.8013, -0.9766],
+           [-0.9766,  2.4679]])
+    >>> X_T_W_X_plus_D_T_D(X, w=w_signed, D=D, buffer=np.empty_like(X))
+    array([[ 2.8013, -0.9766],
+           [ 0.    ,  2.4679]])
+
+    If X is sparse, the full (not only the upper part) matrix is returned as
+    a sparse array. Since each row in a spline basis has few non-zeros, the
+    matrix is block-banded and the memory scales with the non-zeros in X.
+
+    >>> X_T_W_X_plus_D_T_D(sp.sparse.csr_array(X), w=w, D=D).toarray()
+    array([[10.3277,  1.6442],
+           [ 1.6442,  3.3805]])
 
     """
-    # https://docs.scipy.org/doc/scipy/reference/generated/scipy.linalg.blas.ssymm.html
-    # https://www.netlib.org/lapack/explore-html/db/dc9/group__single__blas__level3_ga8e8391a9873114d97e2b63e39fe83b2e.html
-    if w is None and D is None:
-        syrk = sp.linalg.get_blas_funcs("syrk", (X,))
-        return syrk(alpha=1.0, a=X, lower=0, trans=1)
-    elif D is None and np.all(w > 0):
-        syrk = sp.linalg.get_blas_funcs("syrk", (X, w))
-        return syrk(alpha=1.0, a=(X * np.sqrt(w[:, None])), lower=0, trans=1)
-    elif w is None:
-        D_T_D = X_T_W_X_plus_D_T_D(X=D)
-        syrk = sp.linalg.get_blas_funcs("syrk", (X, D))
-        return syrk(alpha=1.0, a=X, lower=0, trans=1, beta=1.0, c=D_T_D, overwrite_c=True)
-    elif D is not None and np.all(w > 0):
-        D_T_D = X_T_W_X_plus_D_T_D(X=D)
-        syrk = sp.linalg.get_blas_funcs("syrk", (X, D, w))
-        return syrk(alpha=1.0, a=(X * np.sqrt(w[:, None])), lower=0, trans=1, beta=1.0, c=D_T_D, overwrite_c=True)
-    else:
-        return X.T @ (w[:, None] * X) + D.T @ D
+    if S is None and D is not None:
+        S = penalty_gram(D)
+
+    if sp.sparse.issparse(X):
+        w = np.ones(X.shape[0], dtype=float) if w is None else w
+        lhs = X.T @ sp.sparse.csr_array(X.multiply(w[:, None]))
+        return sp.sparse.csc_array(lhs if S is None else lhs + sp.sparse.csr_array(S))
+
+    # The Gram matrix of a discretized model matrix is computed from histograms,
+    # and the Gram matrix of a chunked model matrix is accumulated over chunks
+    if isinstance(X, (DiscretizedModelMatrix, ChunkedModelMatrix)):
+        lhs = X.gram(w)
+        lhs = lhs if S is None else lhs + (S.toarray() if sp.sparse.issparse(S) else S)
+        return np.triu(lhs)
+
+    # The upper part of S, which syrk() adds to and overwrites
+    if S is not None:
+        S = np.asfortranarray(np.triu(S.toarray() if sp.sparse.issparse(S) else S))
+
+    if w is None:
+        return _syrk(X, c=S)
+
+    # With weights of both signs, X.T @ diag(w) @ X = A.T @ A - B.T @ B, where
+    # the rows of A and B are the rows of X times sqrt(max(w, 0)) and
+    # sqrt(max(-w, 0)). They are written to `buffer`, so X is not copied.
+    # The buffer should have the memory layout of X, which syrk() reads as is
+    buffer = np.empty_like(X, dtype=float, subok=False) if buffer is None else buffer
+    lhs = S
+    for sign in (1.0, -1.0):
+        w_part = np.maximum(sign * w, 0.0)
+        if not np.any(w_part):
+            continue
+        np.sqrt(w_part, out=w_part)
+        np.multiply(X, w_part[:, None], out=buffer)
+        lhs = _syrk(buffer, alpha=sign, c=lhs)
+
+    return np.zeros((X.shape[1], X.shape[1])) if lhs is None else lhs
+
+
+def _syrk(a, alpha=1.0, c=None):
+    """Compute the upper part of alpha * a.T @ a + c, overwriting c if given.
+
+    BLAS expects Fortran ordered arrays, and a C ordered `a` is a Fortran
+    ordered a.T, so a.T @ a is computed as (a.T) @ (a.T).T without a copy.
+    """
+    # https://docs.scipy.org/doc/scipy/reference/generated/scipy.linalg.blas.dsyrk.html
+    a, trans = (a.T, 0) if a.flags.c_contiguous else (a, 1)
+    syrk = sp.linalg.get_blas_funcs("syrk", (a,))
+    if c is None:
+        return syrk(alpha=alpha, a=a, lower=0, trans=trans)
+    return syrk(alpha=alpha, a=a, lower=0, trans=trans, beta=1.0, c=c, overwrite_c=True)
 
 
-def solve_unbounded_lstsq(*, X, D, w, z):
-    """Solve (X.T @ diag(w) @ X + D.T @ D) beta = X.T @ diag(w) @ z for beta.
+def X_T_W_X(X, w):
+    """Compute X.T @ diag(w) @ X as a dense array, where X may be sparse.
 
-    Form the normal equations and solve them.
+    Examples
+    --------
+    >>> X = np.array([[1., 0.],
+    ...               [2., 1.],
+    ...               [0., 1.]])
+    >>> w = np.array([1., -1., 2.])
+    >>> X_T_W_X(X, w)
+    array([[-3., -2.],
+           [-2.,  1.]])
+    >>> X_T_W_X(sp.sparse.csr_array(X), w)
+    array([[-3., -2.],
+           [-2.,  1.]])
+    """
+    if sp.sparse.issparse(X):
+        return (X.T @ sp.sparse.csr_array(X.multiply(w[:, None]))).toarray()
+    elif isinstance(X, (DiscretizedModelMatrix, ChunkedModelMatrix)):
+        return X.gram(w)
+    return X.T @ (w[:, None] * X)
+
+
+def detect_structure(X, S, max_bandwidth=8):
+    """Detect the structure of the normal equations X.T @ diag(w) @ X + S.
+
+    The structure depends on the sparsity pattern of X and S, not on the
+    weights, so it is detected once and used in every solve. We look for
+    the longest contiguous run of coefficients whose block of the normal
+    equations is banded with bandwidth at most `max_bandwidth`. The other
+    coefficients form the border. With an un-centered sparse spline basis,
+    each Spline gives a banded block with bandwidth `degree`. A dense
+    model matrix, e.g. a centered basis, gives dense normal equations.
+
+    Returns a Bunch with `name` in "banded" (the run is everything),
+    "arrow" (a banded block with a smaller border), "sparse" or "dense".
+    For "banded" and "arrow", `start`, `stop`, `bandwidth` and `border`
+    describe the banded block and the border.
+
+    Examples
+    --------
+    >>> X = sp.sparse.csr_array([[1., 1., 0., 0., 1.],
+    ...                          [0., 1., 1., 0., 1.],
+    ...                          [0., 0., 1., 1., 1.]])
+    >>> S = sp.sparse.csr_array((5, 5))
+    >>> structure = detect_structure(X, S, max_bandwidth=1)
+    >>> structure.name
+    'arrow'
+    >>> structure.start, structure.stop, structure.bandwidth
+    (0, 4, 1)
+    >>> structure.border
+    array([4])
+    >>> detect_structure(X[:, :4], S[:4, :4], max_bandwidth=1).name
+    'banded'
+    >>> detect_structure(X.toarray(), S.toarray()).name
+    'dense'
+    """
+    if not sp.sparse.issparse(X):
+        return Bunch(name="dense")
+
+    # The pattern of |X|.T @ |X| + |S| contains the pattern for any weights
+    num_beta = X.shape[1]
+    pattern = sp.sparse.coo_array(abs(X).T @ abs(X) + abs(sp.sparse.csr_array(S)))
+    pattern.eliminate_zeros()
+    rows, cols = pattern.row, pattern.col
+
+    # For each row i, the largest column j < i - max_bandwidth with an entry.
+    # A run [start, i] is banded iff every row in it has this column < start.
+    far = (rows - cols) > max_bandwidth
+    far_left = np.full(num_beta, -1)
+    np.maximum.at(far_left, rows[far], cols[far])
+    starts = np.maximum.accumulate(far_left + 1)
+    stop = int(np.argmax(np.arange(1, num_beta + 1) - starts)) + 1
+    start = int(starts[stop - 1])
+
+    in_run = (rows >= start) & (rows < stop) & (cols >= start) & (cols < stop)
+    bandwidth = int(np.max(np.abs(rows - cols)[in_run], initial=0))
+    border = np.r_[np.arange(start), np.arange(stop, num_beta)]
+
+    if len(border) == 0:
+        return Bunch(name="banded", start=start, stop=stop, bandwidth=bandwidth, border=border)
+    elif stop - start > len(border):
+        return Bunch(name="arrow", start=start, stop=stop, bandwidth=bandwidth, border=border)
+    return Bunch(name="sparse")
+
+
+def solve_banded_arrow(lhs, rhs, structure):
+    """Solve lhs @ beta = rhs, where lhs is symmetric positive definite with a
+    banded block and a border, as detected by `detect_structure`.
+
+    The banded block is factored with a banded Cholesky. The border is
+    eliminated with the Schur complement, which is small and dense.
+    Raises np.linalg.LinAlgError if the matrix is not positive definite.
 
+    Examples
+    --------
+    >>> lhs = np.array([[ 4., -1.,  0.,  1.],
+    ...                 [-1.,  4., -1.,  1.],
+    ...                 [ 0., -1.,  4.,  1.],
+    ...                 [ 1.,  1.,  1.,  5.]])
+    >>> rhs = np.array([1., 2., 3., 4.])
+    >>> structure = Bunch(start=0, stop=3, bandwidth=1, border=np.array([3]))
+    >>> beta = solve_banded_arrow(lhs, rhs, structure)
+    >>> bool(np.allclose(lhs @ beta, rhs))
+    True
     """
-    lhs = X_T_W_X_plus_D_T_D(X=X, w=w, D=D)
+    band = slice(structure.start, structure.stop)
+    border, u = structure.border, structure.bandwidth
+
+    # Upper banded storage, as used by cholesky_banded
+    A11 = lhs[band, band]
+    ab = np.zeros((u + 1, A11.shape[0]), dtype=float)
+    for d in range(u + 1):
+        ab[u - d, d:] = A11.diagonal(d)
+    cholesky = (sp.linalg.cholesky_banded(ab, lower=False, check_finite=False), False)
+
+    beta = np.empty_like(rhs, dtype=float)
+    if len(border) == 0:
+        beta[band] = sp.linalg.cho_solve_banded(cholesky, rhs[band], check_finite=False)
+        return beta
+
+    A12 = lhs[band, :][:, border]
+    A12 = A12.toarray() if sp.sparse.issparse(A12) else A12
+    A22 = lhs[border, :][:, border]
+    A22 = A22.toarray() if sp.sparse.issparse(A22) else A22
+
+    # Eliminate the banded block, then solve for the border on the Schur complement
+    Y = sp.linalg.cho_solve_banded(cholesky, A12, check_finite=False)
+    y = sp.linalg.cho_solve_banded(cholesky, rhs[band], check_finite=False)
+    schur_complement = A22 - A12.T @ Y
+    beta[border] = sp.linalg.solve(schur_complement, rhs[border] - A12.T @ y, assume_a="pos")
+    beta[band] = y - Y @ beta[border]
+    return beta
+
+
+def solve_bounded(lhs, rhs, bounds, beta0=None, max_iter=None):
+    """Minimize 0.5 * beta.T @ lhs @ beta - rhs.T @ beta subject to the bounds
+    lower <= beta <= upper, where lhs is symmetric positive definite.
+
+    Without bounds, the solution solves lhs @ beta = rhs. A primal active-set
+    method is used. The variables in the active set are fixed at a bound,
+    and the normal equations are solved for the free variables. If a free
+    variable crosses a bound, a step is taken up to the bound, and it is
+    fixed there. If a fixed variable would decrease the objective by moving
+    into the box, it is released. With `beta0`, the variables of beta0 that
+    are at a bound start in the active set. Warm starting from the solution
+    of a similar problem typically needs a few iterations.
+
+    Returns beta and the number of iterations.
+
+    Examples
+    --------
+    >>> lhs = np.array([[ 2., -1.,  0.],
+    ...                 [-1.,  2., -1.],
+    ...                 [ 0., -1.,  2.]])
+    >>> rhs = np.array([-1., 1., 3.])
+    >>> np.linalg.solve(lhs, rhs)
+    array([0.5, 2. , 2.5])
+    >>> bounds = (np.array([1., 1., 1.]), np.array([np.inf, np.inf, 2.]))
+    >>> beta, iterations = solve_bounded(lhs, rhs, bounds)
+    >>> beta
+    array([1., 2., 2.])
+    >>> solve_bounded(lhs, rhs, bounds, beta0=beta)
+    (array([1., 2., 2.]), 1)
+    """
+    lower, upper = (np.broadcast_to(bound, rhs.shape).astype(float) for bound in bounds)
+    max_iter = 10 * len(rhs) + 10 if max_iter is None else max_iter
+
+    # Start at a feasible point. The variables at a bound are in the active set
+    beta = np.zeros_like(rhs, dtype=float) if beta0 is None else np.asarray(beta0, dtype=float)
+    beta = np.clip(beta, lower, upper)
+    at_lower = (beta0 is not None) & (beta <= lower)
+    at_upper = (beta0 is not None) & (beta >= upper) & ~at_lower
+
+    tolerance = EPSILON * max(np.abs(rhs).max(initial=0.0), 1.0)
+    for iteration in range(1, max_iter + 1):
+        # Solve the normal equations for the free variables
+        free = ~(at_lower | at_upper)
+        beta_new = np.where(at_lower, lower, np.where(at_upper, upper, beta))
+        if np.any(free):
+            lhs_free = lhs[np.ix_(free, free)]
+            rhs_free = rhs[free] - lhs[np.ix_(free, ~free)] @ beta_new[~free]
+            try:
+                cholesky = sp.linalg.cho_factor(lhs_free, lower=False, overwrite_a=True, check_finite=False)
+                beta_new[free] = sp.linalg.cho_solve(cholesky, rhs_free, check_finite=False)
+
+            # Not positive definite. Use the least squares solution
+            except np.linalg.LinAlgError:
+                beta_new[free] = sp.linalg.lstsq(lhs[np.ix_(free, free)], rhs_free)[0]
+
+        # If a free variable crosses a bound, step to the first bound crossed
+        # and fix the variable there
+        step = beta_new - beta
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step_sizes = np.where(step < 0, (lower - beta) / step, np.where(step > 0, (upper - beta) / step, np.inf))
+        step_sizes = np.where(free, step_sizes, np.inf)
+        blocking = np.argmin(step_sizes)
+        if step_sizes[blocking] < 1:
+            beta = beta + max(step_sizes[blocking], 0.0) * step
+            at_lower[blocking], at_upper[blocking] = step[blocking] < 0, step[blocking] > 0
+            beta = np.clip(beta, lower, upper)
+            continue
+        beta = beta_new
+
+        # The solution is optimal if no fixed variable has a gradient that
+        # points into the box. Otherwise release the variable with the largest
+        gradient = lhs @ beta - rhs
+        violation = np.where(at_lower, -gradient, 0.0) + np.where(at_upper, gradient, 0.0)
+        released = np.argmax(violation)
+        if violation[released] <= tolerance:
+            break
+        at_lower[released] = at_upper[released] = False
+
+    return beta, iteration
+
+
+def solve_unbounded_lstsq(*, X, S, w, z, structure=None, buffer=None):
+    """Solve (X.T @ diag(w) @ X + S) beta = X.T @ diag(w) @ z for beta.
+
+    Form the normal equations and solve them. If X is sparse, the normal
+    equations are sparse too, and they are solved using a sparse LU. If
+    a banded or arrow `structure` is given (see `detect_structure`), a
+    banded Cholesky factorization is used instead. See `X_T_W_X_plus_D_T_D`
+    for `buffer`.
+
+    """
+    lhs = X_T_W_X_plus_D_T_D(X=X, w=w, S=S, buffer=buffer)
     rhs = X.T @ (w * z)
 
+    if structure is not None and structure.name in ("banded", "arrow") and sp.sparse.issparse(lhs):
+        try:
+            return solve_banded_arrow(lhs, rhs, structure)
+
+        # Not positive definite. Use the general solvers below
+        except np.linalg.LinAlgError:
+            pass
+
+    if sp.sparse.issparse(lhs):
+        try:
+            return sp.sparse.linalg.splu(lhs, permc_spec="MMD_AT_PLUS_A").solve(rhs)
+
+        # Singular matrix. Use the upper part in the dense fall back below
+        except RuntimeError:
+            lhs = sp.sparse.triu(lhs).toarray()
+
     # Try the standard solution method first - cholesky factorization
     try:
         return sp.linalg.solve(lhs, rhs, overwrite_a=True, overwrite_b=True, assume_a="pos", lower=False)
@@ -109,41 +434,38 @@ def solve_unbounded_lstsq(*, X, D, w, z):
         np.fill_diagonal(lhs, lhs.diagonal() / 2.0)
         U, s, VT = sp.linalg.svd(lhs, full_matrices=False, overwrite_a=True)
         s = np.maximum(s, EPSILON)
-        return np.linalg.multi_dot([VT.T, (U / s).T, X.T, (w * z)])
+        return np.linalg.multi_dot([VT.T, (U / s).T, X.T @ (w * z)])
 
 
-def solve_lstsq(*, X, D, w, z, bounds=None, verbose=0):
-    """Solve (X.T @ diag(w) @ X + D.T @ D) beta = X.T @ diag(w) @ z for beta."""
+def solve_lstsq(*, X, S, w, z, bounds=None, verbose=0, structure=None, buffer=None, beta0=None):
+    """Solve (X.T @ diag(w) @ X + S) beta = X.T @ diag(w) @ z for beta, where S = D.T @ D.
+
+    With bounds, the penalized least squares objective is minimized subject
+    to the bounds, see `solve_bounded`, warm started from `beta0` if given.
+    """
     if bounds is None:
-        return solve_unbounded_lstsq(X=X, D=D, w=w, z=z)
+        return solve_unbounded_lstsq(X=X, S=S, w=w, z=z, structure=structure, buffer=buffer)
 
     lower_bounds, upper_bounds = bounds
 
     # If bounds are inactive, solve using standard least squares
     if np.all(lower_bounds == -np.inf) and np.all(upper_bounds == np.inf):
-        return solve_unbounded_lstsq(X=X, D=D, w=w, z=z)
+        return solve_unbounded_lstsq(X=X, S=S, w=w, z=z, structure=structure, buffer=buffer)
 
-    # Set up left hand side and right hand side
-    lhs = X.T @ (w[:, None] * X) + D.T @ D
+    # Set up left hand side and right hand side. The lhs is small and dense
+    lhs = X_T_W_X_plus_D_T_D(X=X, w=w, S=S, buffer=buffer)
+    lhs = lhs.toarray() if sp.sparse.issparse(lhs) else lhs
+    lhs = np.triu(lhs) + np.triu(lhs, k=1).T
     rhs = X.T @ (w * z)
 
-    # TODO: Use
-    # scipy.sparse.linalg.LinearOperator
-
-    verbose = min(max(0, verbose - 2), 2)
-    result = sp.optimize.lsq_linear(lhs, rhs, bounds=bounds, verbose=verbose)
-    assert np.all(result.x <= bounds[1])
-    assert np.all(result.x >= bounds[0])
-
-    if verbose >= 2:
-        msg = f"  Constrained LSQ {'success' if result.success else 'failure'} "
-        msg += f"in {result.nit} iters. Msg: {result.message}"
-        print(msg)
+    beta, iterations = solve_bounded(lhs, rhs, bounds=bounds, beta0=beta0)
+    assert np.all(beta <= bounds[1])
+    assert np.all(beta >= bounds[0])
 
-        if not result.success:
-            print(f" => Constrained LSQ msg: {result.message}")
+    if verbose >= 4:
+        print(f"  Constrained LSQ solved in {iterations} active-set iterations.")
 
-    return result.x
+    return beta
 
 
 class Optimizer:
@@ -155,7 +477,7 @@ class Optimizer:
     EXP_DIGITS = 2
 
     def __init__(self):
-        self.results_ = Bunch(iters_deviance=[], iters_coef=[], iters_loss=[])
+        self.results_ = LazyBunch(iters_deviance=[], iters_coef=[], iters_loss=[])
         self.column_remover = ColumnRemover()
         self.fmt = functools.partial(
             np.format_float_scientific,
@@ -182,7 +504,7 @@ class Optimizer:
         results_keys = ("", "", "", "")
         assert all((key in self._statistics.keys()) for key in results_keys)
 
-    def log(self, *, X, D, beta, mu=None):
+    def log(self, *, X, S, beta, mu=None):
         """Log information in each optimization iteration."""
 
         # Log the coefficients
@@ -197,7 +519,7 @@ class Optimizer:
         self.results_.iters_deviance.append(deviance)
 
         # Log the objective function
-        obj = self.evaluate_objective(beta, X=X, D=D, y=self.y, sample_weight=sample_weight)
+        obj = self.evaluate_objective(beta, X=X, S=S, y=self.y, sample_weight=sample_weight)
         self.results_.iters_loss.append(obj)
 
     def alpha(self, mu, fisher_weights=False):
@@ -210,22 +532,24 @@ class Optimizer:
         g_term = self.link.second_derivative(mu) / self.link.derivative(mu)
         return 1 + (self.y - mu) * (V_term + g_term)
 
-    def evaluate_objective(self, beta, *, X, D, y, sample_weight, mu=None):
+    def evaluate_objective(self, beta, *, X, S, y, sample_weight, mu=None):
         """Evaluate the objective - the sum of deviance plus the penalty.
 
         sum_i deviance(mu_i, y_i) + |D beta|^2
 
+        The penalty is evaluated as beta.T @ S @ beta, where S = D.T @ D.
+
         """
 
         # If mu is given, no reason to recompute X @ beta
         if mu is None:
             mu = self.link.inverse_link(X @ beta)
         deviance = self.distribution.deviance(y=y, mu=mu, scaled=True, sample_weight=sample_weight).sum()
-        penalty = sp.linalg.norm(D @ beta) ** 2
+        penalty = beta @ (S @ beta)
 
         return deviance + penalty
 
-    def gradient(self, beta, *, X, D, y, sample_weight):
+    def gradient(self, beta, *, X, S, y, sample_weight):
         """Evaluate the gradient of the objective function.
 
         Note that this is the gradient with respect to
@@ -243,15 +567,15 @@ class Optimizer:
 
         # Multiply each row (observation) by pseudoweights, then sum over rows
         # Add the minus sign since we want to minimize the negative log-likelihood
-        deviance_grad = -2 * np.sum(X * pseudoweights[:, None], axis=0)
+        deviance_grad = -2 * (X.T @ pseudoweights)
 
         # Compute gradient w.r.t regularization term |D beta|^2
-        penalty_grad = 2 * np.linalg.multi_dot([D.T, D, beta])
+        penalty_grad = 2 * (S @ beta)
 
         assert deviance_grad.shape == penalty_grad.shape
         return deviance_grad + penalty_grad
 
-    def hessian(self, beta, *, X, D, y, sample_weight):
+    def hessian(self, beta, *, X, S, y, sample_weight):
         """Evaluate the hessian of the objective function."""
 
         # Section 3.1.2 in Wood
@@ -263,15 +587,15 @@ class Optimizer:
             pseudoweights = pseudoweights / self.distribution.scale
 
         # Compute (X.T @ W @ X)
-        deviance_hessian = 2 * X.T @ (pseudoweights[:, None] * X)
+        deviance_hessian = 2 * X_T_W_X(X, pseudoweights)
 
-        penalty_hessian = 2 * D.T @ D
+        penalty_hessian = 2 * (S.toarray() if sp.sparse.issparse(S) else S)
 
         assert deviance_hessian.shape == (len(beta), len(beta))
         assert deviance_hessian.shape == penalty_hessian.shape
         return deviance_hessian + penalty_hessian
 
-    def initial_estimate(self, *, X, D, sample_weight, y, bounds=None):
+    def initial_estimate(self, *, X, S, sample_weight, y, bounds=None, structure=None):
         """Construct an initial estimate of beta by solving a Ridge problem.
 
         The idea is to take the observations y, map them to the unbounded linear
@@ -292,36 +616,101 @@ class Optimizer:
         assert np.all(y_to_map > low), f"Initial `y` must be > {low}."
 
         # Solve X @ beta = g(y) = mu
-        return solve_lstsq(X=X, D=D, w=sample_weight, z=mu_initial, bounds=bounds, verbose=self.verbose)
+        return solve_lstsq(
+            X=X, S=S, w=sample_weight, z=mu_initial, bounds=bounds, verbose=self.verbose, structure=structure
+        )
 
-    def set_statistics(self, *, X, D, beta):
-        """Compute post-optimization statistics, such as:
+    def set_statistics(self, *, X, S, beta, cholesky=None):
+        """Set post-optimization statistics in `results_`, computed when they
+        are first looked up:
 
-        - observed Fisher information matrix
+        - the effective degrees of freedom, per coefficient and in total
+        - the scale parameter
         - the variance of the parameters (using asymptotic distribution of a maximum likelihood estimate)
-        - effective degrees of freedom
-        - scale parameter
+        - the generalized cross validation score
 
-        """
-        num_original_betas = len(self.column_remover.nonzero_coefs)
+        The statistics are computed from the observed Fisher information
+        X.T @ W @ X / scale + S at `beta`. Only X.T @ W @ X and sums over the
+        samples are formed here, so neither the model matrix nor vectors with
+        one entry per sample are kept until the statistics are looked up.
+        If `cholesky` is given, it is the Cholesky factor (see `cho_factor`)
+        of the Fisher information, and X.T @ W @ X is not formed at all.
 
+        """
         # Predict using optimal beta values
-        mu = self.link.inverse_link(X @ beta)
+        eta = X @ beta
+        mu = self.link.inverse_link(eta)
         sample_weight = self.get_sample_weight(y=self.y, mu=mu)
 
-        alpha = self.alpha(mu, fisher_weights=False)
-        w = sample_weight * alpha / (self.link.derivative(mu) ** 2 * self.distribution.V(mu))
+        gram = None
+        if cholesky is None:
+            alpha = self.alpha(mu, fisher_weights=False)
+            w = sample_weight * alpha / (self.link.derivative(mu) ** 2 * self.distribution.V(mu))
+            gram = X_T_W_X_plus_D_T_D(X, w=w)
+
+        # The Fletcher scale is proportional to 1 / (sum(sample_weight) - edof),
+        # see `phi_fletcher()`, so it is computed for edof = 0 and rescaled
+        # once the edof is known
+        scale = self.distribution.scale
+        sum_of_weights = np.sum(sample_weight)
+        if scale is None:
+            scale_times_dof = (
+                phi_fletcher(self.y, mu, self.distribution, 0, sample_weight=sample_weight) * sum_of_weights
+            )
+        else:
+            scale_times_dof = None
+
+        # The function is bound to arrays with one entry per coefficient, not
+        # to the optimizer, which holds X
+        statistics = functools.partial(
+            _statistics,
+            gram=gram,
+            S=S,
+            cholesky=cholesky,
+            scale=scale,
+            scale_times_dof=scale_times_dof,
+            sum_of_weights=sum_of_weights,
+            residual_sum_of_squares=sp.linalg.norm(eta - self.y) ** 2,
+            num_samples=len(self.y),
+            column_remover=self.column_remover,
+        )
+        self.results_.set_lazy(STATISTICS, statistics)
+
+
+def _statistics(
+    *, gram, S, cholesky, scale, scale_times_dof, sum_of_weights, residual_sum_of_squares, num_samples, column_remover
+):
+    """Compute the statistics set by `Optimizer.set_statistics()`."""
+    num_original_betas = len(column_remover.nonzero_coefs)
+    S = S.toarray() if sp.sparse.issparse(S) else S
+
+    if cholesky is not None:
+        covariance_matrix = sp.linalg.cho_solve(cholesky, np.eye(len(S)), check_finite=False)
+
+        # With F := X.T @ W @ X + S, the diagonal of X.T @ W @ X @ F^-1 equals
+        # the diagonal of I - S @ F^-1, so X.T @ W @ X is not needed below
+        H_diag = 1.0 - (S * covariance_matrix).sum(axis=1)
+    else:
+        # The upper part of X.T @ W @ X is given, see `X_T_W_X_plus_D_T_D()`
+        gram = gram.toarray() if sp.sparse.issparse(gram) else gram
+        gram = np.triu(gram) + np.triu(gram, k=1).T
 
         # Simon minimizes the negative log likelihood, we minimize the deviance
         # The observed Fisher information matrix is the negative Hessian of the log likelihood.
         # Remember that D(u, mu) := 2 (log(p(y|y)) - log(p(y|mu))) = -2 log(p(y|mu))
-        # Since we minimize deviance, we multiply by 0.5.
+        # Since we minimize deviance, the Fisher information is half the Hessian.
         # https://stats.stackexchange.com/questions/68080/basic-question-about-fisher-information-matrix-and-relationship-to-hessian-and-s
-        fisher_information = 0.5 * self.hessian(beta=beta, X=X, D=D, y=self.y, sample_weight=sample_weight)
-
-        # The covariance matrix is the inverse of the Fisher information
+        fisher_information = (gram / scale if scale else gram) + S
         np.fill_diagonal(fisher_information, fisher_information.diagonal() + EPSILON)  # Add to diagonal
-        covariance_matrix = sp.linalg.inv(fisher_information)
+
+        # The covariance matrix is the inverse of the Fisher information. The
+        # observed information need not be positive definite away from the
+        # canonical link, and is then inverted directly
+        try:
+            cholesky = sp.linalg.cho_factor(fisher_information, lower=False, check_finite=False)
+            covariance_matrix = sp.linalg.cho_solve(cholesky, np.eye(len(S)), check_finite=False)
+        except np.linalg.LinAlgError:
+            covariance_matrix = sp.linalg.inv(fisher_information)
 
         # Compute the hat matrix H, the matrix such that:
         # \hat{y} = H @ y
@@ -329,49 +718,42 @@ class Optimizer:
         # \hat{y} = X @ [(X.T @ W @ X + D.T @ D)^-1 @ W @ X.T @ y]
         # Hence, H := X @ (X.T @ W @ X + D.T @ D)^-1 @ W @ X.T
         # Also called the projection matrix or influence matrix (page 251 in Wood, 2nd ed)
-        # Only need the diagonal of H, so use the fact that
-        # np.diag(B @ A.T) = (B * A).sum(axis=1)
-        # to compute H below:
-        # H = ((w.reshape(-1, 1) * self.X) @ inverted @ self.X.T)
-        H_diag = ((X.T @ (w.reshape(-1, 1) * X)) * covariance_matrix).sum(axis=1)
-        # Fill in with zeros
-        H_diag = self.column_remover.insert(initial=np.zeros(num_original_betas), values=H_diag)
-
-        assert len(H_diag) == num_original_betas
-
-        # Compute the effective degrees of freedom per coefficient
-        self.results_.edof_per_coef = H_diag
-        self.results_.edof = H_diag.sum()
-        edof = self.results_.edof
-
-        # Compute phi by equation (6.2) (page 251 in Wood, 2nd ed; also p 110)
-        # In the Gaussian case, phi is the variance
-        if self.distribution.scale is not None:
-            phi = self.distribution.scale
-        else:
-            phi = phi_fletcher(
-                self.y,
-                mu,
-                self.distribution,
-                edof,
-                sample_weight=self.get_sample_weight(mu=mu, y=self.y),
-            )
-        self.results_.scale = phi
+        # Only need the diagonal of H, and the trace is invariant under cyclic
+        # permutations, so we use the diagonal of X.T @ W @ X @ F^-1, where
+        # np.diag(B @ A.T) = (B * A).sum(axis=1) for the symmetric F^-1
+        H_diag = (gram * covariance_matrix).sum(axis=1)
+
+    # Fill in with zeros
+    H_diag = column_remover.insert(initial=np.zeros(num_original_betas), values=H_diag)
+    assert len(H_diag) == num_original_betas
+
+    # Compute the effective degrees of freedom per coefficient
+    edof = H_diag.sum()
+
+    # Compute phi by equation (6.2) (page 251 in Wood, 2nd ed; also p 110)
+    # In the Gaussian case, phi is the variance
+    if scale is not None:
+        phi = scale
+    else:
+        phi = scale_times_dof / (sum_of_weights - edof)
 
-        # Compute the covariance matrix of the parameters V_\beta (page 293 in Wood, 2nd ed)
-        covariance = covariance_matrix * phi
-        covariance = self.column_remover.insert(
-            initial=np.eye(num_original_betas, dtype=float) * EPSILON, values=covariance
-        )
+    # Compute the covariance matrix of the parameters V_\beta (page 293 in Wood, 2nd ed)
+    covariance = covariance_matrix * phi
+    covariance = column_remover.insert(initial=np.eye(num_original_betas, dtype=float) * EPSILON, values=covariance)
+    assert covariance.shape == (num_original_betas, num_original_betas)
 
-        assert covariance.shape == (num_original_betas, num_original_betas)
-        self.results_.covariance = covariance
+    # Compute generalized cross validation score
+    # Equation (6.18) on page 260
+    # TODO: This is only the Gaussian case, see page 262
+    gcv = residual_sum_of_squares * num_samples / (num_samples - edof) ** 2
 
-        # Compute generalized cross validation score
-        # Equation (6.18) on page 260
-        # TODO: This is only the Gaussian case, see page 262
-        gcv = sp.linalg.norm(X @ beta - self.y) ** 2 * len(self.y) / (len(self.y) - edof) ** 2
-        self.results_.generalized_cross_validation_score = gcv
+    return {
+        "edof_per_coef": H_diag,
+        "edof": edof,
+        "scale": phi,
+        "covariance": covariance,
+        "generalized_cross_validation_score": gcv,
+    }
 
 
 class LBFGSB(Optimizer):
@@ -388,6 +770,7 @@ class LBFGSB(Optimizer):
         tol,
         get_sample_weight,
         verbose,
+        compute_statistics=True,
     ):
         self.X = X
         self.D = D
@@ -399,8 +782,50 @@ class LBFGSB(Optimizer):
         self.tol = tol
         self.get_sample_weight = get_sample_weight
         self.verbose = verbose
+        self.compute_statistics = compute_statistics
+        self._evaluation = None
         super().__init__()
 
+    def evaluate(self, beta, *, X, S):
+        """Evaluate the objective and its gradient at `beta`, with one product
+        X @ beta and one product X.T @ r, and no temporaries of the size of X.
+
+        Returns a Bunch with the mean deviance, the objective and the gradient.
+        The last evaluation is memoized by `beta`, since L-BFGS-B evaluates the
+        objective at a point before the callback and the log are called there.
+        """
+        key = beta.tobytes()
+        if self._evaluation is not None and self._evaluation.key == key:
+            return self._evaluation
+
+        # Make a prediction and compute weights
+        mu = self.link.inverse_link(X @ beta)
+        sample_weight = self.get_sample_weight(mu=mu, y=self.y)
+
+        # The objective is the sum of the deviance plus the penalty, see `evaluate_objective()`
+        deviance = self.distribution.deviance(y=self.y, mu=mu, scaled=True, sample_weight=sample_weight)
+        S_beta = S @ beta
+        objective = deviance.sum() + beta @ S_beta
+
+        # Equation (3.3) in Wood, see `gradient()`
+        pseudoweights = sample_weight * (self.y - mu) / (self.distribution.V(mu) * self.link.derivative(mu))
+        if self.distribution.scale:
+            pseudoweights = pseudoweights / self.distribution.scale
+        gradient = -2 * (X.T @ pseudoweights) + 2 * S_beta
+
+        self._evaluation = Bunch(key=key, deviance=deviance.mean(), objective=objective, gradient=gradient)
+        return self._evaluation
+
+    def log(self, *, X, S, beta, mu=None):
+        """Log information in each optimization iteration, reusing the
+        evaluation at `beta` if there is one."""
+        evaluation = self.evaluate(beta, X=X, S=S)
+
+        # L-BFGS-B passes the same array to every callback, so it is copied
+        self.results_.iters_coef.append(beta.copy())
+        self.results_.iters_deviance.append(evaluation.deviance)
+        self.results_.iters_loss.append(evaluation.objective)
+
     def solve(self):
         """Solve using L-BFGS-B from scipy."""
 
@@ -408,25 +833,20 @@ class LBFGSB(Optimizer):
         self.column_remover.fit(X=self.X, D=self.D)
         X, D, *bounds = self.column_remover.transform(self.X, self.D, *self.bounds)
 
+        # The penalty is constant, so the penalty Gram is computed once
+        S = penalty_gram(D)
+        structure = detect_structure(X, S)
+        self.results_.structure = structure.name
+
         # Initial guess
         sample_weight = self.get_sample_weight()
-        x0 = self.initial_estimate(X=X, D=D, sample_weight=sample_weight, y=self.y, bounds=bounds)
-        self.log(beta=x0, X=X, D=D)
+        x0 = self.initial_estimate(X=X, S=S, sample_weight=sample_weight, y=self.y, bounds=bounds, structure=structure)
+        self.log(beta=x0, X=X, S=S)
 
-        def objective_and_gradient(beta, X, D):
+        def objective_and_gradient(beta, X, S):
             """Compute the objective and gradient, updating weights on the fly."""
-
-            # Make a prediction and compute weights
-            mu = self.link.inverse_link(X @ beta)
-            sample_weight = self.get_sample_weight(mu=mu, y=self.y)
-
-            # Compute the objective function value at 'beta'
-            objective = self.evaluate_objective(beta=beta, X=X, D=D, y=self.y, sample_weight=sample_weight)
-
-            # Compute the gradient at 'beta'
-            gradient = self.gradient(beta=beta, X=X, D=D, y=self.y, sample_weight=sample_weight)
-
-            return objective, gradient
+            evaluation = self.evaluate(beta, X=X, S=S)
+            return evaluation.objective, evaluation.gradient
 
         class Callback:
             def __init__(cb):
@@ -436,10 +856,9 @@ class LBFGSB(Optimizer):
                 """Callback function for logging."""
                 beta = intermediate_result.x
 
-                mu = self.link.inverse_link(X @ beta)
-                sample_weight = self.get_sample_weight(mu=mu, y=self.y)
-                objective_value = self.evaluate_objective(beta=beta, X=X, D=D, y=self.y, sample_weight=sample_weight)
-                self.log(X=X, D=D, beta=intermediate_result.x, mu=mu)
+                # The objective was evaluated at beta by L-BFGS-B, and is reused
+                objective_value = self.evaluate(beta, X=X, S=S).objective
+                self.log(X=X, S=S, beta=beta)
 
                 # Print iteration information
                 if self.verbose >= 1:
@@ -454,7 +873,7 @@ class LBFGSB(Optimizer):
         result = sp.optimize.minimize(
             objective_and_gradient,
             x0=x0,
-            args=(X, D),
+            args=(X, S),
             method="L-BFGS-B",
             jac=True,
             bounds=list(zip(*bounds)),
@@ -479,9 +898,10 @@ class LBFGSB(Optimizer):
             warnings.warn(msg, ConvergenceWarning)
 
         beta = result.x
-        self.log(X=X, D=D, beta=beta)
+        self.log(X=X, S=S, beta=beta)
 
-        self.set_statistics(X=X, D=D, beta=beta)
+        if self.compute_statistics:
+            self.set_statistics(X=X, S=S, beta=beta)
 
         # Add back zeros to beta (unidentifiable parameters)
         num_beta = self.D.shape[1]
@@ -510,6 +930,7 @@ class PIRLS(Optimizer):
         tol,
         get_sample_weight,
         verbose,
+        compute_statistics=True,
     ):
         self.X = X
         self.D = D
@@ -521,11 +942,12 @@ class PIRLS(Optimizer):
         self.tol = tol
         self.get_sample_weight = get_sample_weight
         self.verbose = verbose
+        self.compute_statistics = compute_statistics
 
         self._validate_params()
         super().__init__()
 
-    def halving_search(self, X, D, y, sample_weight, beta0, beta1):
+    def halving_search(self, S, y, sample_weight, beta0, beta1, *, eta0, eta1, mu0):
         """Perform halving search.
 
         Here beta0 is the solution to the previous Newton step, and beta1 is
@@ -545,24 +967,32 @@ class PIRLS(Optimizer):
           combination of two points within a high-dimensional box [min, max]^D.
         - I also tested using sp.optimize.minimize_scalar, but found that using
           halving search is equally good as easier.
+        - The linear predictor eta = X @ beta is linear in beta, so the search
+          is done on eta0 = X @ beta0 and eta1 = X @ beta1, with no products
+          with X. The mean mu0 at beta0 is given too.
+
+        Returns beta, eta, mu, the objective and the number of halvings.
         """
         # Starting objective value
-        obj0 = self.evaluate_objective(beta=beta0, X=X, D=D, y=y, sample_weight=sample_weight)
+        obj0 = self.evaluate_objective(beta=beta0, X=None, S=S, y=y, sample_weight=sample_weight, mu=mu0)
 
         # Try step sizes 1, 1/2, 1/4, 1/8, ..., 1/2^19 = 1.9e-06
+        eta_step = eta1 - eta0
         for iteration in range(20):
             step_size = (1 / 2) ** iteration
             beta = step_size * beta1 + (1 - step_size) * beta0
-            obj = self.evaluate_objective(beta=beta, X=X, D=D, y=y, sample_weight=sample_weight)
+            eta = eta0 + step_size * eta_step if iteration else eta1
+            mu = self.link.inverse_link(eta)
+            obj = self.evaluate_objective(beta=beta, X=None, S=S, y=y, sample_weight=sample_weight, mu=mu)
 
             # Found a better solution, return it
             if obj < obj0:
-                return beta, obj, iteration
+                return beta, eta, mu, obj, iteration
 
         # No better solution found
-        return beta0, obj0, iteration
+        return beta0, eta0, mu0, obj0, iteration
 
-    def pirls(self, beta, *, X, D, y, bounds):
+    def pirls(self, beta, *, X, S, y, bounds, structure=None):
         """Main loop for penalized iteratively re-weighted least squares (PIRLS)."""
         fmt = self.fmt  # Number formatter
 
@@ -574,29 +1004,43 @@ class PIRLS(Optimizer):
         eta = X @ beta
         mu = self.link.inverse_link(eta)
 
+        # Buffers for the pseudodata, the weights and the weighted model matrix,
+        # which are overwritten in every iteration
+        z, w = np.empty(len(self.y), dtype=float), np.empty(len(self.y), dtype=float)
+        buffer = np.empty_like(X, dtype=float, subok=False) if isinstance(X, np.ndarray) else None
+
         # Main loop - each iteration solves a least squares problem (Newton step)
         for iteration in range(1, self.max_iter + 1):
             # Step 1: Compute pseudodata z and iterative weights w
+            #   z = g'(mu) * (y - mu) / alpha + eta
+            #   w = sample_weight * alpha / (g'(mu)^2 * V(mu))
             alpha = self.alpha(mu, fisher_weights=self.fisher_weights)
-            z = self.link.derivative(mu) * (self.y - mu) / alpha + eta
+            link_derivative = self.link.derivative(mu)
             sample_weight = self.get_sample_weight(mu=mu, y=self.y)
-            w = sample_weight * alpha / (self.link.derivative(mu) ** 2 * self.distribution.V(mu))
+
+            np.subtract(self.y, mu, out=z)
+            z *= link_derivative
+            z /= alpha
+            z += eta
+
+            np.square(link_derivative, out=w)
+            w *= self.distribution.V(mu)
+            np.divide(sample_weight * alpha, w, out=w)
             if self.fisher_weights:
                 assert np.all(w >= 0), f"smallest w_i was negative: {np.min(w)}"
 
             # Step 2: Find beta to solve the weighted least squares objective
             # Solve f(z) = |z - X @ beta|^2_W + |D @ beta|^2
-            beta_trial = solve_lstsq(X=X, D=D, w=w, z=z, bounds=bounds)
-
-            # Step 3: Perform halving search between previous beta and trial beta
-            beta, objective_value, half_exponent = self.halving_search(X, D, self.y, sample_weight, beta, beta_trial)
+            beta_trial = solve_lstsq(X=X, S=S, w=w, z=z, bounds=bounds, structure=structure, buffer=buffer, beta0=beta)
 
-            # New predictions for the next iteration
-            eta = X @ beta
-            mu = self.link.inverse_link(eta)
+            # Step 3: Perform halving search between previous beta and trial beta.
+            # This also gives the predictions for the next iteration
+            beta, eta, mu, objective_value, half_exponent = self.halving_search(
+                S, self.y, sample_weight, beta, beta_trial, eta0=eta, eta1=X @ beta_trial, mu0=mu
+            )
 
             # Log info: loss, deviance and beta
-            self.log(beta=beta, X=X, D=D, mu=mu)
+            self.log(beta=beta, X=X, S=S, mu=mu)
 
             # Print iteration information
             if self.verbose >= 1:
@@ -625,6 +1069,82 @@ class PIRLS(Optimizer):
 
         return beta  # Return optimal beta
 
+    def solve_least_squares(self, *, X, S, bounds, structure=None):
+        """Solve a model with a Normal distribution and an Identity link.
+
+        The pseudodata is y and the iterative weights are the sample weights,
+        so PIRLS converges in one step from any initial estimate, and each
+        step decreases the objective. We solve the penalized least squares
+        problem directly instead, with no initial estimate and no halving
+        search. With an ExpectileGAM the sample weights depend on mu, and we
+        solve again with new weights until they no longer change. This is the
+        asymmetric least squares algorithm, which converges in a few steps.
+
+        Returns beta, and the Cholesky factor of X.T @ W @ X + S at beta if it
+        can be used by `set_statistics()`, or None.
+        """
+        fmt = self.fmt  # Number formatter
+        lower_bounds, upper_bounds = bounds
+        unbounded = np.all(lower_bounds == -np.inf) and np.all(upper_bounds == np.inf)
+
+        sample_weight = self.get_sample_weight()
+        beta = None  # The previous solution, used to warm start the bounded solver
+        for iteration in range(1, self.max_iter + 1):
+            # Factor the normal equations, unless X is sparse and a sparse solver is used
+            cholesky = None
+            if unbounded and not sp.sparse.issparse(X):
+                lhs = X_T_W_X_plus_D_T_D(X=X, w=sample_weight, S=S)
+                try:
+                    cholesky = sp.linalg.cho_factor(lhs, lower=False, overwrite_a=True, check_finite=False)
+                    beta = sp.linalg.cho_solve(cholesky, X.T @ (sample_weight * self.y), check_finite=False)
+
+                # Not positive definite. Use the general solvers below
+                except np.linalg.LinAlgError:
+                    cholesky = None
+
+            if cholesky is None:
+                beta = solve_lstsq(X=X, S=S, w=sample_weight, z=self.y, bounds=bounds, structure=structure, beta0=beta)
+
+            mu = X @ beta
+            self.log(beta=beta, X=X, S=S, mu=mu)
+
+            if self.verbose >= 1:
+                lpad = int(np.floor(np.log10(self.max_iter)))
+                msg = f"Iteration: {str(iteration).rjust(lpad, ' ')}/{self.max_iter}   "
+                msg += f"Objective: {fmt(self.results_.iters_loss[-1])}   "
+                msg += f"Coef. rmse: {fmt(np.sqrt(np.mean(beta**2)))}   "
+                print(msg)
+
+            # The weights of a GAM do not depend on mu, so one solve is enough
+            sample_weight_new = self.get_sample_weight(mu=mu, y=self.y)
+            if np.array_equal(sample_weight_new, sample_weight):
+                if self.verbose >= 1:
+                    print(" => SUCCESS: Solver converged (weights did not change).")
+                break
+
+            # The factor is for the old weights, so it is not used for the statistics
+            sample_weight, cholesky = sample_weight_new, None
+            if self._should_stop(betas=self.results_.iters_coef, step_size=1):
+                if self.verbose >= 1:
+                    print(" => SUCCESS: Solver converged (met tolerance criterion).")
+                break
+
+        # Solver did not converge
+        else:
+            if self.verbose >= 1:
+                print(f" => FAILURE: Solver did not converge in {self.max_iter} iterations.")
+
+            msg = f"Solver did not converge in {self.max_iter} iterations.\n"
+            msg += "Increase `max_iter`, increase `tol` or increase penalties.\n"
+            msg += "Scaling data or using a canonical link function can also help."
+            warnings.warn(msg, ConvergenceWarning)
+
+        # With a known scale, the Fisher information is X.T @ W @ X / scale + S
+        if self.distribution.scale is not None:
+            cholesky = None
+
+        return beta, cholesky
+
     def solve(self, fisher_weights=False):
         """Solve the optimization problem."""
         fmt = self.fmt  # Formatter
@@ -639,18 +1159,39 @@ class PIRLS(Optimizer):
         # Set non-identifiable coefficients to zero
         self.column_remover.fit(X=self.X, D=self.D)
         X, D, *bounds = self.column_remover.transform(self.X, self.D, *self.bounds)
+
+        # The penalty is constant, so the penalty Gram is computed once
+        S = penalty_gram(D)
+        structure = detect_structure(X, S)
+        self.results_.structure = structure.name
         if self.verbose >= 2:
             print(
                 "Variables set to zero for identifiability:"
                 + f"{self.column_remover.zero_coefs.sum()}/{len(self.column_remover.zero_coefs)}"
             )
+            print(f"Structure of the normal equations: {structure.name}")
+
+        # With a Normal distribution and an Identity link, the objective is a
+        # penalized least squares problem, which is solved directly
+        if isinstance(self.distribution, Normal) and isinstance(self.link, Identity):
+            beta, cholesky = self.solve_least_squares(X=X, S=S, bounds=bounds, structure=structure)
+
+            # Build the statistics - in the identifiable space
+            if self.compute_statistics:
+                self.set_statistics(X=X, S=S, beta=beta, cholesky=cholesky)
+            self.results_.iters_coef = [
+                self.column_remover.insert(initial=np.zeros(num_beta), values=beta) for beta in self.results_.iters_coef
+            ]
+            return self.results_.iters_coef[-1]
 
         # Compute initial estimate - this must also obey the bounds
         sample_weight = self.get_sample_weight()
-        beta = self.initial_estimate(X=X, D=D, sample_weight=sample_weight, y=self.y, bounds=bounds)
-        self.log(beta=beta, X=X, D=D)
+        beta = self.initial_estimate(
+            X=X, S=S, sample_weight=sample_weight, y=self.y, bounds=bounds, structure=structure
+        )
+        self.log(beta=beta, X=X, S=S)
         if self.verbose >= 1:
-            objective_init = self.evaluate_objective(beta=beta, X=X, D=D, y=self.y, sample_weight=sample_weight)
+            objective_init = self.evaluate_objective(beta=beta, X=X, S=S, y=self.y, sample_weight=sample_weight)
             msg = f"Initial guess:      Objective: {fmt(objective_init)}   "
             beta_fmt = fmt(np.sqrt(np.mean(beta**2)))
             msg += f"Coef. rmse: {beta_fmt}   "
@@ -659,10 +1200,11 @@ class PIRLS(Optimizer):
         # See page 251 in Wood, 2nd edition
         # Step 1: Compute initial values
         # ---------------------------------------------------------------------
-        beta = self.pirls(beta=beta, X=X, D=D, y=self.y, bounds=bounds)
+        beta = self.pirls(beta=beta, X=X, S=S, y=self.y, bounds=bounds, structure=structure)
 
         # Build the statistics - in the identifiable space
-        self.set_statistics(X=X, D=D, beta=beta)
+        if self.compute_statistics:
+            self.set_statistics(X=X, S=S, beta=beta)
 
         # Add back zeros to beta (unidentifiable parameters)
         self.results_.iters_coef = [
@@ -778,7 +1320,7 @@ if __name__ == "__main__":
     obj_mead = optimizer.evaluate_objective(
         beta=beta_mead,
         X=poisson_gam.model_matrix_,
-        D=poisson_gam.terms.penalty_matrix(),
+        S=penalty_gram(poisson_gam.terms.penalty_matrix()),
         y=y,
         sample_weight=sample_weight,
     ).round(6)
@@ -786,7 +1328,7 @@ if __name__ == "__main__":
     obj_pirls = optimizer.evaluate_objective(
         beta=beta_pirls,
         X=poisson_gam.model_matrix_,
-        D=poisson_gam.terms.penalty_matrix(),
+        S=penalty_gram(poisson_gam.terms.penalty_matrix()),
         y=y,
         sample_weight=sample_weight,
     ).round(6)
@@ -794,7 +1336,7 @@ if __name__ == "__main__":
     obj_sklearn = optimizer.evaluate_objective(
         beta=poisson_sklearn.coef_,
         X=X,
-        D=poisson_gam.terms.penalty_matrix(),
+        S=penalty_gram(poisson_gam.terms.penalty_matrix()),
         y=y,
         sample_weight=sample_weight,
     ).round(6)
@@ -823,7 +1365,7 @@ if __name__ == "__main__":
     optimizer.hessian(
         beta=poisson_sklearn.coef_,
         X=X,
-        D=poisson_gam.terms.penalty_matrix(),
+        S=penalty_gram(poisson_gam.terms.penalty_matrix()),
         y=y,
         sample_weight=sample_weight,
     )
@@ -9,10 +9,11 @@ Created on Mon Feb  6 21:13:31 2023
 import numbers
 
 import numpy as np
+import scipy as sp
 from sklearn.utils import check_scalar
 
 
-def second_order_finite_difference(n, periodic=False):
+def second_order_finite_difference(n, periodic=False, sparse=False):
     """Create a second-order finite difference matrix.
 
     Parameters
@@ -21,10 +22,12 @@ def second_order_finite_difference(n, periodic=False):
         Number of coefficients.
     periodic : bool, optional
         Whether the penalty is periodic (wraps around). The default is False.
+    sparse : bool, optional
+        Whether to return a scipy.sparse CSR array. The default is False.
 
     Returns
     -------
-    np.ndarray
+    np.ndarray or scipy.sparse.csr_array
         A finite difference matrix.
 
     Examples
@@ -58,24 +61,26 @@ def second_order_finite_difference(n, periodic=False):
     0.0
     >>> float(np.linalg.norm(D @ (x + 1)))
     0.0
+
+    The matrix is tridiagonal (apart from the wrap around when periodic):
+
+    >>> second_order_finite_difference(1000, sparse=True).nnz
+    2994
     """
     n = check_scalar(n, name="n", target_type=numbers.Integral, min_val=1, include_boundaries="left")
 
     if n in (1, 2):
-        return np.zeros(shape=(n, n), dtype=float)
-
-    # Set up tridiagonal
-    D = (np.eye(n, k=1) + np.eye(n, k=-1) - 2 * np.eye(n)).astype(float)
-    if periodic:
-        # Wrap around
-        D[0, -1] = 1
-        D[-1, 0] = 1
-        return D
-    else:
-        # Remove on first and last element
-        D[0, :2] = [0, 0]
-        D[-1, -2:] = [0, 0]
-        return D
+        D = sp.sparse.csr_array((n, n), dtype=float)
+        return D if sparse else D.toarray()
+
+    # Set up tridiagonal. The first and last rows are zero, unless the
+    # differences wrap around (periodic).
+    rows = np.arange(n) if periodic else np.arange(1, n - 1)
+    cols = (rows[:, None] + np.array([-1, 0, 1])) % n
+    data = np.tile([1.0, -2.0, 1.0], len(rows))
+    D = sp.sparse.csr_array((data, (np.repeat(rows, 3), cols.ravel())), shape=(n, n))
+
+    return D if sparse else D.toarray()
 
 
 if __name__ == "__main__":
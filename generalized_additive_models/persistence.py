@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Save and load fitted GAMs.
+
+A fitted GAM is saved to a directory with a JSON file describing the model,
+and one .npy file per array (knots, coefficients, centering constants, the
+covariance matrix, ...). Loading memory-maps the arrays, so a model starts
+without reading them. Training data and solver history are never saved.
+
+A fitted GAM can also be exported to a scorer, which predicts with NumPy
+only, see `generalized_additive_models.scorer`.
+"""
+
+import importlib.metadata
+import json
+import math
+import os
+
+import numpy as np
+import scipy as sp
+from sklearn.preprocessing import OneHotEncoder
+from sklearn.utils import Bunch
+
+from generalized_additive_models import distributions, links, scorer, terms
+from generalized_additive_models.splinetransformer import SplineTransformer
+
+FORMAT_VERSION = 1
+METADATA_FILENAME = "model.json"
+
+# Term attributes that are set from the coefficients of the GAM after loading
+COEFFICIENT_ATTRIBUTES = ("coef_", "coef_idx_", "edof_", "coef_covar_", "_results")
+
+
+def _encode(value, key, arrays):
+    """Encode a value as JSON. Arrays are added to `arrays` with the name `key`.
+
+    Examples
+    --------
+    >>> arrays = dict()
+    >>> _encode((1, np.float64(2.5), None), "a", arrays)
+    {'tuple': [1, 2.5, None]}
+    >>> _encode({"b": np.arange(3)}, "a", arrays)
+    {'dict': [['b', {'array': 'a.b'}]]}
+    >>> arrays
+    {'a.b': array([0, 1, 2])}
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.ndarray):
+        arrays[key] = value
+        return {"array": key}
+    if isinstance(value, os.PathLike):
+        return os.fspath(value)
+    if isinstance(value, (list, tuple)) and not isinstance(value, terms.TermList):
+        kind = "list" if isinstance(value, list) else "tuple"
+        return {kind: [_encode(item, f"{key}.{i}", arrays) for i, item in enumerate(value)]}
+    if isinstance(value, dict):
+        kind = "bunch" if isinstance(value, Bunch) else "dict"
+        return {kind: [[k, _encode(v, f"{key}.{k}", arrays)] for k, v in value.items()]}
+    if isinstance(value, terms.TermList):
+        return {"terms": [_encode(term, f"{key}.{i}", arrays) for i, term in enumerate(value)]}
+    if isinstance(value, terms.Term):
+        return {"term": _encode_term(value, key, arrays)}
+    if isinstance(value, SplineTransformer):
+        return {"spline_transformer": _encode_spline_transformer(value, key, arrays)}
+    if isinstance(value, OneHotEncoder):
+        return {"onehotencoder": _encode_onehotencoder(value, key, arrays)}
+    if isinstance(value, (distributions.Distribution, links.Link)):
+        kind = "distribution" if isinstance(value, distributions.Distribution) else "link"
+        params = _encode(value.get_params(deep=False), f"{key}.params", arrays)
+        return {kind: {"class": type(value).__name__, "params": params}}
+
+    raise TypeError(f"Cannot save value of type {type(value)}: {value}")
+
+
+def _decode(value, arrays):
+    """Decode a value encoded with `_encode`, with arrays looked up in `arrays`."""
+    if not isinstance(value, dict):
+        return value
+
+    ((kind, content),) = value.items()
+    if kind == "array":
+        return arrays[content]
+    if kind == "list":
+        return [_decode(item, arrays) for item in content]
+    if kind == "tuple":
+        return tuple(_decode(item, arrays) for item in content)
+    if kind in ("dict", "bunch"):
+        decoded = {k: _decode(v, arrays) for k, v in content}
+        return Bunch(**decoded) if kind == "bunch" else decoded
+    if kind == "terms":
+        return terms.TermList([_decode(term, arrays) for term in content])
+    if kind == "term":
+        return _decode_term(content, arrays)
+    if kind == "spline_transformer":
+        return _decode_spline_transformer(content, arrays)
+    if kind == "onehotencoder":
+        return _decode_onehotencoder(content, arrays)
+    if kind in ("distribution", "link"):
+        module = distributions if kind == "distribution" else links
+        return getattr(module, content["class"])(**_decode(content["params"], arrays))
+
+    raise ValueError(f"Cannot load value of kind: {kind}")
+
+
+def _encode_term(term, key, arrays):
+    """Encode the parameters and the fitted attributes of a term."""
+    param_names = type(term)._get_param_names()
+    params = {name: getattr(term, name) for name in param_names}
+    attributes = {
+        name: value
+        for (name, value) in vars(term).items()
+        if name not in param_names and name not in COEFFICIENT_ATTRIBUTES
+    }
+    return {
+        "class": type(term).__name__,
+        "params": _encode(params, f"{key}.params", arrays),
+        "attributes": _encode(attributes, key, arrays),
+    }
+
+
+def _decode_term(content, arrays):
+    term = getattr(terms, content["class"])(**_decode(content["params"], arrays))
+    for name, value in _decode(content["attributes"], arrays).items():
+        setattr(term, name, value)
+    return term
+
+
+def _encode_spline_transformer(transformer, key, arrays):
+    """Encode a fitted SplineTransformer by the knots and coefficients of its
+    B-splines, which are antidifferentiated for constrained splines."""
+    bsplines = [
+        {
+            "t": _encode(bspline.t, f"{key}.bsplines.{i}.t", arrays),
+            "c": _encode(bspline.c, f"{key}.bsplines.{i}.c", arrays),
+            "k": int(bspline.k),
+            "extrapolate": _encode(bspline.extrapolate, f"{key}.bsplines.{i}.extrapolate", arrays),
+        }
+        for (i, bspline) in enumerate(transformer.bsplines_)
+    ]
+    return {
+        "params": _encode(transformer.get_params(), f"{key}.params", arrays),
+        "bsplines": bsplines,
+        "n_features_in_": transformer.n_features_in_,
+        "n_features_out_": transformer.n_features_out_,
+    }
+
+
+def _decode_spline_transformer(content, arrays):
+    params = _decode(content["params"], arrays)
+    transformer = SplineTransformer(**{name: params[name] for name in SplineTransformer._get_param_names()})
+    transformer.bsplines_ = [
+        sp.interpolate.BSpline.construct_fast(
+            _decode(bspline["t"], arrays),
+            _decode(bspline["c"], arrays),
+            bspline["k"],
+            extrapolate=bspline["extrapolate"],
+        )
+        for bspline in content["bsplines"]
+    ]
+    transformer.n_features_in_ = content["n_features_in_"]
+    transformer.n_features_out_ = content["n_features_out_"]
+    return transformer
+
+
+def _encode_onehotencoder(encoder, key, arrays):
+    """Encode a fitted OneHotEncoder by its categories, and which of them are
+    grouped as infrequent."""
+    (categories,) = encoder.categories_
+    infrequent = np.zeros(len(categories), dtype=bool)
+    if encoder._infrequent_enabled and encoder.infrequent_categories_[0] is not None:
+        infrequent = np.isin(categories, encoder.infrequent_categories_[0])
+
+    return {
+        "categories": _encode(list(categories), f"{key}.categories", arrays),
+        "dtype": "object" if categories.dtype == object else categories.dtype.str,
+        "infrequent": _encode(infrequent.tolist(), f"{key}.infrequent", arrays),
+        "handle_unknown": encoder.handle_unknown,
+    }
+
+
+def _decode_onehotencoder(content, arrays):
+    categories = np.array(_decode(content["categories"], arrays), dtype=content["dtype"])
+    infrequent = np.array(_decode(content["infrequent"], arrays), dtype=bool)
+
+    # Infrequent categories appear once and the others twice, so fitting with
+    # `min_frequency=2` groups the same categories as infrequent
+    encoder = OneHotEncoder(
+        categories="auto",
+        drop=None,
+        sparse_output=False,
+        dtype=float,
+        handle_unknown=content["handle_unknown"],
+        min_frequency=2 if np.any(infrequent) else None,
+        feature_name_combiner="concat",
+    )
+    return encoder.fit(np.repeat(categories, np.where(infrequent, 1, 2)).reshape(-1, 1))
+
+
+class ArrayDirectory(dict):
+    """A dict of the arrays in a directory, loaded when they are looked up.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> path = tempfile.mkdtemp()
+    >>> np.save(os.path.join(path, "a.npy"), np.arange(3))
+    >>> ArrayDirectory(path, mmap=True)["a"]
+    memmap([0, 1, 2])
+    """
+
+    def __init__(self, path, mmap=True):
+        super().__init__()
+        self.path = path
+        self.mmap = mmap
+
+    def __missing__(self, name):
+        filename = os.path.join(self.path, f"{name}.npy")
+        self[name] = np.load(filename, mmap_mode="r" if self.mmap else None, allow_pickle=False)
+        return self[name]
+
+
+def save_model(gam, path, covariance=True):
+    """Save a fitted GAM to the directory `path`, see `GAM.save()`."""
+    results = Bunch(**{k: v for (k, v) in gam.results_.items() if not k.startswith("iters_")})
+    if not covariance:
+        results.pop("covariance", None)
+
+    attributes = {
+        "terms": gam.terms,
+        "coef_": gam.coef_,
+        "results_": results,
+        "_distribution": gam._distribution,
+        "_link": gam._link,
+    }
+    if hasattr(gam, "feature_summary_"):
+        attributes["feature_summary_"] = gam.feature_summary_
+
+    params = {name: value for (name, value) in gam.get_params(deep=False).items() if name != "terms"}
+
+    arrays = dict()
+    metadata = {
+        "format_version": FORMAT_VERSION,
+        "package_version": importlib.metadata.version("generalized-additive-models"),
+        "estimator": type(gam).__name__,
+        "params": _encode(params, "params", arrays),
+        "attributes": _encode(attributes, "gam", arrays),
+    }
+
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array, allow_pickle=False)
+
+    # The metadata is written last, so a partially written model cannot be loaded
+    with open(os.path.join(path, METADATA_FILENAME), "w") as file:
+        json.dump(metadata, file)
+
+
+def load_model(path, mmap=True):
+    """Load a GAM saved with `save_model()`.
+
+    Returns the name of the estimator class, the parameters and the fitted
+    attributes of the GAM.
+    """
+    with open(os.path.join(path, METADATA_FILENAME)) as file:
+        metadata = json.load(file)
+
+    if metadata["format_version"] > FORMAT_VERSION:
+        msg = f"Model in {path} has format version {metadata['format_version']}, "
+        msg += f"but the newest format this version reads is {FORMAT_VERSION}. Upgrade the package."
+        raise ValueError(msg)
+
+    arrays = ArrayDirectory(path, mmap=mmap)
+    params = _decode(metadata["params"], arrays)
+    attributes = _decode(metadata["attributes"], arrays)
+    return metadata["estimator"], params, attributes
+
+
+# The basis of a constrained spline is a sum of the B-spline basis evaluated
+# at x and the mirrored B-spline basis evaluated at -x, see
+# `Spline._post_transform_basis_for_constraint()`. Every component is a
+# tuple (sign, mirrored, reversed columns).
+SPLINE_COMPONENTS = {
+    None: [(1, False, False)],
+    "increasing": [(1, False, False)],
+    "increasing-convex": [(1, False, False)],
+    "decreasing": [(-1, False, False)],
+    "decreasing-concave": [(-1, False, False)],
+    "decreasing-convex": [(1, True, False)],
+    "convex": [(1, False, False), (1, True, True)],
+    "increasing-concave": [(-1, True, False)],
+    "concave": [(-1, False, False), (-1, True, True)],
+}
+
+
+def _piecewise_polynomial(bspline, weights, extrapolation, reflect):
+    """Convert the B-spline basis times `weights` to polynomials between the
+    knots in the base interval, with coefficients in the power basis.
+
+    Examples
+    --------
+    >>> t = np.array([0, 0, 0, 1, 2, 2, 2], dtype=float)
+    >>> bspline = sp.interpolate.BSpline(t, np.eye(4), k=2)
+    >>> weights = np.array([[1.0], [2.0], [0.0], [1.0]])
+    >>> pp = _piecewise_polynomial(bspline, weights, "continue", reflect=False)
+    >>> x = np.linspace(0, 2, num=5)
+    >>> bool(np.allclose(pp(x), bspline(x) @ weights))
+    True
+    """
+    t, k = bspline.t, bspline.k
+    breaks = t[k : len(t) - k]
+    spline = sp.interpolate.BSpline(t, bspline.c @ weights, k)
+
+    # The Taylor expansion at the left end of every piece
+    coefficients = np.stack([spline(breaks[:-1], nu=k - j) / math.factorial(k - j) for j in range(k + 1)])
+    return scorer.PiecewisePolynomial(breaks, coefficients, extrapolation, reflect=reflect)
+
+
+def _feature(term, selector="feature"):
+    """Return the index and the name of the feature, or of the `by` variable."""
+    feature = getattr(term, selector)
+    if feature is None:
+        return None
+    return (getattr(term, f"{selector}_"), feature if isinstance(feature, str) else None)
+
+
+def _export_spline(spline, coef=None):
+    """Export a spline basis. With `coef`, the coefficients are folded into
+    a single piecewise polynomial."""
+    weights = np.eye(spline.num_coefficients) if coef is None else coef.reshape(-1, 1)
+
+    polynomials = []
+    for sign, mirrored, reversed_columns in SPLINE_COMPONENTS[spline.constraint]:
+        transformer = spline.spline_transformer_mirrored_ if mirrored else spline.spline_transformer_
+        component_weights = sign * (weights[::-1] if reversed_columns else weights)
+        (bspline,) = transformer.bsplines_
+        polynomials.append(_piecewise_polynomial(bspline, component_weights, transformer.extrapolation, mirrored))
+
+    shift = spline.basis_min_value_ @ weights
+    center = 0.0 if coef is None else spline.means_ @ coef
+    return scorer.Spline(
+        *_feature(spline),
+        polynomials=polynomials,
+        shift=shift,
+        center=center,
+        by=_feature(spline, "by"),
+        by_shift=getattr(spline, "min_by_", 0.0),
+    )
+
+
+def _export_categorical(categorical, coef=None):
+    encoder = categorical.onehotencoder_
+    (categories,) = encoder.categories_
+    columns = np.argmax(encoder.transform(categories.reshape(-1, 1)), axis=1)
+
+    # Unknown categories raise an error, map to the infrequent column if it
+    # exists and handle_unknown="infrequent_if_exist", or else to zeros
+    unknown_column = None
+    if encoder.handle_unknown != "error":
+        infrequent = encoder.infrequent_categories_[0] if encoder._infrequent_enabled else None
+        unknown_column = -1
+        if encoder.handle_unknown == "infrequent_if_exist" and infrequent is not None:
+            unknown_column = int(columns[np.isin(categories, infrequent)][0])
+
+    if categories.dtype == object:
+        if not all(isinstance(category, str) for category in categories):
+            raise ValueError(f"Categories must be strings or numbers to export a scorer: {categories}")
+        categories = categories.astype(str)
+
+    center = 0.0 if coef is None else categorical.means_ @ coef
+    return scorer.Categorical(
+        *_feature(categorical),
+        categories=categories,
+        columns=columns,
+        unknown_column=unknown_column,
+        coef=coef,
+        center=center,
+        by=_feature(categorical, "by"),
+    )
+
+
+def _export_term(term):
+    if isinstance(term, terms.Intercept):
+        return scorer.Intercept(float(term.coef_[0]))
+    if isinstance(term, terms.Linear):
+        return scorer.Linear(*_feature(term), coef=float(term.coef_[0]), by=_feature(term, "by"))
+    if isinstance(term, terms.Spline):
+        return _export_spline(term, coef=term.coef_)
+    if isinstance(term, terms.Categorical):
+        return _export_categorical(term, coef=term.coef_)
+    if isinstance(term, terms.Tensor):
+        marginals = [
+            _export_spline(marginal) if isinstance(marginal, terms.Spline) else _export_categorical(marginal)
+            for marginal in term
+        ]
+        center = term.means_ @ term.coef_ if any(isinstance(marginal, terms.Spline) for marginal in term) else 0.0
+        coef = term.coef_.reshape([marginal.num_coefficients for marginal in term])
+        return scorer.Tensor(marginals, coef=coef, center=center, by=_feature(term, "by"))
+
+    raise TypeError(f"Cannot export term to a scorer: {term}")
+
+
+def export_scorer(gam):
+    """Create a NumPy-only scorer from a fitted GAM, see `GAM.export_scorer()`."""
+    link = type(gam._link).__name__
+    if link not in scorer.INVERSE_LINKS:
+        raise ValueError(f"Cannot export link {gam._link} to a scorer.")
+
+    exported_terms = [_export_term(term) for term in gam.terms]
+    return scorer.Scorer(exported_terms, link=link, link_params=gam._link.get_params())
+
+
+if __name__ == "__main__":
+    import pytest
+
+    pytest.main(args=[__file__, "--doctest-modules", "-v", "--capture=sys"])
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A standalone scorer for fitted GAMs, created with `GAM.export_scorer()`.
+
+This module only imports NumPy and the standard library. An exported scorer
+is a directory with a copy of this module and a `scorer.npz` file, so it can
+be used for predictions where the package and its dependencies (sklearn,
+scipy, pandas, ...) are not installed:
+
+    import sys
+    sys.path.insert(0, path)
+    from scorer import Scorer
+    predictions = Scorer.load(path).predict(X)
+
+Splines are stored as polynomials between the knots, with coefficients in
+the power basis of each piece.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+SCORER_FORMAT_VERSION = 1
+SCORER_FILENAME = "scorer.npz"
+
+
+def _get_column(X, feature, name):
+    """Return a column of X by name (dict, DataFrame) or by index (array)."""
+    if name is not None and (isinstance(X, dict) or hasattr(X, "columns")):
+        return np.asarray(X[name])
+    if hasattr(X, "iloc"):
+        return np.asarray(X.iloc[:, feature])
+    return np.asarray(X)[:, feature]
+
+
+class PiecewisePolynomial:
+    """Piecewise polynomials evaluated with the extrapolation of B-splines.
+
+    `coefficients` has shape (degree + 1, num_pieces, num_outputs), and
+    coefficients[j, i] multiplies (x - breaks[i]) ** (degree - j) in piece i.
+    The polynomials are evaluated at -x if `reflect` is True.
+
+    Examples
+    --------
+    The function x**2 on [0, 2] with one piece, extrapolated linearly:
+
+    >>> coefficients = np.array([1.0, 0.0, 0.0]).reshape(3, 1, 1)
+    >>> pp = PiecewisePolynomial(np.array([0.0, 2.0]), coefficients, extrapolation="linear")
+    >>> pp(np.array([-1.0, 1.0, 3.0])).ravel()
+    array([0., 1., 8.])
+    >>> PiecewisePolynomial(np.array([0.0, 2.0]), coefficients, extrapolation="continue")(np.array([3.0])).ravel()
+    array([9.])
+    """
+
+    def __init__(self, breaks, coefficients, extrapolation, reflect=False):
+        self.breaks = breaks
+        self.coefficients = coefficients
+        self.extrapolation = extrapolation
+        self.reflect = reflect
+
+    def _evaluate(self, x, nu=0):
+        """Evaluate the polynomials, or their derivative if nu=1, at x."""
+        num_pieces = self.coefficients.shape[1]
+        piece = np.clip(np.searchsorted(self.breaks, x, side="right") - 1, 0, num_pieces - 1)
+        dx = (x - self.breaks[piece])[:, None]
+        coefficients = self.coefficients[:, piece, :]
+
+        # Horner's method, on the derivative of the polynomials if nu=1
+        degree = len(coefficients) - 1
+        result = np.zeros((len(x), coefficients.shape[2]))
+        for j, coefficient in enumerate(coefficients[: degree + 1 - nu]):
+            result = result * dx + coefficient * ((degree - j) if nu else 1)
+        return result
+
+    def __call__(self, x):
+        x = -x if self.reflect else x
+        low, high = self.breaks[0], self.breaks[-1]
+
+        if self.extrapolation == "periodic":
+            x = low + (x - low) % (high - low)
+        elif self.extrapolation == "error" and np.any((x < low) | (x > high)):
+            raise ValueError("X contains values beyond the limits of the knots.")
+
+        result = self._evaluate(x)
+        if self.extrapolation in ("linear", "constant"):
+            for boundary, mask in [(low, x < low), (high, x > high)]:
+                if not np.any(mask):
+                    continue
+                boundary = np.array([boundary])
+                result[mask] = self._evaluate(boundary)
+                if self.extrapolation == "linear":
+                    result[mask] += (x[mask] - boundary)[:, None] * self._evaluate(boundary, nu=1)
+        return result
+
+
+class Intercept:
+    def __init__(self, coef):
+        self.coef = coef
+
+    def __call__(self, X):
+        num_samples = len(X[next(iter(X))]) if isinstance(X, dict) else len(X)
+        return np.full(num_samples, self.coef)
+
+
+class Linear:
+    def __init__(self, feature, name, coef, by=None):
+        self.feature, self.name = feature, name
+        self.coef = coef
+        self.by = by
+
+    def __call__(self, X):
+        result = self.coef * _get_column(X, self.feature, self.name).astype(float)
+        if self.by is not None:
+            result = result * _get_column(X, *self.by).astype(float)
+        return result
+
+
+class Spline:
+    """A spline basis, which is a sum of piecewise polynomials, shifted by
+    `shift` and multiplied by the `by` column minus `by_shift`. As a term,
+    the coefficients are folded into the polynomials, which have a single
+    output, and `center` is subtracted."""
+
+    def __init__(self, feature, name, polynomials, shift, center=0.0, by=None, by_shift=0.0):
+        self.feature, self.name = feature, name
+        self.polynomials = polynomials
+        self.shift = shift
+        self.center = center
+        self.by = by
+        self.by_shift = by_shift
+
+    def basis(self, X):
+        x = _get_column(X, self.feature, self.name).astype(float)
+        result = sum(polynomial(x) for polynomial in self.polynomials) - self.shift
+        if self.by is not None:
+            result = result * (_get_column(X, *self.by).astype(float) - self.by_shift)[:, None]
+        return result
+
+    def __call__(self, X):
+        return self.basis(X)[:, 0] - self.center
+
+
+class Categorical:
+    """A categorical basis. Category `categories[i]` maps to the basis column
+    `columns[i]`, and unknown categories map to `unknown_column`, or raise
+    an error if it is None. The column -1 is all zeros. As a term, `coef`
+    has a coefficient per column, and `center` is subtracted."""
+
+    def __init__(self, feature, name, categories, columns, unknown_column, coef=None, center=0.0, by=None):
+        self.feature, self.name = feature, name
+        self.categories = categories
+        self.columns = columns
+        self.unknown_column = unknown_column
+        self.coef = coef
+        self.center = center
+        self.by = by
+
+    def _column_index(self, X):
+        x = _get_column(X, self.feature, self.name)
+        index = np.clip(np.searchsorted(self.categories, x), 0, len(self.categories) - 1)
+        known = self.categories[index] == x
+        if not np.all(known) and self.unknown_column is None:
+            raise ValueError(f"Found unknown categories {set(x[~known])} in column {self.name or self.feature}")
+        return np.where(known, self.columns[index], -1 if self.unknown_column is None else self.unknown_column)
+
+    def basis(self, X):
+        index = self._column_index(X)
+        result = (index[:, None] == np.arange(np.max(self.columns) + 1)).astype(float)
+        if self.by is not None:
+            result = result * _get_column(X, *self.by).astype(float)[:, None]
+        return result
+
+    def __call__(self, X):
+        result = np.append(self.coef, 0.0)[self._column_index(X)]
+        if self.by is not None:
+            result = result * _get_column(X, *self.by).astype(float)
+        return result - self.center
+
+
+class Tensor:
+    """A tensor product of marginal bases, with coefficients of shape
+    (num_basis_1, num_basis_2, ...)."""
+
+    def __init__(self, marginals, coef, center=0.0, by=None):
+        self.marginals = marginals
+        self.coef = coef
+        self.center = center
+        self.by = by
+
+    def __call__(self, X):
+        # Contract the coefficients with one marginal basis at a time
+        bases = [marginal.basis(X) for marginal in self.marginals]
+        result = np.einsum("ni,i...->n...", bases[0], self.coef)
+        for basis in bases[1:]:
+            result = np.einsum("ni,ni...->n...", basis, result)
+        if self.by is not None:
+            result = result * _get_column(X, *self.by).astype(float)
+        return result - self.center
+
+
+def _smooth_log_inverse(eta, a=1.5):
+    base = eta * (a - 1) + 1
+    result = np.zeros_like(base, dtype=float)
+    result[base > 0] = base[base > 0] ** (1 / (a - 1))
+    return result
+
+
+INVERSE_LINKS = {
+    "Identity": lambda eta: eta,
+    "Log": lambda eta: np.exp(eta),
+    "Logit": lambda eta, low=0, high=1: low + (high - low) * 0.5 * (1 + np.tanh(eta / 2)),
+    "CLogLogLink": lambda eta, low=0, high=1: high - (high - low) * np.exp(-np.exp(eta)),
+    "Inverse": lambda eta: 1.0 / eta,
+    "InvSquared": lambda eta: 1.0 / np.sqrt(eta),
+    "SmoothLog": _smooth_log_inverse,
+    "Softplus": lambda eta, a=1: np.maximum(0, eta) + np.log1p(np.exp(-a * np.abs(eta))) / a,
+}
+
+
+class Scorer:
+    """Predict with a fitted GAM, using NumPy only.
+
+    Examples
+    --------
+    >>> from generalized_additive_models import GAM, Spline
+    >>> rng = np.random.default_rng(42)
+    >>> X = rng.normal(size=(100, 1))
+    >>> y = np.exp(np.sin(X).ravel())
+    >>> gam = GAM(Spline(0), link="log").fit(X, y)
+    >>> scorer = gam.export_scorer()
+    >>> bool(np.allclose(scorer.predict(X), gam.predict(X)))
+    True
+    """
+
+    def __init__(self, terms, link, link_params=None):
+        self.terms = terms
+        self.link = link
+        self.link_params = link_params or dict()
+
+    def predict(self, X):
+        """Predict the expected value with the model.
+
+        Parameters
+        ----------
+        X : np.ndarray, dict or pd.DataFrame
+            A dataset to predict on. Features that were named at fit time
+            are looked up by name in dicts and DataFrames.
+
+        Returns
+        -------
+        np.ndarray
+            An array with predictions.
+        """
+        linear_prediction = sum(term(X) for term in self.terms)
+        return INVERSE_LINKS[self.link](linear_prediction, **self.link_params)
+
+    def save(self, path):
+        """Save the scorer and a copy of this module to the directory `path`."""
+        arrays = dict()
+
+        def encode(value, key):
+            if isinstance(value, np.ndarray):
+                arrays[key] = value
+                return {"array": key}
+            if isinstance(value, np.generic):
+                return value.item()
+            if isinstance(value, (list, tuple)):
+                return [encode(item, f"{key}.{i}") for i, item in enumerate(value)]
+            if isinstance(value, dict):
+                return {k: encode(v, f"{key}.{k}") for k, v in value.items()}
+            if hasattr(value, "__dict__"):
+                return {"class": type(value).__name__, "attributes": encode(vars(value), key)}
+            return value
+
+        metadata = {"format_version": SCORER_FORMAT_VERSION, "scorer": encode(self, "scorer")}
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, SCORER_FILENAME), metadata=np.array(json.dumps(metadata)), **arrays)
+
+        # A scorer loaded from an exported directory is already next to this module
+        module = os.path.join(path, "scorer.py")
+        if not (os.path.exists(module) and os.path.samefile(__file__, module)):
+            shutil.copyfile(__file__, module)
+
+    @classmethod
+    def load(cls, path):
+        """Load a scorer saved with `save()`."""
+        with np.load(os.path.join(path, SCORER_FILENAME), allow_pickle=False) as file:
+            arrays = dict(file)
+        metadata = json.loads(str(arrays.pop("metadata")))
+
+        if metadata["format_version"] > SCORER_FORMAT_VERSION:
+            raise ValueError(f"Scorer in {path} has format version {metadata['format_version']}.")
+
+        classes = [cls, PiecewisePolynomial, Intercept, Linear, Spline, Categorical, Tensor]
+        classes = {klass.__name__: klass for klass in classes}
+
+        def decode(value):
+            if isinstance(value, list):
+                return [decode(item) for item in value]
+            if not isinstance(value, dict):
+                return value
+            if "array" in value:
+                return arrays[value["array"]]
+            if "class" in value:
+                instance = object.__new__(classes[value["class"]])
+                instance.__dict__.update(decode(value["attributes"]))
+                return instance
+            return {k: decode(v) for k, v in value.items()}
+
+        return decode(metadata["scorer"])
@@ -7,10 +7,120 @@ Created on Thu Feb 23 07:15:31 2023
 """
 
 import numpy as np
+import scipy as sp
 from sklearn.preprocessing import SplineTransformer as SklearnSplineTransformer
 from sklearn.utils.validation import FLOAT_DTYPES, check_is_fitted
 
 
+def uniform_bspline_basis(X, starts, spacings, *, degree, n_splines, extrapolation):
+    """Evaluate B-spline bases with uniformly spaced knots in closed form.
+
+    With uniform knots t_j = start + j * spacing, the knot interval of a
+    sample is found by arithmetic. Within an interval, the `degree + 1`
+    non-zero B-splines are fixed polynomials in the local coordinate
+    u = (x - t_i) / spacing, which are evaluated with the Cox-de Boor
+    recursion on u. Every feature (column of X) has its own knots, so several
+    features are evaluated in one vectorized call.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        An array of shape (n_samples, n_features).
+    starts : np.ndarray
+        The first knot for each feature, of shape (n_features,).
+    spacings : np.ndarray
+        The distance between knots for each feature, of shape (n_features,).
+    degree : int
+        The degree of the B-splines.
+    n_splines : int
+        The number of B-splines per feature.
+    extrapolation : str
+        One of 'error', 'constant', 'linear', 'continue' or 'periodic', see
+        the sklearn SplineTransformer.
+
+    Returns
+    -------
+    np.ndarray
+        An array of shape (n_samples, n_features, n_splines).
+
+    Examples
+    --------
+    >>> X = np.linspace(0, 1, num=5).reshape(-1, 1)
+    >>> transformer = SplineTransformer(n_knots=3, degree=1).fit(X)
+    >>> starts, spacings = transformer._uniform_knots()
+    >>> basis = uniform_bspline_basis(X, starts, spacings, degree=1, n_splines=3, extrapolation="constant")
+    >>> basis[:, 0, :]
+    array([[1. , 0. , 0. ],
+           [0.5, 0.5, 0. ],
+           [0. , 1. , 0. ],
+           [0. , 0.5, 0.5],
+           [0. , 0. , 1. ]])
+    """
+    X = np.asarray(X, dtype=float)
+    n_samples, n_features = X.shape
+    periodic = extrapolation == "periodic"
+
+    # The base interval [xmin, xmax] is [t_k, t_n]. Periodic splines have
+    # `degree` more knot intervals, and the B-splines wrap around.
+    n = n_splines + degree * periodic
+    xmin, xmax = starts + degree * spacings, starts + n * spacings
+
+    if periodic:
+        X = xmin + (X - xmin) % (xmax - xmin)
+
+    # The position of each sample in units of knot spacings from the first
+    # knot. Samples on the boundary knots may end up slightly outside due to
+    # rounding, so they are moved onto the boundary.
+    position = (X - starts) / spacings
+    inside = (position > degree - 1e-9) & (position < n + 1e-9)
+    position = np.where(inside, np.clip(position, degree, n), position)
+
+    if extrapolation == "error" and not np.all(inside):
+        raise ValueError("X contains values beyond the limits of the knots.")
+
+    # Constant and linear extrapolation start from the values at the boundary
+    position_inside = np.clip(position, degree, n) if extrapolation in ("constant", "linear") else position
+
+    # The knot interval of each sample, and the local coordinate within it.
+    # Samples beyond the base interval use the polynomial of the closest one.
+    interval = np.clip(np.floor(position_inside), degree, n - 1).astype(int)
+    u = position_inside - interval
+
+    # Cox-de Boor recursion for uniform knots. With t_i = 0 and unit spacing
+    # the knot differences are (r + 1 - u) and (u + j - r - 1), and they sum
+    # to j. The basis of degree - 1 is kept for the derivatives.
+    values, values_lower = [np.ones_like(u)], []
+    for j in range(1, degree + 1):
+        values_lower, values, saved = values, [], 0
+        for r in range(j):
+            temp = values_lower[r] / j
+            values.append(saved + (r + 1 - u) * temp)
+            saved = (u + j - r - 1) * temp
+        values.append(saved)
+
+    if extrapolation == "linear":
+        # Continue linearly beyond the boundaries, with slope equal to the
+        # derivative B'_{j, k} = (B_{j, k-1} - B_{j+1, k-1}) / spacing. The
+        # distance is in units of spacings, so the spacing cancels.
+        distance = position - position_inside
+        for r in range(1, degree + 1):
+            values[r] = values[r] + distance * values_lower[r - 1]
+            values[r - 1] = values[r - 1] - distance * values_lower[r - 1]
+
+    # Scatter the non-zero values into the flat basis. Periodic splines wrap
+    # around, and with fewer splines than `degree + 1` the values are added.
+    XBS = np.zeros((n_samples, n_features, n_splines), dtype=float)
+    offsets = np.arange(n_samples * n_features).reshape(n_samples, n_features) * n_splines
+    for r in range(degree + 1):
+        indices = offsets + (interval - degree + r) % n_splines
+        if n_splines < degree + 1:
+            np.add.at(XBS.reshape(-1), indices, values[r])
+        else:
+            XBS.reshape(-1)[indices] = values[r]
+
+    return XBS
+
+
 # The sklearn SplineTransformer does not extrapolate properly when the
 # splines are antidifferentiated. Splines are local by nature, and sklearn
 # is smart enough not to extrapolate splines 'in the middle', since they
@@ -19,6 +129,30 @@ from sklearn.utils.validation import FLOAT_DTYPES, check_is_fitted
 # be extrapolated as constants. Below we subclass the SplineTransformer
 # from sklearn and fix this issue in the transform() method.
 class SplineTransformer(SklearnSplineTransformer):
+    def _uniform_knots(self):
+        """Return the first knot and the knot spacing of every feature.
+
+        Returns None unless every feature has uniformly spaced knots and a
+        plain B-spline basis, e.g. not after antidifferentiation.
+        """
+        check_is_fitted(self)
+        starts, spacings = [], []
+        for spl in self.bsplines_:
+            n_splines = spl.c.shape[1]
+            spacing = (spl.t[-1] - spl.t[0]) / (len(spl.t) - 1)
+            if spl.k != self.degree or not np.allclose(np.diff(spl.t), spacing, rtol=1e-9, atol=0):
+                return None
+
+            # The coefficients are the identity (wrapped around if periodic)
+            coef = np.eye(n_splines)[np.arange(spl.c.shape[0]) % n_splines]
+            if not np.array_equal(spl.c, coef):
+                return None
+
+            starts.append(spl.t[0])
+            spacings.append(spacing)
+
+        return np.array(starts), np.array(spacings)
+
     def transform(self, X):
         """Transform each feature data to B-splines.
 
@@ -34,6 +168,12 @@ class SplineTransformer(SklearnSplineTransformer):
             elements of the B-splines, n_knots + degree - 1.
         """
         check_is_fitted(self)
+
+        # Uniform knots are evaluated in closed form, for all features at once
+        uniform_knots = self._uniform_knots()
+        if uniform_knots is not None:
+            return self._transform_uniform(X, *uniform_knots)
+
         # NOT WORKING FOR ME
         # AttributeError: 'SplineTransformer' object has no attribute 'validate_data'. Did you mean: '_validate_params'?
         # X = self.validate_data(X, reset=False, accept_sparse=False, ensure_2d=True)
@@ -135,6 +275,116 @@ class SplineTransformer(SklearnSplineTransformer):
             indices = [j for j in range(XBS.shape[1]) if (j + 1) % n_splines != 0]
             return XBS[:, indices]
 
+    def _transform_uniform(self, X, starts, spacings):
+        """Transform with `uniform_bspline_basis`, see `transform()`."""
+        n_samples, n_features = X.shape
+        n_splines = self.bsplines_[0].c.shape[1]
+        XBS = uniform_bspline_basis(
+            X,
+            starts,
+            spacings,
+            degree=self.degree,
+            n_splines=n_splines,
+            extrapolation=self.extrapolation,
+        ).reshape(n_samples, n_features * n_splines)
+
+        if not self.include_bias:
+            indices = [j for j in range(XBS.shape[1]) if (j + 1) % n_splines != 0]
+            XBS = XBS[:, indices]
+
+        return np.asarray(XBS, order=self.order)
+
+    def transform_sparse(self, X):
+        """Transform each feature data to B-splines, returning a sparse array.
+
+        A B-spline basis of degree `k` has local support, so each row has at
+        most `k + 1` non-zero entries. The basis is built directly from the
+        knots in `bsplines_`, and a dense basis is never formed.
+
+        Parameters
+        ----------
+        X : array-like of shape (n_samples, n_features)
+            The data to transform.
+
+        Returns
+        -------
+        XBS : scipy.sparse.csr_array of shape (n_samples, n_features * n_splines)
+            The same matrix as returned by `transform`, in CSR format.
+
+        Examples
+        --------
+        >>> X = np.linspace(-1, 2, num=7).reshape(-1, 1)
+        >>> transformer = SplineTransformer(n_knots=3, degree=1, extrapolation="linear")
+        >>> transformer = transformer.fit(X[1:-1])
+        >>> XBS = transformer.transform_sparse(X)
+        >>> XBS.nnz
+        11
+        >>> bool(np.allclose(XBS.toarray(), transformer.transform(X)))
+        True
+        """
+        check_is_fitted(self)
+        X = np.asarray(X, dtype=float)
+        n_samples, n_features = X.shape
+        n_splines = self.bsplines_[0].c.shape[1]
+
+        XBS = sp.sparse.hstack(
+            [self._transform_feature_sparse(self.bsplines_[i], X[:, i]) for i in range(n_features)],
+            format="csr",
+        )
+
+        if self.include_bias:
+            return XBS
+        else:
+            indices = [j for j in range(XBS.shape[1]) if (j + 1) % n_splines != 0]
+            return XBS[:, indices]
+
+    def _transform_feature_sparse(self, spl, x):
+        """Evaluate a single BSpline with coefficients `spl.c` on `x` as a CSR array."""
+        n_samples = len(x)
+        n_splines = spl.c.shape[1]
+
+        # The base interval [xmin, xmax] of the knot vector. A BSpline may
+        # carry trailing coefficients beyond the `n` basis functions, and
+        # these are ignored (like scipy does when evaluating).
+        k = spl.k
+        n = spl.t.size - k - 1
+        xmin, xmax = spl.t[k], spl.t[n]
+        coef = sp.sparse.csr_array(spl.c[:n])
+
+        if self.extrapolation == "periodic":
+            x = xmin + (x - xmin) % (xmax - xmin)
+            return sp.sparse.csr_array(sp.interpolate.BSpline.design_matrix(x, spl.t, k) @ coef)
+
+        elif self.extrapolation == "continue":
+            return sp.sparse.csr_array(sp.interpolate.BSpline.design_matrix(x, spl.t, k, extrapolate=True) @ coef)
+
+        mask = (xmin <= x) & (x <= xmax)
+        if self.extrapolation == "error" and not np.all(mask):
+            raise ValueError("X contains values beyond the limits of the knots.")
+
+        # Evaluate the samples within the base interval
+        XBS = sp.sparse.coo_array(sp.interpolate.BSpline.design_matrix(x[mask], spl.t, k) @ coef)
+        rows, cols, data = [np.flatnonzero(mask)[XBS.row]], [XBS.col], [XBS.data]
+
+        # Extrapolate beyond the boundaries. Only the splines that are non-zero
+        # (or have non-zero derivatives) at a boundary are extrapolated.
+        for outside, boundary in ((x < xmin, xmin), (x > xmax, xmax)):
+            if not np.any(outside):
+                continue
+
+            f = spl(boundary)
+            fp = spl(boundary, nu=1) if self.extrapolation == "linear" else np.zeros_like(f)
+            (nonzero,) = np.nonzero((f != 0) | (fp != 0))
+
+            outside_rows = np.flatnonzero(outside)
+            values = f[nonzero] + (x[outside_rows] - boundary)[:, None] * fp[nonzero]
+            rows.append(np.repeat(outside_rows, len(nonzero)))
+            cols.append(np.tile(nonzero, len(outside_rows)))
+            data.append(values.ravel())
+
+        shape = (n_samples, n_splines)
+        return sp.sparse.csr_array((np.hstack(data), (np.hstack(rows), np.hstack(cols))), shape=shape)
+
 
 if __name__ == "__main__":
     # from sklearn.preprocessing import SplineTransformer
@@ -5,6 +5,7 @@
 https://www.uio.no/studier/emner/matnat/ifi/nedlagte-emner/INF-MAT5340/v05/undervisningsmateriale/hele.pdf
 
 """
+
 import copy
 import functools
 from abc import ABC, abstractmethod
@@ -20,8 +21,14 @@ from sklearn.utils._param_validation import Interval, StrOptions
 from sklearn.utils.validation import _get_feature_names, check_is_fitted
 
 from generalized_additive_models.penalties import second_order_finite_difference
-from generalized_additive_models.splinetransformer import SplineTransformer
-from generalized_additive_models.utils import tensor_product
+from generalized_additive_models.splinetransformer import SplineTransformer, uniform_bspline_basis
+from generalized_additive_models.utils import (
+    DataSketch,
+    DiscretizedModelMatrix,
+    discretize,
+    tensor_product,
+    weighted_percentile,
+)
 
 
 class Term(ABC):
@@ -39,9 +46,59 @@ class Term(ABC):
         pass
 
     @abstractmethod
-    def penalty_matrix(self):
+    def penalty_matrix(self, sparse=False):
         pass
 
+    @abstractmethod
+    def _compile(self, X):
+        """Resolve the columns of `X` once, and return a transformation kernel.
+
+        Returns a tuple (columns, kernel). The `columns` are the column
+        indices that the term reads, and `kernel(columns, out)` writes the
+        transformed data into `out`, given a dict from column index to a 1D
+        array. Used by `TermList.compile()`.
+        """
+
+    def __getattr__(self, name):
+        # The edof and the covariance of a fitted term are sliced from the
+        # results of the GAM when first looked up, since the results compute
+        # them lazily. See `GAM._assign_coefficients_to_terms()`.
+        results = self.__dict__.get("_results")
+        key = {"edof_": "edof_per_coef", "coef_covar_": "covariance"}.get(name)
+        if key is None or results is None or key not in results:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+        idx = self.__dict__["coef_idx_"]
+        value = results[key][idx] if name == "edof_" else results[key][np.ix_(idx, idx)]
+        setattr(self, name, value)
+        return value
+
+    def transform_sparse(self, X):
+        """Transform the input to a sparse CSR array, without centering.
+
+        The dense basis returned by `transform()` equals the basis returned
+        by this method minus the column offsets of the term (typically the
+        column means learned during fitting). Subclasses with sparse bases
+        override this method, so that no dense basis is formed.
+
+        Parameters
+        ----------
+        X : np.ndarray or pd.DataFrame
+            A dataset of shape (num_samples, num_features).
+
+        Returns
+        -------
+        scipy.sparse.csr_array
+            A sparse basis of shape (num_samples, num_coefficients).
+
+        """
+        return sp.sparse.csr_array(self.transform(X) + self._column_offsets())
+
+    def _column_offsets(self):
+        """Return the constants that `transform()` subtracts from each column."""
+        offsets = np.asarray(getattr(self, "means_", 0.0), dtype=float)
+        return np.broadcast_to(offsets, (self.num_coefficients,)).copy()
+
     def _get_column(self, X, selector="feature"):
         # A Tensor can select several columns, so we recursively do that
         if isinstance(self, Tensor) and selector == "feature":
@@ -211,9 +268,10 @@ class Intercept(TransformerMixin, Term, BaseEstimator):
         """Number of coefficients for the term."""
         return 1
 
-    def penalty_matrix(self):
+    def penalty_matrix(self, sparse=False):
         """Return the penalty matrix for the term. Intercepts have no penalty."""
-        return np.array([[0.0]])
+        penalty_matrix = sp.sparse.csr_array((1, 1), dtype=float)
+        return penalty_matrix if sparse else penalty_matrix.toarray()
 
     def fit(self, X):
         """Fit to data.
@@ -254,6 +312,14 @@ class Intercept(TransformerMixin, Term, BaseEstimator):
         n_samples, n_features = X.shape
         return np.ones(n_samples)[:, None]
 
+    def _compile(self, X):
+        check_is_fitted(self)
+
+        def kernel(columns, out):
+            out.fill(1.0)
+
+        return [], kernel
+
 
 class Linear(TransformerMixin, Term, BaseEstimator):
     """A linear term.
@@ -373,10 +439,11 @@ class Linear(TransformerMixin, Term, BaseEstimator):
         """Number of coefficients for the term."""
         return 1
 
-    def penalty_matrix(self):
+    def penalty_matrix(self, sparse=False):
         """Return the penalty matrix for the term."""
         super()._validate_params()  # Validate the 'penalty' parameter
-        return np.sqrt(self.penalty) * np.array([[1.0]])
+        penalty_matrix = np.sqrt(self.penalty) * sp.sparse.eye_array(1, format="csr")
+        return penalty_matrix if sparse else penalty_matrix.toarray()
 
     def fit(self, X):
         """Fit to data.
@@ -446,6 +513,18 @@ class Linear(TransformerMixin, Term, BaseEstimator):
 
         return basis_matrix
 
+    def _compile(self, X):
+        check_is_fitted(self)
+        self._validate_params(X)
+        feature, by = self.feature_, (self.by_ if self.by is not None else None)
+
+        def kernel(columns, out):
+            out[:, 0] = columns[feature]
+            if by is not None:
+                out[:, 0] *= columns[by]
+
+        return [feature] + ([] if by is None else [by]), kernel
+
 
 class Spline(TransformerMixin, Term, BaseEstimator):
     """A Spline term.
@@ -684,26 +763,44 @@ class Spline(TransformerMixin, Term, BaseEstimator):
         """Number of coefficients for the term."""
         return self.num_splines
 
-    def penalty_matrix(self):
+    def penalty_matrix(self, sparse=False):
         """Return the penalty matrix for the term."""
         super()._validate_params()  # Validate 'penalty' and 'num_coefficients'
 
         # The penalty for second order derivative
         periodic = self.extrapolation == "periodic"
-        D = second_order_finite_difference(self.num_coefficients, periodic=periodic)
+        D = second_order_finite_difference(self.num_coefficients, periodic=periodic, sparse=True)
         D = D * np.sqrt(self.penalty)
 
         # No l2-penalty
         if self.l2_penalty == 0:
             assert D.shape[1] == self.num_coefficients
-            return D
+            return D if sparse else D.toarray()
         else:
             # The l2 penalty on the coefficients
-            P = np.eye(self.num_coefficients)
+            P = sp.sparse.eye_array(self.num_coefficients, format="csr")
             P = P * np.sqrt(self.l2_penalty)
-            penalty_matrix = np.vstack((D, P))
+            penalty_matrix = sp.sparse.vstack((D, P), format="csr")
             assert penalty_matrix.shape[1] == self.num_coefficients
-            return penalty_matrix
+            return penalty_matrix if sparse else penalty_matrix.toarray()
+
+    def _evaluate_basis(self, X_feature):
+        """Evaluate the spline basis on a column, before shifting and centering.
+
+        Returns the bounds and the basis, see `_post_transform_basis_for_constraint`.
+        The mirrored basis is only evaluated for the constraints that use it.
+        """
+        if self.constraint in ("decreasing-convex", "convex", "increasing-concave", "concave"):
+            basis_matrix_mirrored = self.spline_transformer_mirrored_.transform(-X_feature)
+        else:
+            basis_matrix_mirrored = None
+
+        return self._post_transform_basis_for_constraint(
+            constraint=self.constraint,
+            basis_matrix=self.spline_transformer_.transform(X_feature),
+            basis_matrix_mirrored=basis_matrix_mirrored,
+            X_feature=X_feature,
+        )
 
     def _post_transform_basis_for_constraint(self, *, constraint, basis_matrix, basis_matrix_mirrored, X_feature):
         """Transform basis matrices to comply with constraints.
@@ -788,6 +885,34 @@ class Spline(TransformerMixin, Term, BaseEstimator):
                [0. , 0. , 1. ]])
 
         """
+        self._fit_basis(X)
+        return self
+
+    def fit_transform(self, X, y=None):
+        """Fit to data, then transform it.
+
+        Equivalent to `fit(X).transform(X)`, but the spline basis is only
+        evaluated once.
+
+        Examples
+        --------
+        >>> X = np.linspace(0, 1, num=9).reshape(-1, 1)
+        >>> spline = Spline(0, num_splines=4, constraint="increasing")
+        >>> basis_matrix = spline.fit_transform(X)
+        >>> bool(np.allclose(basis_matrix, spline.transform(X)))
+        True
+        """
+        basis_matrix = self._fit_basis(X)
+
+        # With `edges`, the basis was only evaluated within the edges
+        if self.edges is not None:
+            return self.transform(X)
+
+        return basis_matrix - self.means_
+
+    def _fit_basis(self, X, sample_weight=None):
+        """Fit to data and return the basis before it is centered by `means_`.
+        With `sample_weight`, quantile knots and means are weighted."""
         self._validate_params(X)  # Get feature names, validate parameters
         num_samples, num_features = X.shape
 
@@ -805,26 +930,34 @@ class Spline(TransformerMixin, Term, BaseEstimator):
         # https://github.com/scikit-learn/scikit-learn/blob/7db5b6a98ac6ad0976a3364966e214926ca8098a/sklearn/preprocessing/_polynomial.py#L470
         n_knots = self.num_splines + 1 - (self.degree - degree_adjustment) * (self.extrapolation != "periodic")
 
+        # Select data within the edges
+        if self.edges is not None:
+            low, high = self.edges
+            mask = (X_feature >= low) & (X_feature <= high)
+            X_feature_masked = X_feature[mask].reshape(-1, 1)
+            sample_weight = None if sample_weight is None else sample_weight[mask.ravel()]
+        else:
+            X_feature_masked = X_feature.reshape(-1, 1)
+
+        # Weighted quantile knots are computed here, and passed as positions
+        knots, knots_mirrored = self.knots, self.knots
+        if sample_weight is not None and self.knots == "quantile":
+            percentiles = np.linspace(0, 100, num=n_knots)
+            knots = weighted_percentile(X_feature_masked.ravel(), percentiles, sample_weight=sample_weight)
+            knots, knots_mirrored = knots.reshape(-1, 1), -knots[::-1].reshape(-1, 1)
+
         # Set up two spline transformers
         # - The first one is fit on the data ordinarity
         # - The second one is fit on the mirrored data
         self.spline_transformer_ = SplineTransformer(
             n_knots=n_knots,
             degree=self.degree - degree_adjustment,
-            knots=self.knots,
+            knots=knots,
             extrapolation=self.extrapolation,
             include_bias=True,
             order="C",
         )
-        self.spline_transformer_mirrored_ = clone(self.spline_transformer_)
-
-        # Select data within the edges
-        if self.edges is not None:
-            low, high = self.edges
-            mask = (X_feature >= low) & (X_feature <= high)
-            X_feature_masked = X_feature[mask].reshape(-1, 1)
-        else:
-            X_feature_masked = X_feature.reshape(-1, 1)
+        self.spline_transformer_mirrored_ = clone(self.spline_transformer_).set_params(knots=knots_mirrored)
 
         # Fit both spline transformers
         self.spline_transformer_.fit(X_feature_masked)
@@ -846,16 +979,7 @@ class Spline(TransformerMixin, Term, BaseEstimator):
             self.spline_transformer_mirrored_.degree += degree_adjustment
 
         # Generate basis matrix
-        (
-            self._lower_bound,
-            self._upper_bound,
-            basis_matrix,
-        ) = self._post_transform_basis_for_constraint(
-            constraint=self.constraint,
-            basis_matrix=self.spline_transformer_.transform(X_feature_masked),
-            basis_matrix_mirrored=self.spline_transformer_mirrored_.transform(-X_feature_masked),
-            X_feature=X_feature,
-        )
+        self._lower_bound, self._upper_bound, basis_matrix = self._evaluate_basis(X_feature_masked)
 
         # Shift the spline basis so every column has 0 as the lowest value
         self.basis_min_value_ = np.min(basis_matrix, axis=0)
@@ -870,9 +994,9 @@ class Spline(TransformerMixin, Term, BaseEstimator):
             self.min_by_ = np.min(by_column)
             basis_matrix = basis_matrix * (by_column - self.min_by_)
 
-        self.means_ = np.mean(basis_matrix, axis=0)
+        self.means_ = np.average(basis_matrix, axis=0, weights=sample_weight)
 
-        return self
+        return basis_matrix
 
     def transform(self, X):
         """Transform the input.
@@ -913,16 +1037,7 @@ class Spline(TransformerMixin, Term, BaseEstimator):
 
         X_feature = self._get_column(X, selector="feature")
 
-        (
-            self._lower_bound,
-            self._upper_bound,
-            basis_matrix,
-        ) = self._post_transform_basis_for_constraint(
-            constraint=self.constraint,
-            basis_matrix=self.spline_transformer_.transform(X_feature),
-            basis_matrix_mirrored=self.spline_transformer_mirrored_.transform(-X_feature),
-            X_feature=X_feature,
-        )
+        self._lower_bound, self._upper_bound, basis_matrix = self._evaluate_basis(X_feature)
         assert basis_matrix.shape == (num_samples, self.num_coefficients)
 
         # Apply the same centering that was done during fitting
@@ -942,6 +1057,125 @@ class Spline(TransformerMixin, Term, BaseEstimator):
         basis_matrix = basis_matrix - self.means_
         return basis_matrix
 
+    def _compile(self, X):
+        check_is_fitted(self)
+        self._validate_params(X)
+        feature, by = self.feature_, (self.by_ if self.by is not None else None)
+
+        def kernel(columns, out):
+            _, _, basis_matrix = self._evaluate_basis(columns[feature].reshape(-1, 1))
+            np.subtract(basis_matrix, self.basis_min_value_, out=out)
+            if by is not None:
+                out *= (columns[by] - self.min_by_)[:, None]
+            out -= self.means_
+
+        return [feature] + ([] if by is None else [by]), kernel
+
+    def _batch_key(self):
+        """Splines with equal keys can be evaluated in one batched call.
+
+        Returns None unless the spline is unconstrained, with uniform knots.
+        """
+        transformer = self.spline_transformer_
+        if self.constraint is not None or transformer._uniform_knots() is None:
+            return None
+        return (transformer.degree, transformer.bsplines_[0].c.shape[1], transformer.extrapolation)
+
+    @staticmethod
+    def _compile_batch(splines, X):
+        """Compile splines with equal `_batch_key()` into one kernel.
+
+        Works like `_compile()`, but `kernel(columns, *out)` writes the basis
+        of every spline into its own array in `out`. All the bases are
+        evaluated in one call to `uniform_bspline_basis`.
+        """
+        for spline in splines:
+            check_is_fitted(spline)
+            spline._validate_params(X)
+
+        features = [spline.feature_ for spline in splines]
+        bys = [spline.by_ if spline.by is not None else None for spline in splines]
+
+        transformers = [spline.spline_transformer_ for spline in splines]
+        starts, spacings = (np.hstack(knots) for knots in zip(*(t._uniform_knots() for t in transformers)))
+        degree, n_splines, extrapolation = splines[0]._batch_key()
+
+        def kernel(columns, *out):
+            X_batch = np.column_stack([columns[feature] for feature in features])
+            basis = uniform_bspline_basis(
+                X_batch, starts, spacings, degree=degree, n_splines=n_splines, extrapolation=extrapolation
+            )
+            for j, (spline, by, spline_out) in enumerate(zip(splines, bys, out)):
+                np.subtract(basis[:, j, :], spline.basis_min_value_, out=spline_out)
+                if by is not None:
+                    spline_out *= (columns[by] - spline.min_by_)[:, None]
+                spline_out -= spline.means_
+
+        return features + [by for by in bys if by is not None], kernel
+
+    def transform_sparse(self, X):
+        """Transform the input to a sparse CSR array, without centering.
+
+        Each row of an unconstrained B-spline basis has at most `degree + 1`
+        non-zero entries. The basis is evaluated directly into a CSR array,
+        and equals `transform(X) + means_`.
+
+        Parameters
+        ----------
+        X : np.ndarray
+            An ndarray with 2 dimensions of shape (n_samples, n_features).
+
+        Returns
+        -------
+        scipy.sparse.csr_array
+            A sparse spline basis of shape (n_samples, num_splines).
+
+        Examples
+        --------
+        >>> spline = Spline(0, num_splines=4, degree=1)
+        >>> X = np.linspace(0, 1, num=7).reshape(-1, 1)
+        >>> basis = spline.fit(X).transform_sparse(X)
+        >>> basis.nnz
+        10
+        >>> basis.toarray()
+        array([[1. , 0. , 0. , 0. ],
+               [0.5, 0.5, 0. , 0. ],
+               [0. , 1. , 0. , 0. ],
+               [0. , 0.5, 0.5, 0. ],
+               [0. , 0. , 1. , 0. ],
+               [0. , 0. , 0.5, 0.5],
+               [0. , 0. , 0. , 1. ]])
+        >>> bool(np.allclose(basis.toarray() - spline.means_, spline.transform(X)))
+        True
+        """
+        # Constrained splines are integrated B-splines, which do not have
+        # local support. There is little to gain, so use the dense basis.
+        if self.constraint is not None:
+            return super().transform_sparse(X)
+
+        check_is_fitted(self)
+        self._validate_params(X)  # Get feature names, validate parameters
+        num_samples, num_features = X.shape
+
+        X_feature = self._get_column(X, selector="feature")
+        basis_matrix = self.spline_transformer_.transform_sparse(X_feature)
+
+        # Apply the same shift as was done during fitting. The shift is
+        # typically zero for unconstrained splines, since every B-spline
+        # vanishes somewhere in the data. If not, the rank-one update only
+        # fills in the shifted columns.
+        if np.any(self.basis_min_value_ != 0):
+            shift = sp.sparse.csr_array(self.basis_min_value_.reshape(1, -1))
+            basis_matrix = basis_matrix - sp.sparse.csr_array(np.ones((num_samples, 1))) @ shift
+
+        # Set the 'by' variable
+        if self.by is not None:
+            by_column = self._get_column(X, selector="by")
+            basis_matrix = sp.sparse.csr_array(basis_matrix.multiply(by_column - self.min_by_))
+
+        assert basis_matrix.shape == (num_samples, self.num_coefficients)
+        return basis_matrix
+
 
 class Tensor(TransformerMixin, Term, BaseEstimator):
     """A Tensor term.
@@ -993,20 +1227,20 @@ class Tensor(TransformerMixin, Term, BaseEstimator):
     array([[ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-           [ 1.,  0.,  0., -2., -0., -0.,  1.,  0.,  0.],
-           [ 0.,  1.,  0., -0., -2., -0.,  0.,  1.,  0.],
-           [ 0.,  0.,  1., -0., -0., -2.,  0.,  0.,  1.],
+           [ 1.,  0.,  0., -2.,  0.,  0.,  1.,  0.,  0.],
+           [ 0.,  1.,  0.,  0., -2.,  0.,  0.,  1.,  0.],
+           [ 0.,  0.,  1.,  0.,  0., -2.,  0.,  0.,  1.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-           [ 1., -2.,  1.,  0., -0.,  0.,  0., -0.,  0.],
+           [ 1., -2.,  1.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-           [ 0., -0.,  0.,  1., -2.,  1.,  0., -0.,  0.],
+           [ 0.,  0.,  0.,  1., -2.,  1.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-           [ 0., -0.,  0.,  0., -0.,  0.,  1., -2.,  1.],
+           [ 0.,  0.,  0.,  0.,  0.,  0.,  1., -2.,  1.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.]])
 
     Imagine a matrix of coefficients that looks like this:
@@ -1030,20 +1264,20 @@ class Tensor(TransformerMixin, Term, BaseEstimator):
     array([[ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-           [ 3.,  0.,  0., -6., -0., -0.,  3.,  0.,  0.],
-           [ 0.,  3.,  0., -0., -6., -0.,  0.,  3.,  0.],
-           [ 0.,  0.,  3., -0., -0., -6.,  0.,  0.,  3.],
+           [ 3.,  0.,  0., -6.,  0.,  0.,  3.,  0.,  0.],
+           [ 0.,  3.,  0.,  0., -6.,  0.,  0.,  3.,  0.],
+           [ 0.,  0.,  3.,  0.,  0., -6.,  0.,  0.,  3.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-           [ 1., -2.,  1.,  0., -0.,  0.,  0., -0.,  0.],
+           [ 1., -2.,  1.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-           [ 0., -0.,  0.,  1., -2.,  1.,  0., -0.,  0.],
+           [ 0.,  0.,  0.,  1., -2.,  1.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-           [ 0., -0.,  0.,  0., -0.,  0.,  1., -2.,  1.],
+           [ 0.,  0.,  0.,  0.,  0.,  0.,  1., -2.,  1.],
            [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.]])
 
     Linear functions of two variables are in the null space of the penalty
@@ -1169,7 +1403,7 @@ class Tensor(TransformerMixin, Term, BaseEstimator):
         """Number of coefficients for the term."""
         return int(np.prod([spline.num_coefficients for spline in self.splines]))
 
-    def _build_marginal_penalties(self, i):
+    def _build_marginal_penalties(self, i, sparse=False):
         """How each of the marginals connect to each other.
 
         Examples
@@ -1237,15 +1471,16 @@ class Tensor(TransformerMixin, Term, BaseEstimator):
         penalty_matrices = []
         for j, term in enumerate(self.splines):
             if i == j:
-                penalty = term.penalty_matrix()
+                penalty = term.penalty_matrix(sparse=True)
             else:
-                penalty = np.eye(term.num_coefficients)
+                penalty = sp.sparse.eye_array(term.num_coefficients, format="csr")
 
             penalty_matrices.append(penalty)
 
-        return functools.reduce(np.kron, penalty_matrices)
+        penalty_matrix = functools.reduce(functools.partial(sp.sparse.kron, format="csr"), penalty_matrices)
+        return penalty_matrix if sparse else penalty_matrix.toarray()
 
-    def penalty_matrix(self):
+    def penalty_matrix(self, sparse=False):
         """Build the penaltry matrix.
 
         builds the GAM block-diagonal penalty matrix in quadratic form
@@ -1256,9 +1491,14 @@ class Tensor(TransformerMixin, Term, BaseEstimator):
         so for m features:
         P = block_diag[lam0 * P0, lam1 * P1, lam2 * P2, ... , lamm * Pm]
 
+        Parameters
+        ----------
+        sparse : bool, optional
+            Whether to return a scipy.sparse CSR array. The default is False.
+
         Returns
         -------
-        np.ndarray
+        np.ndarray or scipy.sparse.csr_array
             Penaltry matrix.
 
         Examples
@@ -1300,15 +1540,15 @@ class Tensor(TransformerMixin, Term, BaseEstimator):
                [ 0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0]])
 
         """
-        marginal_penalty_matrices = [self._build_marginal_penalties(i) for i, _ in enumerate(self.splines)]
+        marginal_penalty_matrices = [self._build_marginal_penalties(i, sparse=True) for i, _ in enumerate(self.splines)]
 
         # We want penalties to be additive, so |D_1 \beta|^2 + |D_2 \beta|^2.
         # To accomplish this, we stack the arrays since
         # [D_1 | D_2]^T \beta = [D_1 \beta | D_2 \beta]^T
         # and then |[D_1 \beta | D_2 \beta]^T|^2 = |D_1 \beta|^2 + |D_2 \beta|^2
         # In other words, for the final result to be additive, we must stack here
-        return np.vstack(tuple(marginal_penalty_matrices))
-        # return functools.reduce(np.add, marginal_penalty_matrices)
+        penalty_matrix = sp.sparse.vstack(marginal_penalty_matrices, format="csr")
+        return penalty_matrix if sparse else penalty_matrix.toarray()
 
     def fit(self, X):
         """Fit to data.
@@ -1319,25 +1559,52 @@ class Tensor(TransformerMixin, Term, BaseEstimator):
             A dataset of shape (num_samples, num_features).
 
         """
+        self._fit_basis(X)
+        return self
 
+    def fit_transform(self, X, y=None):
+        """Fit to data, then transform it.
+
+        Equivalent to `fit(X).transform(X)`, but every marginal basis is
+        only evaluated once.
+
+        Examples
+        --------
+        >>> rng = np.random.default_rng(42)
+        >>> X = rng.normal(size=(100, 2))
+        >>> tensor = Tensor([Spline(0, num_splines=5), Spline(1, num_splines=5)])
+        >>> basis = tensor.fit_transform(X)
+        >>> bool(np.allclose(basis, tensor.transform(X)))
+        True
+        """
+        return self._fit_basis(X).toarray() - self._column_offsets()
+
+    def _fit_basis(self, X, sample_weight=None):
+        """Fit to data and return the un-centered sparse tensor basis.
+        With `sample_weight`, the marginals and the means are weighted."""
         self._validate_params(X)
 
-        # Fit splines to learn individual mean values
+        # Fit splines to learn individual mean values. The marginal bases are
+        # un-centered, and built as a sparse product of marginals.
+        marginal_bases = []
         for spline in self.splines:
-            spline.fit(X)
-
-        # Transform, correct for individual means
-        fit_matrices = [spline.transform(X) + spline.means_ for spline in self.splines]
-        spline_basis = functools.reduce(tensor_product, fit_matrices)
-        assert np.all(spline_basis >= 0), f"Every element in tensor basis must be >= 0 {np.min(spline_basis)}"
+            marginal_basis = spline._fit_basis(X, sample_weight=sample_weight)
+            if getattr(spline, "edges", None) is not None:
+                marginal_basis = spline.transform(X) + spline._column_offsets()
+            marginal_bases.append(marginal_basis)
+        spline_basis = functools.reduce(tensor_product, [sp.sparse.csr_array(basis) for basis in marginal_bases])
+        assert spline_basis.min() >= 0, f"Every element in tensor basis must be >= 0 {spline_basis.min()}"
 
         # Set the 'by' variable
         if self.by is not None:
             # Multiply the spline basis by the desired column
-            spline_basis = spline_basis * self._get_column(X, selector="by")
+            spline_basis = sp.sparse.csr_array(spline_basis.multiply(self._get_column(X, selector="by")))
 
         # Learn the joint mean values
-        self.means_ = np.mean(spline_basis, axis=0)
+        if sample_weight is None:
+            self.means_ = np.asarray(spline_basis.mean(axis=0)).ravel()
+        else:
+            self.means_ = (sample_weight @ spline_basis) / np.sum(sample_weight)
 
         # Set bounds
         # TODO: think about this
@@ -1345,7 +1612,7 @@ class Tensor(TransformerMixin, Term, BaseEstimator):
         self._upper_bound = np.ones(self.num_coefficients) * min(np.min(spline._upper_bound) for spline in self.splines)
         # self._bounds = np.ones(self.num_coefficients) * max(np.max(spline._bounds) for spline in self.splines)
 
-        return self
+        return spline_basis
 
     def transform(self, X):
         """Transform the input."""
@@ -1366,6 +1633,79 @@ class Tensor(TransformerMixin, Term, BaseEstimator):
 
         return spline_basis
 
+    def _compile(self, X):
+        check_is_fitted(self)
+        self._validate_params(X)
+        by = self.by_ if self.by is not None else None
+        center = any(isinstance(term, Spline) for term in self.splines)
+
+        marginals = [
+            (spline.num_coefficients, spline._column_offsets(), *spline._compile(X)) for spline in self.splines
+        ]
+
+        def kernel(columns, out):
+            marginal_bases = []
+            for num_coefficients, offsets, _, marginal_kernel in marginals:
+                basis_matrix = np.empty((len(out), num_coefficients))
+                marginal_kernel(columns, basis_matrix)
+                marginal_bases.append(basis_matrix + offsets)
+
+            spline_basis = functools.reduce(tensor_product, marginal_bases)
+            if by is not None:
+                np.multiply(spline_basis, columns[by][:, None], out=out)
+            else:
+                out[:] = spline_basis
+
+            if center:
+                out -= self.means_
+
+        columns = [column for marginal in marginals for column in marginal[2]]
+        return columns + ([] if by is None else [by]), kernel
+
+    def transform_sparse(self, X):
+        """Transform the input to an un-centered sparse tensor basis.
+
+        The basis is the row-wise Kronecker product of the sparse marginal
+        bases. Each row has as many non-zeros as the product of non-zeros in
+        the marginals, e.g. 4**3 = 64 out of 20**3 = 8000 for three cubic
+        splines with 20 basis functions each.
+
+        Examples
+        --------
+        >>> rng = np.random.default_rng(42)
+        >>> X = rng.normal(size=(100, 3))
+        >>> tensor = Tensor([Spline(i, num_splines=20) for i in range(3)]).fit(X)
+        >>> basis = tensor.transform_sparse(X)
+        >>> basis.shape
+        (100, 8000)
+        >>> int(np.diff(basis.indptr).max())  # Non-zeros per row
+        64
+        >>> bool(np.allclose(basis.toarray() - tensor.means_, tensor.transform(X)))
+        True
+        """
+        check_is_fitted(self)
+        self._validate_params(X)
+
+        spline_basis = self._tensor_basis_sparse(X)
+
+        # Set the 'by' variable
+        if self.by is not None:
+            # Multiply the spline basis by the desired column
+            spline_basis = sp.sparse.csr_array(spline_basis.multiply(self._get_column(X, selector="by")))
+
+        return spline_basis
+
+    def _tensor_basis_sparse(self, X):
+        """The row-wise Kronecker product of the un-centered marginal bases."""
+        return functools.reduce(tensor_product, [spline.transform_sparse(X) for spline in self.splines])
+
+    def _column_offsets(self):
+        """Return the constants that `transform()` subtracts from each column."""
+        # Tensors of Categoricals only are not centered
+        if any(isinstance(term, Spline) for term in self.splines):
+            return super()._column_offsets()
+        return np.zeros(self.num_coefficients)
+
     def get_params(self, deep=True):
         if not deep:
             return {"splines": copy.deepcopy(self.splines)}
@@ -1632,10 +1972,11 @@ class Categorical(TransformerMixin, Term, BaseEstimator):
         """Number of coefficients for the term."""
         return len(self.categories_)
 
-    def penalty_matrix(self):
+    def penalty_matrix(self, sparse=False):
         """Return the penalty matrix for the term."""
         super()._validate_params()  # Validate the 'penalty' parameter
-        return np.sqrt(self.penalty) * np.eye(self.num_coefficients)
+        penalty_matrix = np.sqrt(self.penalty) * sp.sparse.eye_array(self.num_coefficients, format="csr")
+        return penalty_matrix if sparse else penalty_matrix.toarray()
 
     def fit(self, X):
         """Fit to data.
@@ -1646,6 +1987,29 @@ class Categorical(TransformerMixin, Term, BaseEstimator):
             A dataset of shape (num_samples, num_features).
 
         """
+        self._fit_basis(X)
+        return self
+
+    def fit_transform(self, X, y=None):
+        """Fit to data, then transform it.
+
+        Equivalent to `fit(X).transform(X)`, but the data is only encoded once.
+
+        Examples
+        --------
+        >>> X = np.array([1, 1, 2, 3, 2]).reshape(-1, 1)
+        >>> Categorical(0).fit_transform(X)
+        array([[1., 0., 0.],
+               [1., 0., 0.],
+               [0., 1., 0.],
+               [0., 0., 1.],
+               [0., 1., 0.]])
+        """
+        return self._fit_basis(X) - self.means_
+
+    def _fit_basis(self, X, sample_weight=None):
+        """Fit to data and return the one-hot encoded basis. With
+        `sample_weight`, infrequent categories are found from weighted counts."""
         self._validate_params(X)
 
         self.onehotencoder_ = OneHotEncoder(
@@ -1661,7 +2025,12 @@ class Categorical(TransformerMixin, Term, BaseEstimator):
 
         # X = check_array(X, estimator=self, input_name="X")
 
-        basis_matrix = self.onehotencoder_.fit_transform(self._get_column(X))
+        column = self._get_column(X)
+        if sample_weight is not None and (self.min_frequency is not None or self.max_categories is not None):
+            self._fit_encoder_weighted(column, sample_weight)
+            basis_matrix = self.onehotencoder_.transform(column)
+        else:
+            basis_matrix = self.onehotencoder_.fit_transform(column)
 
         # Set the 'by' variable
         if self.by is not None:
@@ -1675,7 +2044,33 @@ class Categorical(TransformerMixin, Term, BaseEstimator):
         self._lower_bound = np.array([-np.inf for _ in range(self.num_coefficients)])
         self._upper_bound = np.array([np.inf for _ in range(self.num_coefficients)])
 
-        return self
+        return basis_matrix
+
+    def _fit_encoder_weighted(self, column, sample_weight):
+        """Fit the encoder with the infrequent categories of `min_frequency`
+        and `max_categories` found from the weighted counts of the categories,
+        by the rules of `OneHotEncoder`, with the sum of the weights as the
+        number of samples."""
+        encoder = clone(self.onehotencoder_).set_params(min_frequency=None, max_categories=None).fit(column)
+        (categories,) = encoder.categories_
+        counts = np.asarray(sample_weight, dtype=float) @ encoder.transform(column)
+
+        if isinstance(self.min_frequency, Integral):
+            infrequent = counts < self.min_frequency
+        elif isinstance(self.min_frequency, Real):
+            infrequent = counts < self.min_frequency * np.sum(sample_weight)
+        else:
+            infrequent = np.zeros(len(categories), dtype=bool)
+
+        # The infrequent categories count as one category
+        num_frequent = self.max_categories - 1 if self.max_categories is not None else len(categories)
+        if num_frequent < len(categories) - infrequent.sum():
+            infrequent[np.argsort(counts, kind="mergesort")[: len(categories) - num_frequent]] = True
+
+        # Infrequent categories appear once and the others twice, so fitting with
+        # `min_frequency=2` groups the same categories as infrequent
+        self.onehotencoder_.set_params(min_frequency=2 if np.any(infrequent) else None, max_categories=None)
+        self.onehotencoder_.fit(np.repeat(categories, np.where(infrequent, 1, 2)).reshape(-1, 1))
 
     def transform(self, X):
         """transform the input.
@@ -1711,12 +2106,71 @@ class Categorical(TransformerMixin, Term, BaseEstimator):
         basis_matrix = basis_matrix - self.means_
         return basis_matrix
 
+    def _compile(self, X):
+        check_is_fitted(self)
+        self._validate_params(X)
+        feature, by = self.feature_, (self.by_ if self.by is not None else None)
+
+        def kernel(columns, out):
+            basis_matrix = self.onehotencoder_.transform(columns[feature].reshape(-1, 1))
+            if by is not None:
+                basis_matrix = basis_matrix * columns[by][:, None]
+            np.subtract(basis_matrix, self.means_, out=out)
+
+        return [feature] + ([] if by is None else [by]), kernel
+
+    def transform_sparse(self, X):
+        """Transform the input to a sparse CSR array, without centering.
+
+        Examples
+        --------
+        >>> X = np.array([1, 1, 2, 3, 2]).reshape(-1, 1)
+        >>> categorical = Categorical(0).fit(X)
+        >>> categorical.transform_sparse(X).toarray()
+        array([[1., 0., 0.],
+               [1., 0., 0.],
+               [0., 1., 0.],
+               [0., 0., 1.],
+               [0., 1., 0.]])
+        """
+        check_is_fitted(self)
+        self._validate_params(X)
+
+        # A shallow copy of the fitted encoder, set to return sparse output
+        onehotencoder = copy.copy(self.onehotencoder_)
+        onehotencoder.sparse_output = True
+        basis_matrix = sp.sparse.csr_array(onehotencoder.transform(self._get_column(X)))
+
+        if self.by is not None:
+            basis_matrix = sp.sparse.csr_array(basis_matrix.multiply(self._get_column(X, "by")))
+
+        return basis_matrix
+
 
 # =============================================================================
 # TERMLIST
 # =============================================================================
 
 
+def _column(X, j):
+    """Return column `j` of X as a one dimensional array."""
+    return X.iloc[:, j].to_numpy() if hasattr(X, "iloc") else X[:, j]
+
+
+def _replace_columns(X, rows, values):
+    """Return a copy of the rows of X, where the columns are replaced by
+    `values`, a dict from column index to an array with a value per row."""
+    if hasattr(X, "iloc"):
+        X_rows = X.iloc[rows].copy()
+        for j, column in values.items():
+            X_rows[X_rows.columns[j]] = column
+    else:
+        X_rows = np.array(X[rows], dtype=object if X.dtype == object else float)
+        for j, column in values.items():
+            X_rows[:, j] = column
+    return X_rows
+
+
 class TermList(UserList, BaseEstimator):
     def __init__(
         self,
@@ -1918,13 +2372,247 @@ class TermList(UserList, BaseEstimator):
         """Number of coefficients for the terms."""
         return int(np.sum(list(term.num_coefficients for term in self)))
 
-    def transform(self, X):
-        """Transform the input."""
+    def transform(self, X, sparse=False):
+        """Transform the input.
+
+        Parameters
+        ----------
+        X : np.ndarray or pd.DataFrame
+            A dataset of shape (num_samples, num_features).
+        sparse : bool, optional
+            Whether to return a scipy.sparse CSR array. The columns of the
+            sparse array are not centered, since centering would make every
+            entry non-zero. Subtract `_column_offsets()` from each row to
+            recover the dense result. The default is False.
+
+        Returns
+        -------
+        np.ndarray or scipy.sparse.csr_array
+            A model matrix of shape (num_samples, num_coefficients).
+
+        Examples
+        --------
+        >>> X = np.linspace(0, 1, num=5).reshape(-1, 1)
+        >>> terms = Spline(0, num_splines=3, degree=1) + Intercept()
+        >>> terms.fit_transform(X, sparse=True).toarray()
+        array([[1. , 0. , 0. , 1. ],
+               [0.5, 0.5, 0. , 1. ],
+               [0. , 1. , 0. , 1. ],
+               [0. , 0.5, 0.5, 1. ],
+               [0. , 0. , 1. , 1. ]])
+        >>> X_sparse = terms.transform(X, sparse=True)
+        >>> bool(np.allclose(X_sparse.toarray() - terms._column_offsets(), terms.transform(X)))
+        True
+        """
+        if sparse:
+            return sp.sparse.hstack([term.transform_sparse(X) for term in self], format="csr")
         return np.hstack([term.transform(X) for term in self])
 
-    def fit_transform(self, X):
-        self.fit(X)
-        return self.transform(X)
+    def fit_transform(self, X, sparse=False):
+        """Fit to data, then transform it. See `transform()` for parameters.
+
+        Every term evaluates its basis once, which is used both for fitting
+        (e.g. learning the means) and for the returned model matrix.
+
+        Examples
+        --------
+        >>> X = np.linspace(0, 1, num=5).reshape(-1, 1)
+        >>> terms = Spline(0, num_splines=3, degree=1) + Intercept()
+        >>> model_matrix = terms.fit_transform(X)
+        >>> bool(np.allclose(model_matrix, terms.transform(X)))
+        True
+        """
+        if sparse:
+            return self.fit(X).transform(X, sparse=True)
+
+        model_matrix = np.hstack([term.fit_transform(X) for term in self])
+
+        self._lower_bound = np.hstack([term._lower_bound for term in self])
+        self._upper_bound = np.hstack([term._upper_bound for term in self])
+        return model_matrix
+
+    def fit_stream(self, chunks, max_points=4096):
+        """Fit to data given as an iterable of chunks, in a single pass.
+
+        The columns used by each term are summarized by a `utils.DataSketch`,
+        a mergeable set of weighted points that keeps the range of every
+        column exactly. Each term is then fit to the weighted points, with
+        weighted quantile knots, means and category counts. If every term
+        sees at most `max_points` unique rows, the terms equal those fitted
+        by `fit()`. Otherwise they are equal up to the error of the sketch.
+
+        Parameters
+        ----------
+        chunks : iterable of np.ndarray or pd.DataFrame
+            Datasets of shape (num_samples, num_features), with equal columns.
+        max_points : int, optional
+            The maximal number of points in the sketch of each term.
+            The default is 4096.
+
+        Returns
+        -------
+        TermList
+            Returns the instance.
+
+        Examples
+        --------
+        >>> rng = np.random.default_rng(42)
+        >>> X = rng.normal(size=(10_000, 1))
+        >>> terms = TermList([Spline(0, knots="quantile"), Intercept()])
+        >>> terms = terms.fit_stream(np.array_split(X, 10), max_points=1000)
+        >>> terms_in_memory = clone(terms).fit(X)
+        >>> knots = terms[0].spline_transformer_.bsplines_[0].t[3:-3]
+        >>> knots_in_memory = terms_in_memory[0].spline_transformer_.bsplines_[0].t[3:-3]
+        >>> bool(np.allclose(knots, knots_in_memory, atol=0.01))
+        True
+        >>> bool(np.allclose(terms.transform(X), terms_in_memory.transform(X), atol=0.01))
+        True
+        """
+        first_chunk, sketches = None, None
+        for X in chunks:
+            if first_chunk is None:
+                first_chunk = X
+                columns = [self._sketch_columns(term, X) for term in self]
+                sketches = [DataSketch(max_points=max_points) for _ in self]
+
+            for sketch, (grid, linear) in zip(sketches, columns):
+                if grid or linear:
+                    sketch.update(grid=[_column(X, j) for j in grid], linear=[_column(X, j) for j in linear])
+
+        if first_chunk is None:
+            raise ValueError("At least one chunk of data is required.")
+
+        for term, sketch, (grid, linear) in zip(self, sketches, columns):
+            # Terms that learn nothing from the data are fit to the first chunk
+            if not (grid or linear):
+                term.fit(first_chunk)
+                continue
+
+            # The weighted points, as rows with the columns of the data
+            values = dict(zip(grid + linear, sketch.grid + sketch.linear))
+            X_points = _replace_columns(first_chunk, np.zeros(len(sketch.weights), dtype=np.intp), values)
+            term._fit_basis(X_points, sample_weight=sketch.weights)
+
+        self._lower_bound = np.hstack([term._lower_bound for term in self])
+        self._upper_bound = np.hstack([term._upper_bound for term in self])
+        return self
+
+    @staticmethod
+    def _sketch_columns(term, X):
+        """The columns of `X` that a term learns from, as (grid, linear) lists
+        of column indices. The `by` columns enter the fit linearly."""
+        if isinstance(term, (Spline, Categorical, Tensor)):
+            term._validate_params(X)  # Resolve `feature_` and `by_`
+
+        if isinstance(term, Tensor):
+            grid = [spline.feature_ for spline in term]
+            linear = [spline.by_ for spline in term if spline.by is not None]
+            linear += [term.by_] if term.by is not None else []
+        elif isinstance(term, (Spline, Categorical)):
+            grid = [term.feature_]
+            linear = [term.by_] if term.by is not None else []
+        else:
+            grid, linear = [], []
+        return grid, [j for j in dict.fromkeys(linear) if j not in grid]
+
+    def _term_columns(self, X):
+        """The sorted column indices of `X` read by each term."""
+        # The compiled kernels resolve the columns, including `by` columns
+        return [sorted(set(term._compile(X)[0])) for term in self]
+
+    def transform_discrete(self, X, max_bins=256):
+        """Transform the input to a discretized model matrix.
+
+        Every column of `X` used by the terms is discretized onto at most
+        `max_bins` values, see `utils.discretize`. Each term is evaluated on
+        the unique combinations of the discretized columns it uses, and the
+        samples are mapped to these with integer indices. The full model
+        matrix of shape (num_samples, num_coefficients) is never formed.
+
+        Parameters
+        ----------
+        X : np.ndarray or pd.DataFrame
+            A dataset of shape (num_samples, num_features).
+        max_bins : int, optional
+            The maximal number of unique values in each column.
+            The default is 256.
+
+        Returns
+        -------
+        DiscretizedModelMatrix
+            A model matrix of shape (num_samples, num_coefficients).
+
+        Examples
+        --------
+        >>> X = np.array([0, 0, 1, 1, 2, 2, 3, 3]).reshape(-1, 1)
+        >>> terms = Spline(0, num_splines=3, degree=1) + Intercept()
+        >>> model_matrix = terms.fit(X).transform_discrete(X)
+        >>> [basis.shape for basis in model_matrix.bases]
+        [(4, 3), (1, 1)]
+        >>> bool(np.allclose(model_matrix.toarray(), terms.transform(X)))
+        True
+        """
+        num_samples, num_features = X.shape
+        term_columns = self._term_columns(X)
+
+        def get_column(j):
+            return X.iloc[:, j].to_numpy() if hasattr(X, "iloc") else X[:, j]
+
+        discretized = {j: discretize(get_column(j), max_bins=max_bins) for j in set().union(*term_columns)}
+
+        bases, indices = [], []
+        for term, columns in zip(self, term_columns):
+            # Map each sample to the unique combination of discretized values
+            if columns:
+                keys = np.ravel_multi_index(
+                    [discretized[j][1] for j in columns], dims=[len(discretized[j][0]) for j in columns]
+                )
+                _, rows, index = np.unique(keys, return_index=True, return_inverse=True)
+            else:
+                rows, index = np.array([0]), np.zeros(num_samples, dtype=np.intp)
+
+            # Evaluate the term on representative rows, with discretized values
+            values = {j: discretized[j][0][discretized[j][1][rows]] for j in columns}
+            bases.append(term.transform(_replace_columns(X, rows, values)))
+            indices.append(index.ravel())
+
+        return DiscretizedModelMatrix(bases, indices)
+
+    def compile(self, X):
+        """Compile fitted terms into a plan for transforming data like `X`.
+
+        Parameters are validated and the columns used by every term are
+        resolved once, when the plan is compiled. The plan transforms any
+        data with the same columns as `X`, which is faster than `transform()`
+        when it is called repeatedly, e.g. to predict.
+
+        Parameters
+        ----------
+        X : np.ndarray or pd.DataFrame
+            A dataset of shape (num_samples, num_features). Only the columns
+            are used, so a single row suffices.
+
+        Returns
+        -------
+        CompiledTermList
+            A plan with a `transform(X, out=None)` method.
+
+        Examples
+        --------
+        >>> X = np.linspace(0, 1, num=5).reshape(-1, 1)
+        >>> terms = Spline(0, num_splines=3, degree=1) + Intercept()
+        >>> compiled_terms = terms.fit(X).compile(X)
+        >>> bool(np.allclose(compiled_terms.transform(X), terms.transform(X)))
+        True
+        >>> out = np.empty((5, 4))
+        >>> compiled_terms.transform(X, out=out) is out
+        True
+        """
+        return CompiledTermList(self, X)
+
+    def _column_offsets(self):
+        """Return the constants that `transform()` subtracts from each column."""
+        return np.hstack([term._column_offsets() for term in self])
 
     @property
     def coef_(self):
@@ -1933,12 +2621,32 @@ class TermList(UserList, BaseEstimator):
         else:
             return np.hstack(tuple(term.coef_ for term in self))
 
-    def penalty_matrix(self):
-        """Return the penalty matrix for the terms."""
+    def penalty_matrix(self, sparse=False):
+        """Return the penalty matrix for the terms.
+
+        Parameters
+        ----------
+        sparse : bool, optional
+            Whether to return a scipy.sparse CSR array. The default is False.
+
+        Examples
+        --------
+        >>> terms = Spline(0, num_splines=4) + Linear(1) + Intercept()
+        >>> terms.penalty_matrix()
+        array([[ 0.,  0.,  0.,  0.,  0.,  0.],
+               [ 1., -2.,  1.,  0.,  0.,  0.],
+               [ 0.,  1., -2.,  1.,  0.,  0.],
+               [ 0.,  0.,  0.,  0.,  0.,  0.],
+               [ 0.,  0.,  0.,  0.,  1.,  0.],
+               [ 0.,  0.,  0.,  0.,  0.,  0.]])
+        >>> terms.penalty_matrix(sparse=True).nnz
+        7
+        """
 
         # The full penalty matrix is the block diagonal of each Terms penalty
-        penalty_matrices = [term.penalty_matrix() for term in self]
-        return sp.linalg.block_diag(*penalty_matrices)
+        penalty_matrices = [term.penalty_matrix(sparse=True) for term in self]
+        penalty_matrix = sp.sparse.block_diag(penalty_matrices, format="csr")
+        return penalty_matrix if sparse else penalty_matrix.toarray()
 
     def __sklearn_clone__(self):
         return type(self)([copy.deepcopy(term) for term in self])
@@ -2084,6 +2792,91 @@ class TermList(UserList, BaseEstimator):
         return self
 
 
+class CompiledTermList:
+    """A plan for transforming data with fitted terms, see `TermList.compile()`.
+
+    Every term writes its basis into its own slice of a single model matrix.
+    Splines that share degree, number of splines and extrapolation, and have
+    uniform knots, are evaluated together in one batched call. The plan is
+    tied to the columns of the data it was compiled for.
+    """
+
+    def __init__(self, terms, X):
+        self.num_features = X.shape[1]
+        self.feature_names = _get_feature_names(X)  # None or np.array
+        self.num_coefficients = terms.num_coefficients
+
+        # Every kernel is stored with the slices of the model matrix it writes to
+        columns, self.kernels = set(), []
+        batches = defaultdict(list)
+        start = 0
+        for term in terms:
+            term_slice = slice(start, start + term.num_coefficients)
+            start += term.num_coefficients
+
+            batch_key = term._batch_key() if isinstance(term, Spline) else None
+            if batch_key is not None:
+                batches[batch_key].append((term, term_slice))
+                continue
+
+            term_columns, kernel = term._compile(X)
+            columns.update(term_columns)
+            self.kernels.append(([term_slice], kernel))
+
+        for batch in batches.values():
+            splines, slices = zip(*batch)
+            batch_columns, kernel = Spline._compile_batch(list(splines), X)
+            columns.update(batch_columns)
+            self.kernels.append((list(slices), kernel))
+
+        self.columns = sorted(columns)
+
+    def matches(self, X):
+        """Whether `X` has the columns that the plan was compiled for."""
+        feature_names = _get_feature_names(X)
+        if X.shape[1] != self.num_features or (feature_names is None) != (self.feature_names is None):
+            return False
+        return feature_names is None or np.array_equal(feature_names, self.feature_names)
+
+    def transform(self, X, out=None):
+        """Transform the input.
+
+        Parameters
+        ----------
+        X : np.ndarray or pd.DataFrame
+            A dataset of shape (num_samples, num_features), with the same
+            columns as the data that the plan was compiled for.
+        out : np.ndarray, optional
+            An array of shape (num_samples, num_coefficients) to write the
+            model matrix into. The default is None, which allocates one.
+
+        Returns
+        -------
+        np.ndarray
+            A model matrix of shape (num_samples, num_coefficients).
+
+        """
+        if not self.matches(X):
+            raise ValueError("The columns in X do not match the data that the terms were compiled for.")
+
+        shape = (X.shape[0], self.num_coefficients)
+        if out is None:
+            out = np.empty(shape)
+        elif out.shape != shape:
+            raise ValueError(f"Parameter `out` must have shape {shape}, got {out.shape}.")
+
+        # Every column is fetched once, even if several terms use it
+        if hasattr(X, "iloc"):
+            columns = {j: X.iloc[:, j].to_numpy() for j in self.columns}
+        else:
+            columns = {j: X[:, j] for j in self.columns}
+
+        for slices, kernel in self.kernels:
+            kernel(columns, *(out[:, columns_slice] for columns_slice in slices))
+
+        return out
+
+
 if __name__ == "__main__":
     import pytest
 
@@ -5,8 +5,12 @@ Created on Wed Feb  8 07:11:09 2023
 
 @author: tommy
 """
+
 import io
 import itertools
+import pickle
+import subprocess
+import sys
 from numbers import Real
 
 import joblib
@@ -386,6 +390,23 @@ class TestSklearnCompatibility:
         assert np.allclose(gam_restored.coef_, gam.coef_)
         assert gam_restored.get_params() == gam.get_params()
 
+    def test_that_predict_compiles_terms_for_the_columns_of_the_data(self):
+        data = load_diabetes(as_frame=True)
+        df, y = data.data, data.target
+
+        gam = GAM(Spline("age") + Spline("bmi") + Categorical("sex")).fit(df, y)
+        predictions = gam.predict(df)
+        assert np.allclose(predictions, gam._link.inverse_link(gam.terms.transform(df) @ gam.coef_))
+
+        # Permuting the columns compiles the terms again
+        assert np.allclose(gam.predict(df[df.columns[::-1]]), predictions)
+
+        # Models with compiled terms can be saved
+        filename = io.BytesIO()
+        joblib.dump(gam, filename)
+        filename.seek(0)
+        assert np.allclose(joblib.load(filename).predict(df), predictions)
+
     @pytest.mark.parametrize("gam_cls", [GAM, ExpectileGAM])
     def test_cloning_with_sklearn_clone(self, gam_cls):
         terms = Spline(0, extrapolation="periodic")
@@ -1079,6 +1100,510 @@ class TestExpectileGAM:
         assert np.isclose(empirical_quantile, quantile, atol=0.01)
 
 
+class TestScore:
+    @pytest.mark.parametrize(
+        "gam", [GAM(), GAM(distribution="poisson", link="log"), GAM(distribution="gamma", link="log"), ExpectileGAM()]
+    )
+    @pytest.mark.parametrize("seed", list(range(5)))
+    def test_that_null_deviance_equals_deviance_of_fitted_intercept_model(self, gam, seed):
+        rng = np.random.default_rng(seed)
+        X = rng.uniform(size=(100, 1))
+        y = np.exp(X.ravel() + rng.normal(size=100) / 4)
+        sample_weight = rng.uniform(0.5, 2, size=100)
+
+        gam = clone(gam).set_params(terms=Spline(0)).fit(X, y, sample_weight=sample_weight)
+
+        # The ExpectileGAM measures deviance with the asymmetric weights of the fitted model
+        weights = gam._get_sample_weight(y=y, mu=gam.predict(X), sample_weight=sample_weight)
+        null_gam = clone(gam).set_params(terms=Intercept(), tol=1e-10).fit(X, y, sample_weight=weights)
+
+        null_mu = null_gam.predict(X)
+        assert np.allclose(null_mu, gam._null_prediction(X, y, weights))
+        null_deviance = null_gam._distribution.deviance(y=y, mu=null_mu, sample_weight=weights, scaled=False).mean()
+        assert np.isclose(gam.results_.null_deviance, null_deviance)
+
+    @pytest.mark.parametrize("distribution", ["binomial", "normal"])
+    @pytest.mark.parametrize("seed", list(range(3)))
+    def test_that_null_deviance_with_trials_per_observation_equals_fitted_intercept_model(self, distribution, seed):
+        rng = np.random.default_rng(seed)
+        X = rng.uniform(size=(200, 1))
+        trials = rng.integers(1, 50, size=200)
+        y = rng.binomial(n=trials, p=Logit().inverse_link(np.sin(6 * X.ravel())))
+        sample_weight = rng.uniform(0.5, 2, size=200)
+
+        # The null model predicts n_i * p for the canonical link, and is fitted otherwise
+        distribution = Binomial(trials=trials) if distribution == "binomial" else Normal()
+        gam = GAM(Spline(0), link=Logit(low=0, high=trials), distribution=distribution)
+        gam.fit(X, y, sample_weight=sample_weight)
+
+        null_gam = clone(gam).set_params(terms=Intercept(), tol=1e-10).fit(X, y, sample_weight=sample_weight)
+        null_mu = null_gam.predict(X)
+        assert np.allclose(null_mu, gam._null_prediction(X, y, sample_weight))
+
+        null_deviance = null_gam._distribution.deviance(y=y, mu=null_mu, sample_weight=sample_weight, scaled=False)
+        assert np.isclose(gam.results_.null_deviance, null_deviance.mean())
+        assert 0 < gam.results_.pseudo_r2 < 1
+
+    def test_that_score_does_not_refit(self, monkeypatch):
+        rng = np.random.default_rng(42)
+        X = rng.normal(size=(100, 1))
+        y = np.sin(X.ravel()) + rng.normal(size=100) / 10
+
+        gam = GAM(Spline(0)).fit(X, y)
+
+        def fit(self, X, y, sample_weight=None):
+            raise AssertionError("score() should not fit a model")
+
+        monkeypatch.setattr(GAM, "fit", fit)
+        assert np.isclose(gam.score(X, y), gam.results_.pseudo_r2)
+
+
+class TestSparseModelMatrix:
+    @pytest.mark.parametrize("solver", ["pirls", "lbfgsb"])
+    def test_that_sparse_and_dense_model_matrices_give_equal_models(self, solver):
+        data = load_diabetes(as_frame=True)
+        df, y = data.data, data.target
+        terms = Spline("age") + Spline("bmi", by="bp") + Linear("s5") + Categorical("sex")
+        terms = terms + Tensor([Spline("s1", num_splines=5), Categorical("sex")], by="s2")
+
+        dense_gam = GAM(terms, solver=solver).fit(df, y)
+        sparse_gam = GAM(terms, solver=solver, sparse=True).fit(df, y)
+
+        assert sp.sparse.issparse(sparse_gam.model_matrix_)
+        assert np.allclose(dense_gam.coef_, sparse_gam.coef_, atol=1e-4)
+        assert np.allclose(dense_gam.predict(df), sparse_gam.predict(df), atol=1e-4)
+        assert np.allclose(dense_gam.results_.covariance, sparse_gam.results_.covariance, atol=1e-4)
+        assert np.isclose(dense_gam.results_.edof, sparse_gam.results_.edof)
+
+    def test_that_sparse_model_matrix_requires_an_intercept(self):
+        rng = np.random.default_rng(42)
+        X = rng.normal(size=(100, 1))
+        y = np.sin(X.ravel())
+
+        with pytest.raises(ValueError, match="Intercept"):
+            GAM(Spline(0), fit_intercept=False, sparse=True).fit(X, y)
+
+
+class TestDiscreteModelMatrix:
+    @pytest.mark.parametrize("solver", ["pirls", "lbfgsb"])
+    def test_that_discrete_and_dense_model_matrices_give_equal_models(self, solver):
+        data = load_diabetes(as_frame=True)
+        df, y = data.data, data.target
+        terms = Spline("age") + Spline("bmi", by="bp") + Linear("s5") + Categorical("sex")
+        terms = terms + Tensor([Spline("s1", num_splines=5), Categorical("sex")], by="s2")
+
+        # No feature has more unique values than `max_bins`, so no binning
+        dense_gam = GAM(terms, solver=solver).fit(df, y)
+        discrete_gam = GAM(terms, solver=solver, discrete=True, max_bins=len(df)).fit(df, y)
+
+        assert np.allclose(dense_gam.predict(df), discrete_gam.predict(df), atol=1e-4)
+        assert np.isclose(dense_gam.results_.edof, discrete_gam.results_.edof)
+        assert np.isclose(dense_gam.score(df, y), discrete_gam.score(df, y))
+
+    def test_that_binned_features_give_approximately_equal_models(self):
+        rng = np.random.default_rng(42)
+        X = rng.uniform(size=(10_000, 2))
+        y = np.sin(6 * X[:, 0]) + X[:, 1] + rng.normal(size=10_000, scale=0.1)
+
+        dense_gam = GAM(Spline(0) + Spline(1)).fit(X, y)
+        discrete_gam = GAM(Spline(0) + Spline(1), discrete=True, max_bins=128).fit(X, y)
+
+        assert all(len(basis) <= 128 for basis in discrete_gam.model_matrix_.bases)
+        assert np.allclose(dense_gam.predict(X), discrete_gam.predict(X), atol=1e-2)
+
+    def test_that_discrete_and_sparse_cannot_both_be_set(self):
+        X = np.linspace(0, 1, num=100).reshape(-1, 1)
+        y = np.sin(X.ravel())
+
+        with pytest.raises(ValueError, match="discrete"):
+            GAM(Spline(0), sparse=True, discrete=True).fit(X, y)
+
+
+class TestCompression:
+    @pytest.mark.parametrize("distribution, link", [("poisson", "log"), (Binomial(), "logit"), ("normal", "identity")])
+    def test_that_compressed_and_uncompressed_fits_are_equal(self, distribution, link):
+        rng = np.random.default_rng(42)
+        num_samples = 1000
+        X = np.column_stack([rng.integers(0, 20, size=num_samples), rng.integers(0, 3, size=num_samples)])
+        mu = Logit().inverse_link(np.sin(X[:, 0] / 4) + X[:, 1] / 3)
+        y = rng.binomial(1, mu) if link == "logit" else rng.poisson(mu)
+        sample_weight = rng.uniform(0.5, 2, size=num_samples)
+
+        terms = Spline(0) + Categorical(1)
+        gam = GAM(terms, distribution=distribution, link=link)
+        gam_compressed = clone(gam).set_params(compress=True)
+        gam.fit(X, y, sample_weight=sample_weight)
+        gam_compressed.fit(X, y, sample_weight=sample_weight)
+
+        assert gam_compressed.model_matrix_.shape[0] == 60
+        assert np.allclose(gam.coef_, gam_compressed.coef_)
+        assert np.allclose(gam.predict(X), gam_compressed.predict(X))
+        assert np.allclose(gam.results_.covariance, gam_compressed.results_.covariance)
+        for key in ["edof", "scale", "pseudo_r2", "null_deviance", "generalized_cross_validation_score"]:
+            assert np.isclose(gam.results_[key], gam_compressed.results_[key])
+
+    def test_that_compressed_and_uncompressed_fits_with_trials_per_observation_are_equal(self):
+        rng = np.random.default_rng(42)
+        num_samples = 1000
+        X = np.column_stack([rng.integers(0, 20, size=num_samples), rng.integers(0, 3, size=num_samples)])
+        trials = rng.integers(1, 4, size=num_samples)
+        y = rng.binomial(trials, Logit().inverse_link(np.sin(X[:, 0] / 4) + X[:, 1] / 3))
+
+        terms = Spline(0) + Categorical(1)
+        gam = GAM(terms, distribution=Binomial(trials=trials), link=Logit(low=0, high=trials))
+        gam_compressed = clone(gam).set_params(compress=True)
+        gam.fit(X, y)
+        gam_compressed.fit(X, y)
+
+        assert gam_compressed.model_matrix_.shape[0] == 180
+        assert np.allclose(gam.coef_, gam_compressed.coef_)
+        assert np.allclose(gam.predict(X), gam_compressed.predict(X))
+
+    def test_that_compression_ignores_columns_not_used_by_terms(self):
+        rng = np.random.default_rng(42)
+        df = pd.DataFrame({"a": rng.integers(0, 5, size=100), "b": rng.normal(size=100)})
+        y = df["a"] + rng.normal(size=100)
+
+        gam = GAM(Categorical("a"), compress=True).fit(df, y)
+
+        assert gam.model_matrix_.shape[0] == 5
+        assert len(gam.predict(df)) == 100
+
+
+class TestChunkedModelMatrix:
+    @pytest.mark.parametrize("solver", ["pirls", "lbfgsb"])
+    def test_that_chunked_and_dense_model_matrices_give_equal_models(self, solver):
+        data = load_diabetes(as_frame=True)
+        df, y = data.data, data.target
+        terms = Spline("age") + Spline("bmi", by="bp") + Linear("s5") + Categorical("sex")
+        terms = terms + Tensor([Spline("s1", num_splines=5), Categorical("sex")], by="s2")
+
+        # The chunk size does not divide the number of samples
+        dense_gam = GAM(terms, solver=solver).fit(df, y)
+        chunked_gam = GAM(terms, solver=solver, chunk_size=100).fit(df, y)
+
+        assert np.allclose(dense_gam.predict(df), chunked_gam.predict(df))
+        assert np.isclose(dense_gam.results_.edof, chunked_gam.results_.edof)
+        assert np.isclose(dense_gam.results_.scale, chunked_gam.results_.scale)
+
+    def test_that_chunked_gam_can_be_pickled(self):
+        rng = np.random.default_rng(42)
+        X = rng.normal(size=(100, 1))
+        y = np.sin(X.ravel())
+
+        gam = GAM(Spline(0), chunk_size=30).fit(X, y)
+        filename = io.BytesIO()
+        joblib.dump(gam, filename)
+        filename.seek(0)
+
+        assert np.allclose(joblib.load(filename).predict(X), gam.predict(X))
+
+    @pytest.mark.parametrize("gam_cls", [GAM, ExpectileGAM])
+    @pytest.mark.parametrize("memmap", [True, False])
+    def test_that_memory_mapped_data_is_not_copied(self, tmp_path, memmap, gam_cls):
+        rng = np.random.default_rng(42)
+        np.save(tmp_path / "X.npy", rng.normal(size=(200, 2)))
+        X = np.load(tmp_path / "X.npy", mmap_mode="r")
+        y = np.sin(X[:, 0]) + X[:, 1]
+
+        memmap_dir = tmp_path if memmap else None
+        gam = gam_cls(Spline(0) + Spline(1), chunk_size=64, memmap_dir=memmap_dir).fit(X, y)
+        dense_gam = gam_cls(Spline(0) + Spline(1)).fit(np.array(X), y)
+
+        assert gam.X_ is X
+        assert np.allclose(gam.predict(X), dense_gam.predict(X))
+
+    def test_that_memmap_dir_requires_chunk_size(self, tmp_path):
+        X = np.linspace(0, 1, num=100).reshape(-1, 1)
+        y = np.sin(X.ravel())
+
+        with pytest.raises(ValueError, match="chunk_size"):
+            GAM(Spline(0), memmap_dir=tmp_path).fit(X, y)
+
+    @pytest.mark.parametrize("param", ["sparse", "discrete"])
+    def test_that_chunk_size_cannot_be_used_with_sparse_or_discrete(self, param):
+        X = np.linspace(0, 1, num=100).reshape(-1, 1)
+        y = np.sin(X.ravel())
+
+        with pytest.raises(ValueError, match="chunk_size"):
+            GAM(Spline(0), chunk_size=30, **{param: True}).fit(X, y)
+
+
+class TestStoreTrainingData:
+    @pytest.mark.parametrize("chunk_size", [None, 30])
+    def test_that_gam_without_training_data_predicts_the_same(self, chunk_size):
+        rng = np.random.default_rng(42)
+        X = rng.normal(size=(100, 2))
+        y = np.sin(X[:, 0]) + X[:, 1]
+
+        terms = Spline(0) + Linear(1)
+        gam = GAM(terms, chunk_size=chunk_size).fit(X, y)
+        light_gam = GAM(terms, chunk_size=chunk_size, store_training_data=False).fit(X, y)
+
+        assert np.allclose(gam.predict(X), light_gam.predict(X))
+        for attribute in ("X_", "y_", "sample_weight_", "model_matrix_"):
+            assert not hasattr(light_gam, attribute)
+
+        # The pickled model does not grow with the number of samples
+        sizes = []
+        for num_samples in [100, 1000]:
+            X = rng.normal(size=(num_samples, 2))
+            light_gam = GAM(terms, store_training_data=False).fit(X, np.sin(X[:, 0]) + X[:, 1])
+            filename = io.BytesIO()
+            joblib.dump(light_gam, filename)
+            sizes.append(len(filename.getvalue()))
+        assert sizes[0] == sizes[1]
+
+    def test_that_categorical_features_are_not_summarized(self):
+        rng = np.random.default_rng(42)
+        df = pd.DataFrame({"a": rng.normal(size=100), "c": rng.choice(list("xyz"), size=100)})
+        y = df.a + (df.c == "x")
+
+        gam = GAM(Tensor([Spline("a"), Categorical("c")]), store_training_data=False).fit(df, y)
+        assert list(gam.feature_summary_) == [0]
+
+    def test_that_partial_effect_uses_stored_summary_or_passed_data(self):
+        from generalized_additive_models.inspection.inspection import plot_qq
+        from generalized_additive_models.inspection.partial_effect import partial_effect
+
+        rng = np.random.default_rng(42)
+        X = rng.normal(size=(150, 2))
+        y = np.sin(X[:, 0]) + X[:, 1] + rng.normal(size=150, scale=0.1)
+
+        gam = GAM(Spline(0) + Linear(1)).fit(X, y)
+        light_gam = GAM(Spline(0) + Linear(1), store_training_data=False).fit(X, y)
+
+        for term, light_term in zip(gam.terms[:2], light_gam.terms[:2]):
+            result = partial_effect(gam, term)
+            light_result = partial_effect(light_gam, light_term)
+
+            # The partial residuals add the term back to the residuals of the model
+            residuals = y - gam._link.inverse_link(gam.model_matrix_ @ gam.coef_)
+            assert np.allclose(result.y_partial_residuals, term.transform(X) @ term.coef_ + residuals)
+
+            # The grid and the credible interval need no data
+            assert np.allclose(result.x, light_result.x)
+            assert np.allclose(result.y_low, light_result.y_low)
+            assert light_result.y_partial_residuals is None
+            assert np.isclose(np.median(result.x_obs), light_result.x_obs[50])
+
+            # Partial residuals are computed on passed data
+            light_result = partial_effect(light_gam, light_term, X=X, y=y)
+            assert np.allclose(result.y_partial_residuals, light_result.y_partial_residuals)
+
+        with pytest.raises(ValueError, match="store_training_data"):
+            plot_qq(light_gam, return_data=True)
+
+
+class TestSaveLoad:
+    @pytest.mark.parametrize("mmap", [True, False])
+    @pytest.mark.parametrize(
+        "terms, params",
+        [
+            (Spline("a", knots="quantile") + Tensor([Spline("a"), Spline("b")]) + Linear("b", by="d"), {}),
+            (Spline("a", constraint="increasing") + Spline("b", constraint="convex", edges=(-1, 1)), {}),
+            (Spline("d", by="a", extrapolation="periodic") + Categorical("c"), {}),
+            (Spline("a") + Spline("b"), dict(sparse=True)),
+            (Spline("a") + Spline("b"), dict(distribution="poisson", link="log", chunk_size=100)),
+        ],
+    )
+    def test_that_loaded_gam_predicts_the_same(self, tmp_path, terms, params, mmap):
+        rng = np.random.default_rng(42)
+        num_samples = 500
+        df = pd.DataFrame(
+            {
+                "a": rng.normal(size=num_samples),
+                "b": rng.normal(size=num_samples),
+                "c": rng.choice(list("xyzw"), size=num_samples, p=[0.5, 0.4, 0.08, 0.02]),
+                "d": rng.uniform(size=num_samples),
+            }
+        )
+        y = rng.poisson(np.exp(0.3 * df.a + df.d))
+
+        gam = GAM(terms, **params).fit(df, y)
+        gam.save(tmp_path)
+        loaded_gam = GAM.load(tmp_path, mmap=mmap)
+
+        assert np.allclose(gam.predict(df), loaded_gam.predict(df))
+        assert np.allclose(gam.results_.covariance, loaded_gam.results_.covariance)
+        assert isinstance(loaded_gam.coef_, np.memmap) == mmap
+        assert not hasattr(loaded_gam, "X_")
+
+    def test_that_infrequent_categories_are_loaded(self, tmp_path):
+        rng = np.random.default_rng(42)
+        df = pd.DataFrame({"c": rng.choice(list("xyzw"), size=500, p=[0.5, 0.4, 0.08, 0.02])})
+        y = rng.normal(size=500) + (df.c == "x")
+
+        gam = GAM(Categorical("c", min_frequency=20, handle_unknown="infrequent_if_exist")).fit(df, y)
+        gam.save(tmp_path)
+        loaded_gam = GAM.load(tmp_path)
+
+        # Unknown categories are mapped to the infrequent category
+        df_new = pd.DataFrame({"c": list("xyzw") + ["unknown"]})
+        assert np.allclose(gam.predict(df_new), loaded_gam.predict(df_new))
+        assert gam.predict(df_new)[-1] == gam.predict(df_new)[-2]
+
+    def test_that_covariance_is_optional(self, tmp_path):
+        rng = np.random.default_rng(42)
+        X = rng.normal(size=(100, 1))
+        y = np.sin(X).ravel()
+
+        gam = ExpectileGAM(Spline(0), expectile=0.9).fit(X, y)
+        gam.save(tmp_path, covariance=False)
+        loaded_gam = ExpectileGAM.load(tmp_path)
+
+        assert np.allclose(gam.predict(X), loaded_gam.predict(X))
+        assert "covariance" not in loaded_gam.results_
+        assert loaded_gam.expectile == 0.9
+
+        with pytest.raises(ValueError, match="ExpectileGAM.load"):
+            GAM.load(tmp_path)
+
+
+class TestExportScorer:
+    @pytest.mark.parametrize(
+        "terms, params",
+        [
+            (Spline("a", knots="quantile") + Categorical("c") + Tensor([Spline("a"), Spline("b")]), {}),
+            (Spline("a", constraint="increasing") + Spline("b", constraint="convex") + Linear("b", by="d"), {}),
+            (Spline("a", constraint="concave", extrapolation="constant") + Spline("d", extrapolation="periodic"), {}),
+            (Spline("a", degree=0, extrapolation="continue") + Spline("b", constraint="decreasing-convex"), {}),
+            (Categorical("c", min_frequency=20, handle_unknown="infrequent_if_exist") + Spline("d", by="a"), {}),
+            (Tensor([Spline("a"), Categorical("c")], by="d"), {}),
+            (Spline("a") + Spline("b"), dict(sparse=True)),
+            (Spline("a") + Linear("b"), dict(distribution="poisson", link="log")),
+        ],
+    )
+    def test_that_scorer_predicts_the_same(self, terms, params):
+        rng = np.random.default_rng(42)
+        num_samples = 500
+        df = pd.DataFrame(
+            {
+                "a": rng.normal(size=num_samples),
+                "b": rng.normal(size=num_samples),
+                "c": rng.choice(list("xyzw"), size=num_samples, p=[0.5, 0.4, 0.08, 0.02]),
+                "d": rng.uniform(size=num_samples),
+            }
+        )
+        y = rng.poisson(np.exp(0.3 * df.a + df.d))
+
+        gam = GAM(terms, **params).fit(df, y)
+        scorer = gam.export_scorer()
+
+        # Also beyond the range of the training data, where splines extrapolate
+        df_new = df.assign(a=df.a * 3, b=df.b * 3, d=df.d * 3 - 1)
+        assert np.allclose(scorer.predict(df), gam.predict(df), rtol=1e-10, atol=1e-10)
+        assert np.allclose(scorer.predict(df_new), gam.predict(df_new), rtol=1e-10, atol=1e-10)
+
+    @pytest.mark.parametrize("handle_unknown", ["ignore", "infrequent_if_exist"])
+    def test_that_scorer_predicts_the_same_on_unknown_categories(self, handle_unknown):
+        rng = np.random.default_rng(42)
+        num_samples = 500
+        df = pd.DataFrame(
+            {
+                "a": rng.normal(size=num_samples),
+                "c": rng.choice(list("xyzw"), size=num_samples, p=[0.5, 0.4, 0.08, 0.02]),
+            }
+        )
+        y = rng.poisson(np.exp(0.3 * df.a + (df.c == "x")))
+
+        terms = Spline("a") + Categorical("c", min_frequency=20, handle_unknown=handle_unknown)
+        gam = GAM(terms).fit(df, y)
+        scorer = gam.export_scorer()
+
+        df_new = df.assign(c=rng.choice(list("xyzwuv"), size=num_samples))
+        assert np.allclose(scorer.predict(df_new), gam.predict(df_new), rtol=1e-10, atol=1e-10)
+
+    def test_that_exported_scorer_only_imports_numpy(self, tmp_path):
+        rng = np.random.default_rng(42)
+        X = rng.normal(size=(100, 3))
+        y = np.sin(X[:, 0]) + X[:, 1] * X[:, 2]
+
+        gam = GAM(Spline(0) + Tensor([Spline(1), Spline(2)]) + Linear(2)).fit(X, y)
+        gam.export_scorer(tmp_path)
+        np.save(tmp_path / "X.npy", X)
+        np.save(tmp_path / "predictions.npy", gam.predict(X))
+
+        code = f"""
+import sys
+sys.path.insert(0, {str(tmp_path)!r})
+import numpy as np
+from scorer import Scorer
+X, predictions = np.load("X.npy"), np.load("predictions.npy")
+assert np.allclose(Scorer.load(".").predict(X), predictions)
+print(sorted(name for name in sys.modules if name.split(".")[0] in ("scipy", "sklearn", "pandas")))
+"""
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=tmp_path)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == "[]"
+
+
+class TestStatistics:
+    @pytest.fixture
+    def data(self):
+        rng = np.random.default_rng(42)
+        X = rng.uniform(-1, 1, size=(500, 2))
+        y = rng.poisson(np.exp(np.sin(2 * X[:, 0]) + X[:, 1]))
+        return X, y
+
+    def test_that_statistics_are_computed_when_first_looked_up(self, data, monkeypatch):
+        from generalized_additive_models import optimizers
+
+        calls = []
+        statistics = optimizers._statistics
+        monkeypatch.setattr(optimizers, "_statistics", lambda **kwargs: calls.append(1) or statistics(**kwargs))
+
+        X, y = data
+        gam = GAM(Spline(0) + Linear(1), distribution="poisson", link="log").fit(X, y)
+        assert "covariance" in gam.results_
+        assert len(calls) == 0
+
+        # The covariance of a term is a block of the covariance
+        term = gam.terms[0]
+        assert np.allclose(term.coef_covar_, gam.results_.covariance[np.ix_(term.coef_idx_, term.coef_idx_)])
+        assert np.allclose(term.edof_, gam.results_.edof_per_coef[term.coef_idx_])
+        assert np.isclose(gam.results_.edof_per_coef.sum(), gam.results_.edof)
+        assert len(calls) == 1
+
+    def test_that_statistics_do_not_keep_vectors_over_the_samples(self, data):
+        X, y = data
+        gam = GAM(Spline(0) + Linear(1), distribution="poisson", link="log", store_training_data=False).fit(X, y)
+
+        # Only arrays with one entry per coefficient are kept until look up
+        (statistics,) = set(gam.results_._lazy.values())
+        for value in statistics.keywords.values():
+            assert not (isinstance(value, np.ndarray) and len(y) in value.shape)
+
+        mu = gam.predict(X)
+        edof = gam.results_.edof
+        gcv = np.sum((gam._link.link(mu) - y) ** 2) * len(y) / (len(y) - edof) ** 2
+        assert np.isclose(gam.results_.generalized_cross_validation_score, gcv)
+
+    def test_that_pickling_computes_the_statistics(self, data):
+        X, y = data
+        gam = GAM(Spline(0) + Linear(1), distribution="poisson", link="log").fit(X, y)
+        gam_pickled = pickle.loads(pickle.dumps(gam))
+
+        for key in ("edof", "scale", "generalized_cross_validation_score"):
+            assert np.isclose(gam_pickled.results_[key], gam.results_[key])
+        assert np.allclose(gam_pickled.terms[0].coef_covar_, gam.terms[0].coef_covar_)
+
+    @pytest.mark.parametrize("distribution, link", [("normal", "identity"), ("poisson", "log")])
+    def test_that_statistics_can_be_skipped(self, data, distribution, link):
+        X, y = data
+        terms = Spline(0) + Linear(1)
+        gam = GAM(terms, distribution=distribution, link=link).fit(X, y)
+        gam_skipped = GAM(terms, distribution=distribution, link=link, compute_statistics=False).fit(X, y)
+
+        assert np.allclose(gam.predict(X), gam_skipped.predict(X))
+        assert np.isclose(gam.score(X, y), gam_skipped.score(X, y))
+        assert "covariance" not in gam_skipped.results_
+        assert not any(hasattr(term, "coef_covar_") for term in gam_skipped.terms)
+
+        with pytest.raises(ValueError, match="compute_statistics"):
+            gam_skipped.summary()
+
+
 if __name__ == "__main__":
     import pytest
 
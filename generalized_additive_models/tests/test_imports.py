@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the import time of the package, and for the submodules that are
+imported when names are accessed. Each test imports the package in a fresh
+interpreter, since it is already imported by the test session.
+"""
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ("scipy", "sklearn", "pandas", "matplotlib", "tabulate")
+
+# The package imports in a few milliseconds. Importing sklearn takes about a
+# second, so the budget catches eager imports of heavy dependencies
+IMPORT_TIME_BUDGET = 0.25
+
+
+def run_python(code):
+    """Run code in a new interpreter and return what it prints, parsed as JSON."""
+    result = subprocess.run([sys.executable, "-W", "ignore", "-c", code], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout)
+
+
+def imported_modules(statement):
+    code = f"""
+import json, sys
+{statement}
+print(json.dumps(sorted({{name.split(".")[0] for name in sys.modules}} & set({HEAVY_MODULES!r}))))
+"""
+    return run_python(code)
+
+
+class TestImports:
+    def test_that_importing_the_package_is_within_the_time_budget(self):
+        code = """
+import json, time
+start = time.perf_counter()
+import generalized_additive_models
+print(json.dumps(time.perf_counter() - start))
+"""
+        # Use the fastest of a few runs, since the machine might be busy
+        import_time = min(run_python(code) for _ in range(3))
+        assert import_time < IMPORT_TIME_BUDGET
+
+    def test_that_importing_the_package_does_not_import_heavy_modules(self):
+        assert imported_modules("import generalized_additive_models") == []
+        assert imported_modules("import generalized_additive_models.inspection") == []
+        assert imported_modules("import generalized_additive_models; generalized_additive_models.__version__") == []
+
+    @pytest.mark.parametrize(
+        "statement",
+        [
+            "from generalized_additive_models import GAM, Spline",
+            "from generalized_additive_models.inspection import PartialEffectDisplay, QQDisplay",
+            "from generalized_additive_models.inspection.inspection import model_checking",
+        ],
+    )
+    def test_that_matplotlib_is_not_imported_until_plotting(self, statement):
+        modules = imported_modules(statement)
+        assert "matplotlib" not in modules
+        assert "tabulate" not in modules
+
+    def test_that_accessing_names_imports_them(self):
+        import generalized_additive_models
+        from generalized_additive_models.gam import GAM
+
+        assert generalized_additive_models.GAM is GAM
+        assert set(generalized_additive_models.__all__) <= set(dir(generalized_additive_models))
+        assert all(getattr(generalized_additive_models, name) for name in generalized_additive_models.__all__)
+
+        with pytest.raises(AttributeError, match="no attribute"):
+            generalized_additive_models.NotAName
+
+    @pytest.mark.parametrize(
+        "submodule", ["distributions", "gam", "links", "optimizers", "penalties", "splinetransformer", "terms", "utils"]
+    )
+    def test_that_accessing_submodules_imports_them(self, submodule):
+        # These submodules were imported with the package, and code may use them as attributes
+        code = f"""
+import json
+import generalized_additive_models
+print(json.dumps(generalized_additive_models.{submodule}.__name__))
+"""
+        assert run_python(code) == f"generalized_additive_models.{submodule}"
+
+    def test_that_the_scorer_only_imports_numpy(self):
+        assert imported_modules("from generalized_additive_models.scorer import Scorer") == []
+
+
+if __name__ == "__main__":
+    import pytest
+
+    pytest.main(
+        args=[
+            __file__,
+            "-v",
+            "--capture=sys",
+        ]
+    )
@@ -8,10 +8,22 @@ Created on Sat Nov 25 16:29:23 2023
 
 import numpy as np
 import pytest
+import scipy as sp
 from sklearn.linear_model import PoissonRegressor
 from sklearn.metrics import mean_poisson_deviance
 
-from generalized_additive_models import GAM, Linear
+from generalized_additive_models import GAM, ExpectileGAM, Intercept, Linear, Spline
+from generalized_additive_models.distributions import Poisson
+from generalized_additive_models.links import Log
+from generalized_additive_models.optimizers import (
+    LBFGSB,
+    X_T_W_X_plus_D_T_D,
+    detect_structure,
+    penalty_gram,
+    solve_banded_arrow,
+    solve_bounded,
+)
+from generalized_additive_models.utils import ColumnRemover
 
 
 class TestOptimizationMethodsAgainstSklearn:
@@ -62,5 +74,253 @@ class TestOptimizationMethodsAgainstSklearn:
         assert dev_sklearn / dev_gam < 1 + 1e-7
 
 
+class TestSparseModelMatrix:
+    @pytest.mark.parametrize("seed", list(range(5)))
+    @pytest.mark.parametrize("constraint", [None, "increasing"])
+    @pytest.mark.parametrize("solver", (GAM._parameter_constraints["solver"][0]).options)
+    def test_that_sparse_and_dense_optimizers_produce_equal_results(self, solver, constraint, seed):
+        # Create Poisson problem
+        rng = np.random.default_rng(seed)
+        num_samples = 500
+        X = rng.uniform(-1, 1, size=(num_samples, 2))
+        mu = np.exp(np.sin(2 * X[:, 0]) + X[:, 1])
+        y = rng.poisson(lam=mu)
+
+        terms = Spline(0, num_splines=12) + Spline(1, num_splines=8, constraint=constraint) + Intercept()
+        dense_gam = GAM(terms, link="log", distribution="poisson", solver=solver).fit(X, y)
+        sparse_gam = GAM(terms, link="log", distribution="poisson", solver=solver, sparse=True).fit(X, y)
+
+        # The sparse model matrix is not centered, so the optimizers take
+        # different paths. Compare the objective values at termination.
+        assert np.isclose(dense_gam.results_.iters_loss[-1], sparse_gam.results_.iters_loss[-1], rtol=1e-5)
+        assert np.isclose(dense_gam.results_.edof, sparse_gam.results_.edof, rtol=1e-3)
+
+
+class TestStructuredSolver:
+    @pytest.mark.parametrize("num_border", [0, 1, 3])
+    @pytest.mark.parametrize("seed", list(range(5)))
+    def test_that_banded_arrow_solver_equals_dense_solver(self, seed, num_border):
+        rng = np.random.default_rng(seed)
+        num_samples, num_splines = 200, 25
+
+        # A sparse spline basis followed by dense border columns
+        basis = Spline(0, num_splines=num_splines).fit(rng.uniform(size=(num_samples, 1)))
+        X = sp.sparse.hstack(
+            [basis.transform_sparse(rng.uniform(size=(num_samples, 1))), rng.normal(size=(num_samples, num_border))],
+            format="csr",
+        )
+        S = sp.sparse.eye_array(X.shape[1], format="csr")
+        lhs = (X.T @ X + S).tocsc()
+        rhs = rng.normal(size=X.shape[1])
+
+        structure = detect_structure(X, S)
+        assert structure.name == ("banded" if num_border == 0 else "arrow")
+        assert structure.bandwidth == basis.degree
+        assert len(structure.border) == num_border
+
+        beta = solve_banded_arrow(lhs, rhs, structure)
+        assert np.allclose(beta, np.linalg.solve(lhs.toarray(), rhs))
+
+    @pytest.mark.parametrize("sparse, structure", [(False, "dense"), (True, "arrow")])
+    def test_that_structure_is_reported(self, sparse, structure):
+        rng = np.random.default_rng(42)
+        X = rng.normal(size=(500, 2))
+        y = np.sin(X[:, 0]) + X[:, 1] + rng.normal(size=500) / 10
+
+        gam = GAM(Spline(0, num_splines=50) + Linear(1) + Intercept(), sparse=sparse).fit(X, y)
+        assert gam.results_.structure == structure
+
+
+class TestNormalEquations:
+    @pytest.mark.parametrize("order", ["C", "F", "strided"])
+    @pytest.mark.parametrize("signs", ["positive", "mixed", "zero"])
+    @pytest.mark.parametrize("seed", list(range(3)))
+    def test_that_weighted_gram_matrix_is_computed_for_any_weights_and_layout(self, seed, signs, order):
+        rng = np.random.default_rng(seed)
+        X = rng.normal(size=(100, 14))
+        X = X[:, ::2] if order == "strided" else np.asarray(X[:, :7], order=order)
+        w = {"positive": rng.uniform(0.1, 1, size=100), "mixed": rng.normal(size=100), "zero": np.zeros(100)}[signs]
+        S = penalty_gram(sp.sparse.csr_array(rng.normal(size=(7, 7))))
+
+        expected = np.triu(X.T @ (w[:, None] * X) + S.toarray())
+        assert np.allclose(X_T_W_X_plus_D_T_D(X, w=w, S=S), expected)
+
+        # The buffer may be reused over calls
+        buffer = np.empty_like(X)
+        for _ in range(2):
+            assert np.allclose(X_T_W_X_plus_D_T_D(X, w=w, S=S, buffer=buffer), expected)
+
+
+class TestLeastSquaresSolver:
+    @pytest.mark.parametrize("params", [dict(), dict(sparse=True), dict(discrete=True), dict(chunk_size=100)])
+    @pytest.mark.parametrize("seed", list(range(5)))
+    def test_that_normal_identity_models_are_solved_directly(self, seed, params):
+        rng = np.random.default_rng(seed)
+        num_samples = 500
+        X = rng.uniform(-1, 1, size=(num_samples, 2))
+        y = np.sin(3 * X[:, 0]) + X[:, 1] + rng.normal(size=num_samples) / 10
+        sample_weight = np.exp(rng.standard_normal(size=num_samples))
+
+        terms = Spline(0, num_splines=12) + Linear(1) + Intercept()
+        gam = GAM(terms, **params).fit(X, y, sample_weight=sample_weight)
+
+        # One solve, with no initial estimate and no iterations
+        assert len(gam.results_.iters_coef) == 1
+
+        # The solution equals the solution found by L-BFGS-B
+        gam_lbfgsb = GAM(terms, solver="lbfgsb", tol=1e-12, **params).fit(X, y, sample_weight=sample_weight)
+        assert np.allclose(gam.predict(X), gam_lbfgsb.predict(X), atol=1e-6)
+        assert np.isclose(gam.results_.edof, gam_lbfgsb.results_.edof, rtol=1e-4)
+        assert np.allclose(gam.results_.covariance, gam_lbfgsb.results_.covariance, rtol=1e-3, atol=1e-8)
+
+    @pytest.mark.parametrize("expectile", [0.1, 0.5, 0.9])
+    def test_that_expectile_weights_are_at_a_fixed_point(self, expectile):
+        rng = np.random.default_rng(42)
+        num_samples = 500
+        X = rng.uniform(-1, 1, size=(num_samples, 1))
+        y = np.sin(3 * X[:, 0]) + rng.normal(size=num_samples) / 5
+
+        gam = ExpectileGAM(Spline(0, num_splines=12), expectile=expectile).fit(X, y)
+
+        # Solving with the asymmetric weights at the solution gives the solution
+        mu = gam.predict(X)
+        w = np.where(y > mu, expectile, 1 - expectile)
+        lhs = gam.model_matrix_.T @ (w[:, None] * gam.model_matrix_) + penalty_gram(gam.terms.penalty_matrix())
+        beta = np.linalg.lstsq(lhs, gam.model_matrix_.T @ (w * y), rcond=None)[0]
+        assert np.allclose(gam.model_matrix_ @ beta, mu)
+
+
+class TestIdentifiability:
+    @pytest.mark.parametrize("num_samples", [50, 100_000])
+    @pytest.mark.parametrize("seed", list(range(5)))
+    def test_that_aliased_columns_are_removed(self, seed, num_samples):
+        rng = np.random.default_rng(seed)
+
+        # An intercept, one-hot encoded categories and a duplicated column
+        categories = rng.integers(0, 4, size=num_samples)
+        one_hot = (categories[:, None] == np.arange(4)).astype(float)
+        normal = rng.normal(size=(num_samples, 3))
+        X = np.hstack([np.ones((num_samples, 1)), one_hot, normal, normal[:, [0]]])
+        X = X[:, rng.permutation(X.shape[1])]
+        D = np.zeros((1, X.shape[1]))
+
+        nonzero_coefs = ColumnRemover().fit(X=X, D=D).nonzero_coefs
+        assert nonzero_coefs.sum() == np.linalg.matrix_rank(X) == X.shape[1] - 2
+        assert np.linalg.matrix_rank(X[:, nonzero_coefs]) == nonzero_coefs.sum()
+
+        # Sparse model matrices give the same columns
+        assert np.array_equal(ColumnRemover().fit(X=sp.sparse.csr_array(X), D=D).nonzero_coefs, nonzero_coefs)
+
+    @pytest.mark.parametrize("seed", list(range(10)))
+    def test_that_columns_with_very_different_scales_are_kept(self, seed):
+        rng = np.random.default_rng(seed)
+        num_samples = 10_000
+
+        # Columns at scales from 1e-5 to 1e5, and a duplicated column
+        categories = rng.integers(0, 4, size=num_samples)
+        one_hot = (categories[:, None] == np.arange(4)).astype(float)
+        scaled = rng.normal(size=(num_samples, 4)) * np.array([1e-5, 1e-3, 1e3, 1e5])
+        X = np.hstack([np.ones((num_samples, 1)), one_hot, scaled, scaled[:, [0]]])
+        X = X[:, rng.permutation(X.shape[1])]
+        D = np.zeros((1, X.shape[1]))
+
+        nonzero_coefs = ColumnRemover().fit(X=X, D=D).nonzero_coefs
+        assert nonzero_coefs.sum() == X.shape[1] - 2
+        assert np.linalg.matrix_rank(X[:, nonzero_coefs] / np.linalg.norm(X[:, nonzero_coefs], axis=0)) == 8
+
+    def test_that_a_small_scale_feature_is_fitted(self):
+        rng = np.random.default_rng(42)
+        num_samples = 10_000
+        X = np.vstack([rng.lognormal(10, 1, num_samples), rng.uniform(0, 1e-3, num_samples)]).T
+        y = X[:, 0] / 1e4 + X[:, 1] * 1e3 + rng.normal(scale=0.1, size=num_samples)
+
+        gam = GAM(Linear(0, penalty=0) + Linear(1, penalty=0)).fit(X, y)
+        assert np.isclose(gam.terms[1].coef_[0], 1e3, rtol=0.05)
+
+
+class TestBoundedSolver:
+    @pytest.mark.parametrize("seed", list(range(20)))
+    def test_that_bounded_solver_finds_the_constrained_minimum(self, seed):
+        rng = np.random.default_rng(seed)
+        num_params = 25
+        A = rng.normal(size=(num_params + 5, num_params))
+        lhs, rhs = A.T @ A + np.eye(num_params) / 10, rng.normal(size=num_params) * 5
+        lower = np.where(rng.random(num_params) < 0.5, -rng.random(num_params), -np.inf)
+        upper = np.where(rng.random(num_params) < 0.5, rng.random(num_params), np.inf)
+
+        beta, _ = solve_bounded(lhs, rhs, bounds=(lower, upper))
+        assert np.all((lower <= beta) & (beta <= upper))
+
+        # Minimizing 0.5 * beta.T @ lhs @ beta - rhs.T @ beta equals minimizing
+        # |R @ beta - R^-T @ rhs|^2, where lhs = R.T @ R
+        R = np.linalg.cholesky(lhs).T
+        expected = sp.optimize.lsq_linear(R, sp.linalg.solve_triangular(R.T, rhs, lower=True), bounds=(lower, upper))
+        assert np.allclose(beta, expected.x, atol=1e-6)
+
+        # Warm starting at the solution needs one iteration
+        beta_warm, iterations = solve_bounded(lhs, rhs, bounds=(lower, upper), beta0=beta)
+        assert iterations == 1
+        assert np.allclose(beta_warm, beta)
+
+    @pytest.mark.parametrize("constraint", ["increasing", "convex", "concave"])
+    @pytest.mark.parametrize("seed", list(range(3)))
+    def test_that_constrained_pirls_and_lbfgsb_find_the_same_minimum(self, seed, constraint):
+        rng = np.random.default_rng(seed)
+        X = rng.uniform(-1, 1, size=(500, 2))
+        y = rng.poisson(np.exp(np.tanh(3 * X[:, 0]) + X[:, 1] ** 2))
+
+        terms = Spline(0, num_splines=12, constraint=constraint) + Spline(1, num_splines=8, constraint="convex")
+        gam_pirls = GAM(terms, distribution="poisson", link="log").fit(X, y)
+        gam_lbfgsb = GAM(terms, distribution="poisson", link="log", solver="lbfgsb", tol=1e-10, max_iter=10_000)
+        gam_lbfgsb.fit(X, y)
+
+        assert np.isclose(gam_pirls.results_.iters_loss[-1], gam_lbfgsb.results_.iters_loss[-1], rtol=1e-8)
+
+
+class TestLBFGSB:
+    @pytest.mark.parametrize("sparse", [False, True])
+    def test_that_fused_evaluation_equals_objective_and_gradient(self, sparse):
+        rng = np.random.default_rng(42)
+        X = rng.uniform(-1, 1, size=(200, 5))
+        X = sp.sparse.csr_array(X) if sparse else X
+        D = sp.sparse.csr_array(rng.normal(size=(5, 5)))
+        y = rng.poisson(np.exp(X @ np.linspace(-1, 1, num=5)))
+        sample_weight = rng.uniform(0.5, 2, size=200)
+
+        optimizer = LBFGSB(
+            X=X,
+            D=D,
+            y=y,
+            link=Log(),
+            distribution=Poisson(),
+            bounds=(np.full(5, -np.inf), np.full(5, np.inf)),
+            max_iter=100,
+            tol=1e-4,
+            get_sample_weight=lambda mu=None, y=None: sample_weight,
+            verbose=0,
+        )
+        S, beta = penalty_gram(D), rng.normal(size=5) / 10
+        evaluation = optimizer.evaluate(beta, X=X, S=S)
+
+        objective = optimizer.evaluate_objective(beta, X=X, S=S, y=y, sample_weight=sample_weight)
+        assert np.isclose(evaluation.objective, objective)
+        assert np.allclose(evaluation.gradient, optimizer.gradient(beta, X=X, S=S, y=y, sample_weight=sample_weight))
+
+        # The last evaluation is reused
+        assert optimizer.evaluate(beta.copy(), X=X, S=S) is evaluation
+        assert optimizer.evaluate(beta + 1, X=X, S=S) is not evaluation
+
+    def test_that_logged_objectives_belong_to_the_logged_coefficients(self):
+        rng = np.random.default_rng(42)
+        X = rng.uniform(-1, 1, size=(500, 2))
+        y = rng.poisson(np.exp(np.sin(2 * X[:, 0]) + X[:, 1]))
+
+        gam = GAM(Spline(0) + Linear(1), distribution="poisson", link="log", solver="lbfgsb").fit(X, y)
+        S = penalty_gram(gam.terms.penalty_matrix(sparse=True))
+        for coef, loss in zip(gam.results_.iters_coef, gam.results_.iters_loss):
+            mu = np.exp(gam.model_matrix_ @ coef)
+            assert np.isclose(gam._distribution.deviance(y=y, mu=mu).sum() + coef @ (S @ coef), loss)
+
+
 if __name__ == "__main__":
     pytest.main(args=[__file__, "-v", "--capture=sys"])
@@ -5,6 +5,7 @@ Created on Sun Feb  5 09:18:35 2023
 
 @author: tommy
 """
+
 import itertools
 
 import numpy as np
@@ -15,6 +16,7 @@ from sklearn.datasets import fetch_california_housing
 from sklearn.exceptions import NotFittedError
 
 from generalized_additive_models.gam import GAM
+from generalized_additive_models.splinetransformer import SplineTransformer
 from generalized_additive_models.terms import Categorical, Intercept, Linear, Spline, Tensor, Term, TermList
 
 
@@ -182,6 +184,33 @@ class TestTerms:
         assert np.allclose(predicted_group_means, group_means)
         assert np.allclose(intercept.coef_, 4)  # mean([3, 5]) = 4
 
+    @pytest.mark.parametrize(
+        "params",
+        [
+            {"min_frequency": 9},
+            {"min_frequency": 0.15},
+            {"max_categories": 3},
+            {"min_frequency": 6, "max_categories": 2},
+        ],
+    )
+    @pytest.mark.parametrize("seed", list(range(5)))
+    def test_that_weighted_categories_equal_repeated_categories(self, params, seed):
+        rng = np.random.default_rng(seed)
+        X = rng.choice(np.array(list("abcdef"), dtype=object), size=20).reshape(-1, 1)
+        sample_weight = rng.integers(1, 6, size=20)
+
+        # Infrequent categories are found from the weighted counts
+        categorical = Categorical(0, **params, handle_unknown="infrequent_if_exist")
+        categorical_repeated = clone(categorical).fit(np.repeat(X, sample_weight, axis=0))
+        categorical._fit_basis(X, sample_weight=sample_weight)
+        assert np.array_equal(categorical.transform(X), categorical_repeated.transform(X))
+
+        # Fractional weights are counted, and only an absolute `min_frequency`
+        # depends on the scale of the weights
+        if not isinstance(params.get("min_frequency"), int):
+            categorical._fit_basis(X, sample_weight=sample_weight / 2)
+            assert np.array_equal(categorical.transform(X), categorical_repeated.transform(X))
+
     def test_categorical_regularization_with_high_penalty(self):
         # Group 1 has mean 3, group 2 has mean 5
         df = pd.DataFrame({"group": [1, 1, 1, 1, 1, 2, 2], "value": [2, 3, 4, 2, 4, 4, 6]})
@@ -365,6 +394,116 @@ class TestTermList:
         # But the original changed
         assert term_list[0].penalty == 99
 
+    @pytest.mark.parametrize("extrapolation", ["constant", "linear", "continue", "periodic"])
+    @pytest.mark.parametrize("degree", [0, 1, 2, 3])
+    def test_that_sparse_model_matrix_equals_dense_model_matrix(self, extrapolation, degree):
+        rng = np.random.default_rng(degree)
+        X = rng.normal(size=(99, 3))
+        X[:, 2] = rng.integers(0, 4, size=99)
+
+        spline = Spline(0, degree=degree, extrapolation=extrapolation)
+        terms = spline + Spline(1, by=0) + Linear(1) + Categorical(2) + Intercept()
+        terms.fit(X[:50])
+
+        # Transform data with points beyond the boundaries too
+        X_sparse = terms.transform(X, sparse=True)
+        assert X_sparse.format == "csr"
+        assert X_sparse.nnz < np.prod(X_sparse.shape) / 2
+        assert np.allclose(X_sparse.toarray() - terms._column_offsets(), terms.transform(X))
+
+    @pytest.mark.parametrize("constraint", [None, "increasing", "convex"])
+    def test_that_fit_transform_equals_fit_then_transform(self, constraint):
+        rng = np.random.default_rng(42)
+        X = rng.normal(size=(99, 3))
+        X[:, 2] = rng.integers(0, 4, size=99)
+
+        terms = Spline(0, constraint=constraint) + Spline(1, by=0) + Linear(1) + Categorical(2, by=1) + Intercept()
+        terms = terms + Tensor([Spline(0, num_splines=5), Spline(1, num_splines=5)])
+        terms = terms + Tensor([Spline(1, num_splines=5), Categorical(2)], by=0)
+
+        model_matrix = clone(terms).fit_transform(X)
+        terms = terms.fit(X)
+        assert np.allclose(model_matrix, terms.transform(X))
+        assert np.allclose(terms._lower_bound, clone(terms).fit(X)._lower_bound)
+
+    def test_that_fit_transform_evaluates_the_spline_basis_once(self, monkeypatch):
+        rng = np.random.default_rng(42)
+        X = rng.normal(size=(99, 2))
+
+        num_calls = 0
+        transform = SplineTransformer.transform
+
+        def counting_transform(self, X):
+            nonlocal num_calls
+            num_calls += 1
+            return transform(self, X)
+
+        monkeypatch.setattr(SplineTransformer, "transform", counting_transform)
+
+        # One call per spline, since unconstrained splines need no mirrored basis
+        TermList([Spline(0), Tensor([Spline(0), Spline(1)])]).fit_transform(X)
+        assert num_calls == 3
+
+    @pytest.mark.parametrize("as_dataframe", [False, True])
+    @pytest.mark.parametrize("constraint", [None, "increasing", "convex"])
+    def test_that_compiled_transform_equals_transform(self, constraint, as_dataframe):
+        rng = np.random.default_rng(42)
+        X = rng.normal(size=(99, 3))
+        X[:, 2] = rng.integers(0, 4, size=99)
+        if as_dataframe:
+            X = pd.DataFrame(X, columns=["a", "b", "c"])
+
+        terms = Spline(0, constraint=constraint) + Spline(1, by=0) + Linear(1, by=2) + Categorical(2, by=1)
+        terms = terms + Tensor([Spline(0, num_splines=5), Categorical(2)], by=1) + Intercept()
+        terms = terms.fit(X)
+        compiled_terms = terms.compile(X)
+
+        X_new = X[::-1] if as_dataframe else X[::-1].copy()
+        out = np.empty((99, terms.num_coefficients))
+        assert compiled_terms.transform(X_new, out=out) is out
+        assert np.allclose(out, terms.transform(X_new))
+
+    def test_that_compiled_transform_checks_the_columns(self):
+        X = pd.DataFrame(np.random.default_rng(42).normal(size=(20, 2)), columns=["a", "b"])
+        compiled_terms = (Spline("a") + Linear("b")).fit(X).compile(X)
+
+        assert compiled_terms.matches(X)
+        assert not compiled_terms.matches(X[["b", "a"]])
+        with pytest.raises(ValueError, match="compiled"):
+            compiled_terms.transform(X.values)
+
+    @pytest.mark.parametrize("max_points", [10_000, 500])
+    def test_that_fit_stream_equals_fit(self, max_points):
+        rng = np.random.default_rng(42)
+        num_samples = 2000
+        X = pd.DataFrame(
+            {
+                "a": rng.normal(size=num_samples),
+                "b": rng.uniform(size=num_samples),
+                "c": rng.choice(["x", "y", "z"], size=num_samples),
+                "d": rng.normal(size=num_samples),
+            }
+        )
+        terms = TermList(
+            [
+                Spline("a", knots="quantile"),
+                Spline("b", by="a"),
+                Spline("d", constraint="convex"),
+                Categorical("c", min_frequency=0.34),
+                Tensor([Spline("a", num_splines=5), Categorical("c")], by="b"),
+                Linear("d"),
+                Intercept(),
+            ]
+        )
+        chunks = [X.iloc[start : start + 300] for start in range(0, num_samples, 300)]
+
+        # If there are fewer rows than points in the sketch, the fit is exact
+        terms_streamed = clone(terms).fit_stream(chunks, max_points=max_points)
+        terms.fit(X)
+        atol = 1e-12 if max_points >= num_samples else 0.05
+        assert np.allclose(terms_streamed.transform(X), terms.transform(X), atol=atol)
+        assert np.array_equal(terms_streamed._lower_bound, terms._lower_bound)
+
 
 class TestPenaltyMatrices:
     @pytest.mark.parametrize("num_splines", [5, 10, 15])
@@ -383,6 +522,20 @@ class TestPenaltyMatrices:
         spline = Spline(0, num_splines=num_splines)
         assert spline.num_coefficients == spline.num_splines
 
+    @pytest.mark.parametrize("extrapolation", ["linear", "periodic"])
+    @pytest.mark.parametrize("l2_penalty", [0, 1])
+    def test_that_sparse_penalty_matrix_equals_dense_penalty_matrix(self, extrapolation, l2_penalty):
+        df = pd.DataFrame({"x": np.arange(12), "z": np.arange(12) % 5, "cat": list("abc") * 4})
+        spline = Spline("x", num_splines=6, l2_penalty=l2_penalty, extrapolation=extrapolation)
+        tensor = Tensor([Spline("x", num_splines=4, penalty=2), Categorical("cat"), Spline("z", num_splines=5)])
+        terms = spline + Linear("x", penalty=3) + Categorical("cat") + tensor + Intercept()
+        terms.fit(df)
+
+        for term in list(terms) + [terms]:
+            penalty_matrix = term.penalty_matrix(sparse=True)
+            assert penalty_matrix.format == "csr"
+            assert np.allclose(penalty_matrix.toarray(), term.penalty_matrix())
+
 
 class TestTermParameters:
     def test_that_invalid_parameters_raise_in_linear_term(self):
@@ -532,6 +685,22 @@ class TestSplines:
     def test_spline_transformations_and_penalties(self):
         pass
 
+    @pytest.mark.parametrize("extrapolation", ["constant", "linear", "continue", "periodic"])
+    @pytest.mark.parametrize("degree", [0, 1, 2, 3, 4])
+    @pytest.mark.parametrize("num_splines", [5, 12])
+    def test_that_uniform_knots_basis_equals_generic_basis(self, extrapolation, degree, num_splines, monkeypatch):
+        rng = np.random.default_rng(degree)
+        X = rng.normal(size=(100, 1))
+        X_new = rng.normal(size=(200, 1)) * 2  # Beyond the boundaries too
+
+        spline = Spline(0, degree=degree, num_splines=num_splines, extrapolation=extrapolation).fit(X)
+        assert spline.spline_transformer_._uniform_knots() is not None
+        basis = spline.transform(X_new)
+
+        # Evaluate the basis with the scipy BSplines instead
+        monkeypatch.setattr(SplineTransformer, "_uniform_knots", lambda self: None)
+        assert np.allclose(basis, spline.transform(X_new))
+
 
 class TestTensor:
     def test_that_kronecker_product_is_associative(self):
@@ -547,6 +716,27 @@ class TestTensor:
 
         assert (k(a, k(b, c)) == k(k(a, b), c)).all()
 
+    @pytest.mark.parametrize("by", [None, "by"])
+    @pytest.mark.parametrize("marginals", [("x1", "x2"), ("x1", "cat"), ("cat", "x1", "x2")])
+    def test_that_sparse_tensor_basis_equals_dense_tensor_basis(self, marginals, by):
+        rng = np.random.default_rng(len(marginals))
+        num_samples = 100
+        df = pd.DataFrame(
+            {
+                "x1": rng.normal(size=num_samples),
+                "x2": rng.normal(size=num_samples),
+                "cat": rng.choice(list("abc"), size=num_samples),
+                "by": rng.exponential(size=num_samples),
+            }
+        )
+        terms = {"x1": Spline("x1", num_splines=6), "x2": Spline("x2", num_splines=5), "cat": Categorical("cat")}
+        tensor = Tensor([terms[marginal] for marginal in marginals], by=by).fit(df)
+
+        basis = tensor.transform_sparse(df)
+        assert basis.format == "csr"
+        assert basis.shape == (num_samples, tensor.num_coefficients)
+        assert np.allclose(basis.toarray() - tensor._column_offsets(), tensor.transform(df))
+
     @pytest.mark.skip(reason="Not implemented.")
     def test_tensor_with_linear(self):
         df = pd.DataFrame({"x1": [1, 2, 3, 4, 5], "x2": [1, 1, 2, 2, 2]})
@@ -8,11 +8,12 @@ Created on Wed Feb  8 07:56:33 2023
 
 import logging
 import sys
+import tempfile
 from numbers import Real
 
 import numpy as np
 import scipy as sp
-from sklearn.utils import check_consistent_length, check_scalar
+from sklearn.utils import Bunch, check_consistent_length, check_scalar
 
 MACHINE_EPSILON = np.finfo(float).eps
 EPSILON = np.sqrt(MACHINE_EPSILON)
@@ -35,24 +36,31 @@ class ColumnRemover:
     >>> bounds = (np.array([-1, -2, -3]), np.array([1, 2, 3]))
     >>> X_t, D_t, beta_t, *bounds = remover.transform(X, D, beta, *bounds)
     >>> X_t
-    array([[1., 1.],
-           [1., 1.],
+    array([[1., 0.],
            [1., 0.],
-           [1., 0.]])
+           [1., 1.],
+           [1., 1.]])
     >>> D_t
     array([[0., 0.],
            [0., 0.],
            [0., 0.]])
     >>> bounds[0]
-    array([-1, -2])
+    array([-1, -3])
     >>> remover.insert(initial=np.zeros(3), values=np.array([5, 10]))
-    array([ 5., 10.,  0.])
+    array([ 5.,  0., 10.])
     """
 
     def fit(self, *, X, D):
+        # Imported here, since the optimizers import this module
+        from generalized_additive_models.optimizers import X_T_W_X_plus_D_T_D
+
         assert X.shape[1] == D.shape[1]
 
-        self.nonzero_coefs = identifiable_parameters(np.vstack((X, D)))
+        # Identifiability is determined from X.T @ X + D.T @ D, which costs
+        # one pass over X and no copy of it, for any type of model matrix
+        gram = X_T_W_X_plus_D_T_D(X, D=D)
+        gram = gram.toarray() if sp.sparse.issparse(gram) else gram
+        self.nonzero_coefs = identifiable_parameters(gram)
         self.zero_coefs = ~self.nonzero_coefs
         assert len(self.nonzero_coefs) == X.shape[1]
         return self
@@ -60,7 +68,7 @@ class ColumnRemover:
     def transform(self, *args):
         out = []
         for arg in args:
-            assert isinstance(arg, np.ndarray)
+            assert isinstance(arg, (np.ndarray, DiscretizedModelMatrix, ChunkedModelMatrix)) or sp.sparse.issparse(arg)
             if arg.ndim == 1:
                 out.append(arg[self.nonzero_coefs])
             elif arg.ndim == 2:
@@ -78,15 +86,17 @@ class ColumnRemover:
         return initial
 
 
-def identifiable_parameters(X):
+def identifiable_parameters(gram):
     """Return a boolean mask indicating identifiable parameters.
 
-    Identifiable parameters are the non-zero parameters in a regression model.
+    Identifiable parameters are the non-zero parameters in a regression model
+    with model matrix A, given the Gram matrix A.T @ A. Only the upper part
+    of the Gram matrix is used.
 
     Parameters
     ----------
-    X : np.ndarray
-        A matrix.
+    gram : np.ndarray
+        A square matrix A.T @ A.
 
     Returns
     -------
@@ -98,7 +108,7 @@ def identifiable_parameters(X):
     >>> X = np.array([[1, 0, 1],
     ...               [1, 0, 1],
     ...               [1, 1, 0]])
-    >>> identifiable_parameters(X)
+    >>> identifiable_parameters(X.T @ X)
     array([ True, False,  True])
 
     More columns than rows:
@@ -106,7 +116,7 @@ def identifiable_parameters(X):
     >>> X = np.array([[1, 0, 1, 0],
     ...               [1, 0, 1, 1],
     ...               [1, 1, 0, 1]])
-    >>> identifiable_parameters(X)
+    >>> identifiable_parameters(X.T @ X)
     array([ True, False,  True,  True])
 
     More rows than columns:
@@ -115,35 +125,489 @@ def identifiable_parameters(X):
     ...               [1, 0, 1],
     ...               [1, 0, 1],
     ...               [1, 1, 0]])
-    >>> identifiable_parameters(X)
-    array([ True,  True, False])
+    >>> identifiable_parameters(X.T @ X)
+    array([ True, False,  True])
 
     >>> X = np.array([[1, 1, 0],
     ...               [1, 1, 0],
     ...               [1, 1, 0],
     ...               [1, 0, 1]])
-    >>> identifiable_parameters(X)
+    >>> identifiable_parameters(X.T @ X)
     array([ True, False,  True])
 
     """
 
     # Set non-identifiable coefficients to zero
-    # Compute Q R = A P
+    # The pivoted Cholesky factor R of A.T @ A, with R.T @ R = P.T @ A.T @ A @ P,
+    # is the R in a column-pivoted QR decomposition A P = Q R, with the same
+    # pivoting. The cost is independent of the number of rows in A.
     # https://en.wikipedia.org/wiki/QR_decomposition#Column_pivoting
-    # Using mode="r" was found to be ~25% faster than mode="economic" on a
-    # matrix of size (5000, 200)
-    R, pivot = sp.linalg.qr(X, mode="r", pivoting=True, overwrite_a=True)
+    gram = np.asarray(gram, dtype=float)
+    gram = np.triu(gram) + np.triu(gram, k=1).T
+    num_params = gram.shape[1]
+
+    # A column is aliased when the norm of its residual is small relative to
+    # its own norm. A tolerance relative to the largest column, as in LAPACK's
+    # pivoted Cholesky ?pstrf, removes correct columns that have a small scale.
+    # Rounding errors in the Gram matrix leave residuals of aliased columns at
+    # up to about 1e-6 of their norm, hence the relative tolerance of 2e-6
+    residuals = gram.diagonal().copy()
+    tolerances = (2e-6) ** 2 * np.maximum(residuals, 0.0)
+
+    R = np.zeros((num_params, num_params), dtype=float)
+    identifiable = np.zeros(num_params, dtype=bool)
+    for k in range(num_params):
+        candidates = np.where(identifiable | (residuals <= tolerances), -np.inf, residuals)
+        largest = candidates.max()
+        if largest == -np.inf:
+            break
+
+        # Pivot on the largest residual. Residuals equal up to rounding pick
+        # the last column, so that ties do not depend on rounding errors. The
+        # last two columns of an aliased set tie, and the first one is removed
+        pivot = np.flatnonzero(candidates >= largest * (1 - EPSILON))[-1]
+        R[k] = (gram[pivot] - R[:k, pivot] @ R[:k]) / np.sqrt(residuals[pivot])
+        residuals -= R[k] ** 2
+        identifiable[pivot] = True
 
-    # Inverse pivot mapping
-    pivot_inv = np.zeros_like(pivot)
-    pivot_inv[pivot] = np.arange(len(pivot))
+    return identifiable
 
-    # Find the non-zero coefficients, ie the identifiable parameters
-    sizes = np.zeros(X.shape[1], dtype=float)
-    sizes[: (R.shape[0])] = np.diag(R)
-    identifiable = (np.abs(sizes) > EPSILON)[pivot_inv]
 
-    return identifiable
+def discretize(x, max_bins=256):
+    """Map a column onto at most `max_bins` values.
+
+    Columns with at most `max_bins` unique values are kept as they are.
+    Other numeric columns are cut into `max_bins` bins of equal width, and
+    every value is replaced by the mean of the values in its bin.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        A one dimensional array.
+    max_bins : int, optional
+        The maximal number of unique values. The default is 256.
+
+    Returns
+    -------
+    values : np.ndarray
+        The unique values after discretization.
+    index : np.ndarray
+        Integer indices such that values[index] is the discretized x.
+
+    Examples
+    --------
+    >>> x = np.array([3, 1, 2, 1, 3])
+    >>> values, index = discretize(x)
+    >>> values, index
+    (array([1, 2, 3]), array([2, 0, 1, 0, 2]))
+    >>> x = np.array([0.0, 0.1, 0.9, 1.0, 5.0])
+    >>> values, index = discretize(x, max_bins=2)
+    >>> values
+    array([0.5, 5. ])
+    >>> values[index]
+    array([0.5, 0.5, 0.5, 0.5, 5. ])
+    """
+    values, index = np.unique(x, return_inverse=True)
+    if len(values) <= max_bins or not np.issubdtype(values.dtype, np.number):
+        return values, index.ravel()
+
+    # Equal width bins, where empty bins are removed
+    edges = np.linspace(values[0], values[-1], num=max_bins + 1)
+    bins = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, max_bins - 1)
+    bins, index = np.unique(bins, return_inverse=True)
+    index = index.ravel()
+
+    # The mean value in each bin
+    values = np.bincount(index, weights=x) / np.bincount(index)
+    return values, index
+
+
+class DiscretizedModelMatrix:
+    """A model matrix represented by bases evaluated on discretized data.
+
+    The model matrix is the horizontal stack of blocks, where block t is
+    `bases[t][indices[t]]`. A basis has one row per unique value (or
+    combination of values) of the discretized features used by a term, and
+    `indices[t]` maps each sample to a row. The (num_samples, num_columns)
+    matrix is never formed. Products are computed with index arithmetic,
+    and the Gram matrix from weighted histograms of pairs of indices.
+
+    Examples
+    --------
+    >>> bases = [np.array([[1., 0.], [0., 1.], [0.5, 0.5]]), np.ones((1, 1))]
+    >>> indices = [np.array([0, 2, 1, 1]), np.array([0, 0, 0, 0])]
+    >>> X = DiscretizedModelMatrix(bases, indices)
+    >>> X.shape
+    (4, 3)
+    >>> X.toarray()
+    array([[1. , 0. , 1. ],
+           [0.5, 0.5, 1. ],
+           [0. , 1. , 1. ],
+           [0. , 1. , 1. ]])
+    >>> w = np.array([1., 2., 3., 4.])
+    >>> bool(np.allclose(X.gram(w), X.toarray().T @ np.diag(w) @ X.toarray()))
+    True
+    >>> beta = np.array([1., 2., 3.])
+    >>> X @ beta
+    array([4. , 4.5, 5. , 5. ])
+    >>> X.T @ w
+    array([ 2.,  8., 10.])
+    >>> X[:, np.array([True, False, True])].toarray()
+    array([[1. , 1. ],
+           [0.5, 1. ],
+           [0. , 1. ],
+           [0. , 1. ]])
+    """
+
+    ndim = 2
+
+    def __init__(self, bases, indices):
+        assert len(bases) == len(indices)
+        self.bases = [np.asarray(basis, dtype=float) for basis in bases]
+        self.indices = [np.asarray(index, dtype=np.intp) for index in indices]
+        assert all(len(index) == len(self.indices[0]) for index in self.indices)
+
+        # The columns of the model matrix that each block occupies
+        offsets = np.cumsum([0] + [basis.shape[1] for basis in self.bases])
+        self.slices = [slice(start, stop) for start, stop in zip(offsets[:-1], offsets[1:])]
+        self.shape = (len(self.indices[0]), int(offsets[-1]))
+
+    def __matmul__(self, beta):
+        """Compute X @ beta."""
+        out = np.zeros((self.shape[0],) + beta.shape[1:], dtype=float)
+        for basis, index, columns in zip(self.bases, self.indices, self.slices):
+            out += (basis @ beta[columns])[index]
+        return out
+
+    @property
+    def T(self):
+        return _TransposedDiscretizedModelMatrix(self)
+
+    def __getitem__(self, key):
+        """Select columns with X[:, mask], or dense rows with X[start:stop]."""
+        if isinstance(key, tuple):
+            rows, mask = key
+            assert rows == slice(None), "Only columns can be selected"
+            bases = [basis[:, mask[columns]] for basis, columns in zip(self.bases, self.slices)]
+            return type(self)(bases, self.indices)
+
+        return np.hstack([basis[index[key]] for basis, index in zip(self.bases, self.indices)])
+
+    def toarray(self):
+        """Return the model matrix as a dense array."""
+        return self[:]
+
+    def gram(self, w=None):
+        """Compute X.T @ diag(w) @ X as a dense array."""
+        num_samples, num_columns = self.shape
+        w = np.ones(num_samples, dtype=float) if w is None else w
+
+        G = np.empty((num_columns, num_columns), dtype=float)
+        blocks = list(zip(self.bases, self.indices, self.slices))
+        for s, (basis_s, index_s, columns_s) in enumerate(blocks):
+            # Diagonal block, where the histogram is a diagonal matrix
+            counts = np.bincount(index_s, weights=w, minlength=len(basis_s))
+            G[columns_s, columns_s] = basis_s.T @ (counts[:, None] * basis_s)
+
+            for basis_t, index_t, columns_t in blocks[s + 1 :]:
+                # The weighted 2D histogram of pairs of indices. If the number of
+                # pairs is large compared to the samples, it is stored as sparse.
+                shape = (len(basis_s), len(basis_t))
+                if shape[0] * shape[1] <= num_samples:
+                    hist = np.bincount(index_s * shape[1] + index_t, weights=w, minlength=shape[0] * shape[1])
+                    hist = hist.reshape(shape)
+                else:
+                    hist = sp.sparse.csr_array((w, (index_s, index_t)), shape=shape)
+
+                G[columns_s, columns_t] = basis_s.T @ (hist @ basis_t)
+                G[columns_t, columns_s] = G[columns_s, columns_t].T
+
+        return G
+
+
+class _TransposedDiscretizedModelMatrix:
+    """The transpose of a DiscretizedModelMatrix, used to compute X.T @ v."""
+
+    def __init__(self, X):
+        self.X = X
+        self.shape = X.shape[::-1]
+
+    def __matmul__(self, v):
+        return np.hstack(
+            [
+                basis.T @ np.bincount(index, weights=v, minlength=len(basis))
+                for basis, index in zip(self.X.bases, self.X.indices)
+            ]
+        )
+
+
+class ChunkedModelMatrix:
+    """A model matrix evaluated from the data in chunks of rows.
+
+    The fitted `terms` are evaluated on `chunk_size` rows of `X` at a time,
+    and products and the Gram matrix are accumulated over the chunks. The
+    (num_samples, num_columns) matrix is never formed, and the memory used
+    is O(chunk_size * num_columns). Every product is a pass over the data.
+
+    Examples
+    --------
+    >>> from generalized_additive_models.terms import Intercept, Spline
+    >>> X = np.linspace(0, 1, num=5).reshape(-1, 1)
+    >>> terms = (Spline(0, num_splines=3, degree=1) + Intercept()).fit(X)
+    >>> model_matrix = ChunkedModelMatrix(X, terms, chunk_size=2)
+    >>> model_matrix.shape
+    (5, 4)
+    >>> bool(np.allclose(model_matrix.toarray(), terms.transform(X)))
+    True
+    >>> w = np.arange(5.0)
+    >>> bool(np.allclose(model_matrix.gram(w), terms.transform(X).T @ np.diag(w) @ terms.transform(X)))
+    True
+    >>> model_matrix[:, np.array([True, False, False, True])].shape
+    (5, 2)
+
+    The model matrix can be evaluated once, and stored in a temporary
+    memory-mapped file that the chunks are read from:
+
+    >>> model_matrix = model_matrix.spill()
+    >>> bool(np.allclose(model_matrix @ np.ones(4), terms.transform(X) @ np.ones(4)))
+    True
+    """
+
+    ndim = 2
+
+    def __init__(self, X, terms, chunk_size=65536, columns=None):
+        self.X = X
+        self.terms = terms
+        self.chunk_size = chunk_size
+
+        # A boolean mask of the columns in the model matrix that are kept
+        num_coefficients = terms.num_coefficients
+        self.columns = np.ones(num_coefficients, dtype=bool) if columns is None else columns
+        self.shape = (X.shape[0], int(self.columns.sum()))
+        self._plan = None
+        self._spilled = None  # A memory-mapped model matrix, see `spill()`
+
+    def __getstate__(self):
+        # The compiled plan holds closures, which cannot be pickled. The
+        # spilled model matrix is evaluated again instead of being copied.
+        state = self.__dict__.copy()
+        state["_plan"] = None
+        state["_spilled"] = None
+        return state
+
+    def spill(self, directory=None):
+        """Evaluate the model matrix once, and store it in a temporary
+        memory-mapped file in `directory`. Chunks are then read from the file
+        instead of evaluating the terms in every pass. The file is removed when
+        the model matrix is garbage collected. Returns the instance."""
+        if self._plan is None:
+            self._plan = self.terms.compile(self.X)
+
+        shape = (self.shape[0], len(self.columns))
+        spilled = np.memmap(tempfile.TemporaryFile(dir=directory), dtype=float, mode="w+", shape=shape)
+        for start in range(0, self.shape[0], self.chunk_size):
+            rows = slice(start, min(start + self.chunk_size, self.shape[0]))
+            X_rows = self.X.iloc[rows] if hasattr(self.X, "iloc") else self.X[rows]
+            self._plan.transform(X_rows, out=spilled[rows])
+
+        self._spilled = spilled
+        return self
+
+    def _transform(self, X, out=None):
+        if self._plan is None:
+            self._plan = self.terms.compile(self.X)
+        block = self._plan.transform(X, out=out)
+        return block if self.columns.all() else block[:, self.columns]
+
+    def chunks(self):
+        """Yield (rows, block), where block is the model matrix for a slice of rows."""
+        num_samples = self.shape[0]
+        if self._spilled is not None:
+            for start in range(0, num_samples, self.chunk_size):
+                rows = slice(start, min(start + self.chunk_size, num_samples))
+                block = np.asarray(self._spilled[rows])
+                yield rows, (block if self.columns.all() else block[:, self.columns])
+            return
+
+        buffer = np.empty((min(self.chunk_size, num_samples), len(self.columns)))
+        for start in range(0, num_samples, self.chunk_size):
+            rows = slice(start, min(start + self.chunk_size, num_samples))
+            X_rows = self.X.iloc[rows] if hasattr(self.X, "iloc") else self.X[rows]
+            yield rows, self._transform(X_rows, out=buffer[: rows.stop - rows.start])
+
+    def __matmul__(self, beta):
+        """Compute X @ beta."""
+        out = np.empty((self.shape[0],) + beta.shape[1:], dtype=float)
+        for rows, block in self.chunks():
+            out[rows] = block @ beta
+        return out
+
+    @property
+    def T(self):
+        return _TransposedChunkedModelMatrix(self)
+
+    def __getitem__(self, key):
+        """Select columns with X[:, mask], or dense rows with X[start:stop]."""
+        if isinstance(key, tuple):
+            rows, mask = key
+            assert rows == slice(None), "Only columns can be selected"
+            columns = self.columns.copy()
+            columns[self.columns] = mask
+            selected = type(self)(self.X, self.terms, chunk_size=self.chunk_size, columns=columns)
+            selected._plan, selected._spilled = self._plan, self._spilled
+            return selected
+
+        if self._spilled is not None:
+            return np.asarray(self._spilled[key][:, self.columns])
+        return self._transform(self.X.iloc[key] if hasattr(self.X, "iloc") else self.X[key])
+
+    def toarray(self):
+        """Return the model matrix as a dense array."""
+        return self[:]
+
+    def gram(self, w=None):
+        """Compute X.T @ diag(w) @ X as a dense array."""
+        num_columns = self.shape[1]
+        G = np.zeros((num_columns, num_columns), dtype=float)
+        for rows, block in self.chunks():
+            G += block.T @ (block if w is None else w[rows, None] * block)
+        return G
+
+
+class _TransposedChunkedModelMatrix:
+    """The transpose of a ChunkedModelMatrix, used to compute X.T @ v."""
+
+    def __init__(self, X):
+        self.X = X
+        self.shape = X.shape[::-1]
+
+    def __matmul__(self, v):
+        out = np.zeros((self.shape[0],) + v.shape[1:], dtype=float)
+        for rows, block in self.X.chunks():
+            out += block.T @ v[rows]
+        return out
+
+
+def weighted_percentile(x, q, sample_weight):
+    """Compute the q-th percentiles of weighted data.
+
+    With integer weights, this equals np.percentile() of the data where every
+    value is repeated as many times as its weight.
+
+    Examples
+    --------
+    >>> x = np.array([3., 1., 2.])
+    >>> weighted_percentile(x, [0, 50, 90, 100], sample_weight=np.array([1, 2, 1]))
+    array([1. , 1.5, 2.7, 3. ])
+    >>> np.percentile([1., 1., 2., 3.], [0, 50, 90, 100])
+    array([1. , 1.5, 2.7, 3. ])
+    """
+    order = np.argsort(x)
+    x, cumulative_weights = x[order], np.cumsum(sample_weight[order])
+
+    # The (fractional) position of each percentile in the repeated data
+    positions = np.maximum(cumulative_weights[-1] - 1, 0) * np.asarray(q, dtype=float) / 100
+    lower = np.floor(positions)
+
+    def value_at(position):
+        return x[np.minimum(np.searchsorted(cumulative_weights, position, side="right"), len(x) - 1)]
+
+    lower_values, upper_values = value_at(lower), value_at(lower + 1)
+    return lower_values + (positions - lower) * (upper_values - lower_values)
+
+
+class DataSketch:
+    """A mergeable summary of the rows of a few columns, by weighted points.
+
+    Rows are added as points with unit weight. When there are more than
+    `max_points` points, the numeric `grid` columns are cut into bins of equal
+    weight, and the points in each bin are merged into one point at their
+    weighted mean. Points with different non-numeric values are never merged.
+    The `linear` columns are averaged within the bins. The points with the
+    smallest and largest value in each numeric column are never merged, so
+    the range of every column is exact. Weighted statistics of the points,
+    such as percentiles and means, approximate those of the rows.
+
+    Examples
+    --------
+    >>> rng = np.random.default_rng(42)
+    >>> x, by = rng.normal(size=10_000), rng.normal(size=10_000)
+    >>> sketch = DataSketch(max_points=100)
+    >>> for rows in np.array_split(np.arange(10_000), 10):
+    ...     sketch = sketch.update(grid=[x[rows]], linear=[by[rows]])
+    >>> len(sketch.weights) <= 100 + 4
+    True
+    >>> float(sketch.weights.sum())
+    10000.0
+    >>> bool(sketch.grid[0].min() == x.min() and sketch.grid[0].max() == x.max())
+    True
+    >>> bool(np.isclose(np.average(sketch.linear[0], weights=sketch.weights), by.mean()))
+    True
+    """
+
+    def __init__(self, max_points=4096):
+        self.max_points = max_points
+        self.grid, self.linear, self.weights = None, None, None
+
+    def update(self, grid=(), linear=()):
+        """Add rows, given as lists of 1D arrays. Returns the sketch."""
+        assert len(grid) + len(linear) > 0, "At least one column is required"
+        other = type(self)(max_points=self.max_points)
+        other.grid = [np.asarray(column) for column in grid]
+        other.linear = [np.asarray(column, dtype=float) for column in linear]
+        other.weights = np.ones(len((list(grid) + list(linear))[0]), dtype=float)
+        return self.merge(other)
+
+    def merge(self, other):
+        """Merge another sketch with the same columns into this one. Returns the sketch."""
+        if self.weights is None:
+            self.grid, self.linear, self.weights = other.grid, other.linear, other.weights
+        else:
+            self.grid = [np.concatenate(columns) for columns in zip(self.grid, other.grid)]
+            self.linear = [np.concatenate(columns) for columns in zip(self.linear, other.linear)]
+            self.weights = np.concatenate((self.weights, other.weights))
+
+        if len(self.weights) > self.max_points:
+            self._compress()
+        return self
+
+    def _compress(self):
+        is_numeric = [np.issubdtype(column.dtype, np.number) for column in self.grid]
+        num_bins = max(1, int(self.max_points ** (1 / max(sum(is_numeric), 1))))
+
+        # Bin every grid column. Numeric columns are cut into bins of equal
+        # weight, where equal values are always in the same bin.
+        keys = []
+        for column, numeric in zip(self.grid, is_numeric):
+            values, index = np.unique(column, return_inverse=True)
+            index = index.ravel()
+            if numeric and len(values) > num_bins:
+                value_weights = np.bincount(index, weights=self.weights)
+                ranks = (np.cumsum(value_weights) - value_weights / 2) / value_weights.sum()
+                index = np.minimum((ranks * num_bins).astype(np.intp), num_bins - 1)[index]
+            keys.append(index)
+
+        # The points with extreme values get bins of their own
+        numeric_columns = [column for column, numeric in zip(self.grid, is_numeric) if numeric] + self.linear
+        extremes = [func(column) for column in numeric_columns for func in (np.argmin, np.argmax)]
+        protected = np.zeros(len(self.weights), dtype=np.intp)
+        protected[extremes] = np.arange(1, len(extremes) + 1)
+        keys.append(protected)
+
+        _, first, index = np.unique(np.column_stack(keys), axis=0, return_index=True, return_inverse=True)
+        index = index.ravel()
+        weights = np.bincount(index, weights=self.weights)
+
+        def weighted_mean(column):
+            # Relative to the first point in each bin, so equal values stay exact
+            deviations = self.weights * (column - column[first][index])
+            return column[first] + np.bincount(index, weights=deviations) / weights
+
+        self.grid = [
+            weighted_mean(column) if numeric else column[first] for column, numeric in zip(self.grid, is_numeric)
+        ]
+        self.linear = [weighted_mean(column) for column in self.linear]
+        self.weights = weights
 
 
 def phi_pearson(y, mu, distribution, edof, sample_weight=None):
@@ -227,6 +691,96 @@ def cartesian(arrays):
     return out
 
 
+class LazyBunch(Bunch):
+    """A Bunch where some values are computed when they are first looked up.
+
+    A function registered with `set_lazy()` returns a dict with the values of
+    the given keys. It is called once, when one of the keys is looked up.
+    Iterating over the bunch, copying it or pickling it computes all values,
+    and a copy is a plain Bunch.
+
+    Examples
+    --------
+    >>> def statistics():
+    ...     print("Computing")
+    ...     return {"mean": 2.0, "std": 1.0}
+    >>> bunch = LazyBunch(size=3)
+    >>> bunch.set_lazy(["mean", "std"], statistics)
+    >>> "mean" in bunch
+    True
+    >>> bunch.mean
+    Computing
+    2.0
+    >>> bunch.std
+    1.0
+    >>> sorted(bunch.keys())
+    ['mean', 'size', 'std']
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.__dict__["_lazy"] = {}
+
+    def set_lazy(self, keys, function):
+        """Compute the values of `keys` with `function()` when looked up."""
+        for key in keys:
+            dict.pop(self, key, None)
+            self._lazy[key] = function
+
+    def compute(self):
+        """Compute all values that are not yet computed. Returns the bunch."""
+        while self._lazy:
+            self[next(iter(self._lazy))]
+        return self
+
+    def __missing__(self, key):
+        if key not in self.__dict__.get("_lazy", {}):
+            raise KeyError(key)
+
+        # Every key computed by the function is set, unless it was set since
+        function = self._lazy[key]
+        values = function()
+        for key_computed in [k for (k, f) in self._lazy.items() if f is function]:
+            del self._lazy[key_computed]
+            dict.__setitem__(self, key_computed, values[key_computed])
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self.__dict__.get("_lazy", {}).pop(key, None)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        if self.__dict__.get("_lazy", {}).pop(key, None) is None or key in self:
+            super().__delitem__(key)
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self.__dict__.get("_lazy", {})
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __dir__(self):
+        return list(super().keys()) + list(self._lazy)
+
+    def __iter__(self):
+        return super(LazyBunch, self.compute()).__iter__()
+
+    def __len__(self):
+        return super(LazyBunch, self.compute()).__len__()
+
+    def keys(self):
+        return super(LazyBunch, self.compute()).keys()
+
+    def values(self):
+        return super(LazyBunch, self.compute()).values()
+
+    def items(self):
+        return super(LazyBunch, self.compute()).items()
+
+    def __reduce__(self):
+        return (Bunch, (), None, None, iter(dict.items(self.compute())))
+
+
 def set_logger():
     log = logging.getLogger("gam")
 
@@ -279,6 +833,9 @@ def tensor_product(a, b, reshape=True):
     or
         (n, m_a, m_b) otherwise
 
+    If a or b is sparse and reshape = True, a scipy.sparse.csr_array of
+    shape (n, m_a * m_b) is returned. Row i has nnz(a_i) * nnz(b_i) entries.
+
     Examples
     --------
     >>> import numpy as np
@@ -360,6 +917,17 @@ def tensor_product(a, b, reshape=True):
            [0, 0, 1, 0, 0, 1, 0, 0, 1],
            [0, 0, 1, 0, 0, 1, 0, 0, 1]])
 
+    With sparse matrices, the dense product is never formed:
+
+    >>> A_sparse = sp.sparse.csr_array(np.diag([1, 2, 3]))
+    >>> B = np.arange(9).reshape(3, 3)
+    >>> tensor_product(A_sparse, B).nnz
+    8
+    >>> tensor_product(A_sparse, B).toarray()
+    array([[ 0,  1,  2,  0,  0,  0,  0,  0,  0],
+           [ 0,  0,  0,  6,  8, 10,  0,  0,  0],
+           [ 0,  0,  0,  0,  0,  0, 18, 21, 24]])
+
     """
     assert a.ndim == 2, f"matrix a must be 2-dimensional, but found {a.ndim} dimensions"
     assert b.ndim == 2, f"matrix b must be 2-dimensional, but found {b.nim} dimensions"
@@ -370,11 +938,14 @@ def tensor_product(a, b, reshape=True):
     if na != nb:
         raise ValueError("both arguments must have the same number of samples")
 
+    if reshape and (sp.sparse.issparse(a) or sp.sparse.issparse(b)):
+        return _sparse_tensor_product(a, b)
+
     if sp.sparse.issparse(a):
-        a = a.A
+        a = a.toarray()
 
     if sp.sparse.issparse(b):
-        b = b.A
+        b = b.toarray()
 
     tensor = a[..., :, None] * b[..., None, :]
 
@@ -384,6 +955,30 @@ def tensor_product(a, b, reshape=True):
     return tensor
 
 
+def _sparse_tensor_product(a, b):
+    """Row-wise Kronecker (face-splitting) product of two matrices as CSR."""
+    a, b = sp.sparse.csr_array(a), sp.sparse.csr_array(b)
+    a.sum_duplicates()
+    b.sum_duplicates()
+    num_rows, (_, mb) = a.shape[0], b.shape
+
+    # Each non-zero a_ij is paired with every non-zero in row i of b
+    nnz_a_row, nnz_b_row = np.diff(a.indptr), np.diff(b.indptr)
+    rows_a = np.repeat(np.arange(num_rows), nnz_a_row)
+    repeats = nnz_b_row[rows_a]
+
+    a_idx = np.repeat(np.arange(a.nnz), repeats)
+    group_start = np.repeat(np.cumsum(repeats) - repeats, repeats)
+    b_idx = np.repeat(b.indptr[rows_a], repeats) + np.arange(len(a_idx)) - group_start
+
+    indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(nnz_a_row * nnz_b_row, out=indptr[1:])
+    data = a.data[a_idx] * b.data[b_idx]
+    indices = a.indices[a_idx].astype(np.int64) * mb + b.indices[b_idx]
+
+    return sp.sparse.csr_array((data, indices, indptr), shape=(num_rows, a.shape[1] * mb))
+
+
 if __name__ == "__main__":
     import pytest
 